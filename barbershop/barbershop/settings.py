@@ -46,12 +46,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'booking.middleware.SpamGuardMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.locale.LocaleMiddleware',
+    'booking.middleware.LanguageNegotiationMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'booking.middleware.ShopMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'booking.middleware.AuthThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,13 +83,62 @@ WSGI_APPLICATION = 'barbershop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DJANGO_DB_POOL=True включает пул соединений psycopg 3 для PostgreSQL (см. booking/db_pool.py).
+# Пул создаётся в каждом воркере Gunicorn, поэтому размеры задаются на один воркер.
+DB_POOL = os.environ.get('DJANGO_DB_POOL', 'False') == 'True'
+
 DATABASES = {
     "default": dj_database_url.config(
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600,
+        conn_max_age=0 if DB_POOL else 600,
+        conn_health_checks=True,
     )
 }
 
+# Реплика для чтения (см. booking/db_router.py): на неё уходят только чтения из view,
+# помеченных read_replica, и только пока пользователь недавно ничего не записывал.
+# Локально можно проверить на второй SQLite: DATABASE_REPLICA_URL=sqlite:///db-replica.sqlite3
+# (схему создаёт migrate --database replica, данные между файлами не реплицируются).
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL', '')
+REPLICA_STICKY_SECONDS = int(os.environ.get('DJANGO_REPLICA_STICKY_SECONDS', '15'))
+
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=0 if DB_POOL else 600,
+        conn_health_checks=True,
+    )
+    # В тестах реплика — это та же БД, что и default
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_ROUTERS = ['booking.db_router.ReplicaRouter']
+    MIDDLEWARE.insert(1, 'booking.db_router.ReplicaRoutingMiddleware')
+
+# Профиль SQLite для небольших установок в продакшене: WAL (читатели не блокируют писателя),
+# busy timeout вместо "database is locked" и BEGIN IMMEDIATE для транзакций записи.
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'True') == 'True'
+
+for database in DATABASES.values():
+    if SQLITE_PROFILE and database["ENGINE"] == "django.db.backends.sqlite3":
+        database.setdefault("OPTIONS", {}).update({
+            "transaction_mode": "IMMEDIATE",
+            "timeout": int(os.environ.get('DJANGO_SQLITE_BUSY_TIMEOUT', '20')),
+            "init_command": ";".join([
+                "PRAGMA journal_mode=WAL",
+                "PRAGMA synchronous=NORMAL",
+                "PRAGMA cache_size=-20000",  # ~20 МБ страничного кэша на соединение
+                "PRAGMA mmap_size=134217728",  # 128 МБ
+                "PRAGMA temp_store=MEMORY",
+            ]),
+        })
+
+    if DB_POOL and database["ENGINE"] == "django.db.backends.postgresql":
+        database.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(os.environ.get('DJANGO_DB_POOL_MIN_SIZE', '2')),
+            "max_size": int(os.environ.get('DJANGO_DB_POOL_MAX_SIZE', '4')),
+            "timeout": float(os.environ.get('DJANGO_DB_POOL_TIMEOUT', '10')),
+            "max_idle": float(os.environ.get('DJANGO_DB_POOL_MAX_IDLE', '600')),
+        }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -118,6 +170,10 @@ LANGUAGES = (
   ('en', _('English')),
 )
 
+# False — язык по умолчанию отдаётся по URL без префикса (без редиректа на /ru/),
+# а язык для таких URL выбирается по cookie / Accept-Language.
+PREFIX_DEFAULT_LANGUAGE = os.environ.get('DJANGO_PREFIX_DEFAULT_LANGUAGE', 'False') == 'True'
+
 LOCALE_PATHS = [
   BASE_DIR / 'locale',
 ]
@@ -142,6 +198,27 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = "login"
+
+# Пользователь загружается вместе с профилем и кэшируется (см. booking/auth.py)
+# ModelBackend остаётся для сессий, созданных до ProfileBackend: в них записан его путь.
+# Пароль он не проверяет — ProfileBackend останавливает перебор бэкендов при неудаче.
+AUTHENTICATION_BACKENDS = ['booking.auth.ProfileBackend', 'django.contrib.auth.backends.ModelBackend']
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('DJANGO_AUTH_USER_CACHE_TIMEOUT', '60'))
+
+# Защита от перебора паролей: лимиты неудачных входов и число одновременных хэширований на процесс.
+# Счётчики лежат в LocMemCache, семафор — в памяти процесса, поэтому gunicorn.conf.py запускает
+# один воркер gthread (WEB_CONCURRENCY=1, GUNICORN_THREADS=4): лимиты общие для всех запросов,
+# а AUTH_HASH_CONCURRENCY должен быть меньше числа потоков.
+# Сколько reverse proxy стоит перед Gunicorn и дописывает X-Forwarded-For (nginx/Varnish из
+# edge_cache, балансировщик Render). 0 — клиент подключается напрямую, IP берётся из REMOTE_ADDR.
+# Без этого все лимиты по IP (вход, регистрация, спам-фильтр) считаются по адресу прокси.
+TRUSTED_PROXY_COUNT = int(os.environ.get('DJANGO_TRUSTED_PROXY_COUNT', '0'))
+LOGIN_THROTTLE_WINDOW = int(os.environ.get('DJANGO_LOGIN_THROTTLE_WINDOW', '900'))
+LOGIN_IP_LIMIT = int(os.environ.get('DJANGO_LOGIN_IP_LIMIT', '20'))
+LOGIN_USERNAME_LIMIT = int(os.environ.get('DJANGO_LOGIN_USERNAME_LIMIT', '5'))
+REGISTER_IP_LIMIT = int(os.environ.get('DJANGO_REGISTER_IP_LIMIT', '5'))
+AUTH_HASH_CONCURRENCY = int(os.environ.get('DJANGO_AUTH_HASH_CONCURRENCY', '2'))
+AUTH_HASH_WAIT_SECONDS = float(os.environ.get('DJANGO_AUTH_HASH_WAIT_SECONDS', '0.2'))
 LOGIN_REDIRECT_URL = "dashboar"
 LOGOUT_REDIRECT_URL = "home"
 
@@ -151,3 +228,73 @@ CACHES = {
         "LOCATION": "booking-rate-limit",
     }
 }
+
+# Ранний отсев спама в формах записи (см. booking/spam.py)
+SPAM_GUARD_RATE_LIMIT = int(os.environ.get('DJANGO_SPAM_GUARD_RATE_LIMIT', '20'))
+SPAM_GUARD_WINDOW = int(os.environ.get('DJANGO_SPAM_GUARD_WINDOW', '600'))
+SPAM_FORM_MIN_SECONDS = int(os.environ.get('DJANGO_SPAM_FORM_MIN_SECONDS', '3'))
+SPAM_FORM_MAX_AGE = int(os.environ.get('DJANGO_SPAM_FORM_MAX_AGE', '86400'))
+
+# Барберы, услуги и SiteContent кэшируются на это время (см. booking/reference.py)
+REFERENCE_CACHE_TIMEOUT = int(os.environ.get('DJANGO_REFERENCE_CACHE_TIMEOUT', '60'))
+
+# Прогрев URL resolver, переводов и шаблонов в AppConfig.ready (включается gunicorn.conf.py)
+STARTUP_WARM_UP = os.environ.get('DJANGO_STARTUP_WARM_UP', 'False') == 'True'
+
+# Филиал для запросов с доменом, не привязанным ни к одному филиалу
+DEFAULT_SHOP_SLUG = os.environ.get('DJANGO_DEFAULT_SHOP_SLUG', 'main')
+
+# Скомпилированные графики барберов (см. booking/schedule.py). В своём воркере сбрасываются
+# сразу при изменении графика, в остальных — по истечении этого времени
+SCHEDULE_CACHE_TIMEOUT = int(os.environ.get('DJANGO_SCHEDULE_CACHE_TIMEOUT', '60'))
+
+# Idempotency-Key в booking_api (booking/idempotency.py): сколько секунд хранится ответ
+# и через сколько секунд незавершённую обработку (упавший воркер) можно перехватить
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('DJANGO_IDEMPOTENCY_KEY_TTL', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('DJANGO_IDEMPOTENCY_LOCK_SECONDS', '30'))
+
+# На сколько дней вперёд ищется свободное время (booking/search.py)
+SLOT_SEARCH_DAYS = int(os.environ.get('DJANGO_SLOT_SEARCH_DAYS', '60'))
+
+# Кэширование ответов на reverse proxy (см. booking/edge_cache.py).
+# max-age — для браузера, s-maxage — для прокси, который чистится по Surrogate-Key.
+EDGE_CACHE_MAX_AGE = int(os.environ.get('DJANGO_EDGE_CACHE_MAX_AGE', '0'))
+EDGE_CACHE_S_MAXAGE = int(os.environ.get('DJANGO_EDGE_CACHE_S_MAXAGE', '300'))
+EDGE_CACHE_PURGE_URL = os.environ.get('DJANGO_EDGE_CACHE_PURGE_URL', '')
+EDGE_CACHE_PURGE_TIMEOUT = float(os.environ.get('DJANGO_EDGE_CACHE_PURGE_TIMEOUT', '1'))
+
+# Сколько заявок из листа ожидания уведомлять об одном освободившемся слоте
+WAITLIST_NOTIFY_LIMIT = int(os.environ.get('DJANGO_WAITLIST_NOTIFY_LIMIT', '3'))
+
+# Записи старше стольких дней переносит в архив manage.py archive_bookings
+ARCHIVE_AFTER_DAYS = int(os.environ.get('DJANGO_ARCHIVE_AFTER_DAYS', '90'))
+
+# ICS-фиды записей барберов (см. booking/ics.py): окно фида и время жизни кэша VEVENT
+CALENDAR_FEED_PAST_DAYS = int(os.environ.get('DJANGO_CALENDAR_FEED_PAST_DAYS', '30'))
+CALENDAR_FEED_FUTURE_DAYS = int(os.environ.get('DJANGO_CALENDAR_FEED_FUTURE_DAYS', '180'))
+CALENDAR_FEED_CACHE_TIMEOUT = int(os.environ.get('DJANGO_CALENDAR_FEED_CACHE_TIMEOUT', '86400'))
+
+# Уведомления о бронях: пишутся в outbox вместе с бронью, доставляет manage.py run_outbox
+DEFAULT_FROM_EMAIL = os.environ.get('DJANGO_DEFAULT_FROM_EMAIL', 'barbershop@localhost')
+EMAIL_HOST = os.environ.get('DJANGO_EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('DJANGO_EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('DJANGO_EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('DJANGO_EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('DJANGO_EMAIL_USE_TLS', 'False') == 'True'
+EMAIL_TIMEOUT = 10
+BOOKING_NOTIFY_EMAILS = [e for e in os.environ.get('DJANGO_BOOKING_NOTIFY_EMAILS', '').split(',') if e]
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_STAFF_CHAT_ID = os.environ.get('TELEGRAM_STAFF_CHAT_ID', '')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+OUTBOX_BATCH_SIZE = int(os.environ.get('DJANGO_OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_POLL_INTERVAL = float(os.environ.get('DJANGO_OUTBOX_POLL_INTERVAL', '2'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('DJANGO_OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_HTTP_TIMEOUT = float(os.environ.get('DJANGO_OUTBOX_HTTP_TIMEOUT', '10'))
+
+# Напоминания о визитах (manage.py run_reminders): за сколько часов до визита
+REMINDER_LEADS_MINUTES = [
+    int(float(h) * 60) for h in os.environ.get('DJANGO_REMINDER_LEADS_HOURS', '24,2').split(',') if h
+]
+REMINDER_POLL_INTERVAL = float(os.environ.get('DJANGO_REMINDER_POLL_INTERVAL', '30'))
+# Перекрытие окон опроса изменений: записи из транзакций, закоммиченных позже их updated_at
+REMINDER_POLL_OVERLAP = float(os.environ.get('DJANGO_REMINDER_POLL_OVERLAP', '300'))
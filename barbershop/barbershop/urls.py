@@ -19,14 +19,17 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls.i18n import i18n_patterns
+from booking import views as booking_views
 
 urlpatterns = [
     path('i18n/', include('django.conf.urls.i18n')),
+    path('health/db/', booking_views.db_health, name='db_health'),
 ]
 
 urlpatterns += i18n_patterns(
     path('adminbr/', admin.site.urls),
     path('', include('booking.urls')),
+    prefix_default_language=settings.PREFIX_DEFAULT_LANGUAGE,
 )
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
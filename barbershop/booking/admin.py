@@ -1,14 +1,45 @@
-from django.contrib import admin
+import datetime
+
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.db.models import Case, F, Value, When
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Barber, Service, Booking, SiteContent
+from django.shortcuts import redirect
+from .models import (
+  Barber, Service, Booking, ArchivedBooking, SiteContent, OutboxEvent, WorkingHours, ScheduleException, Shop,
+  WaitlistEntry, DailyRollup, Client,
+)
+from . import clients, fulltext, rollups, transitions
+from .ics import feed_url
+from .db_router import read_replica
 
-@admin.register(Barber)
-class AdminBarber(admin.ModelAdmin):
-  list_display = ('name', 'experience_years', 'is_active', 'photo_preview')
+class WorkingHoursInline(admin.TabularInline):
+  model = WorkingHours
+  extra = 0
+
+@admin.register(Shop)
+class AdminShop(admin.ModelAdmin):
+  list_display = ('name', 'slug', 'domain', 'is_active')
   list_filter = ('is_active',)
+  prepopulated_fields = {'slug': ('name',)}
+
+class DefaultShopMixin:
+  # У модели default филиала пустой (без запросов) — в форму добавления подставляем его здесь
+  def get_changeform_initial_data(self, request):
+    initial = super().get_changeform_initial_data(request)
+    initial.setdefault('shop', Shop.objects.default().pk)
+    return initial
+
+@admin.register(Barber)
+class AdminBarber(DefaultShopMixin, admin.ModelAdmin):
+  inlines = [WorkingHoursInline]
+  list_display = ('name', 'shop', 'experience_years', 'is_active', 'photo_preview')
+  list_filter = ('shop', 'is_active')
   search_fields = ('name',)
-  readonly_fields = ('photo_preview',)
-  fields = ('name', 'photo', 'photo_preview', 'experience_years', 'description', 'is_active')
+  readonly_fields = ('photo_preview', 'calendar_link')
+  fields = ('shop', 'name', 'photo', 'photo_preview', 'experience_years', 'description', 'is_active', 'calendar_link')
 
   def photo_preview(self, obj):
     if obj.photo:
@@ -17,34 +48,147 @@ class AdminBarber(admin.ModelAdmin):
 
   photo_preview.short_description = "Фото"
 
+  def calendar_link(self, obj):
+    if obj.pk:
+      return format_html('<a href="{}">{}</a>', feed_url(obj.pk), "Подписка на календарь (.ics)")
+    return "—"
+
+  calendar_link.short_description = "Календарь"
+
+@admin.register(ScheduleException)
+class AdminScheduleException(DefaultShopMixin, admin.ModelAdmin):
+  list_display = ('date', 'shop', 'barber', 'start_time', 'end_time', 'note')
+  list_filter = ('shop', 'barber')
+  date_hierarchy = 'date'
+
 @admin.register(Service)
-class AdminService(admin.ModelAdmin):
-  list_display = ('icon', 'name', 'price', 'duration_minutes')
+class AdminService(DefaultShopMixin, admin.ModelAdmin):
+  list_display = ('icon', 'name', 'shop', 'price', 'duration_minutes')
+  list_filter = ('shop',)
   search_fields = ('name',)
 
+class ReplicaChangelistMixin:
+  def changelist_view(self, request, extra_context=None):
+    # Просмотр списка с фильтрами и подсчётами — только чтение, его можно отдать реплике
+    if request.method != 'GET':
+      return super().changelist_view(request, extra_context)
+    with read_replica():
+      response = super().changelist_view(request, extra_context)
+      # TemplateResponse выполняет запросы при рендере — рендерим внутри блока
+      if hasattr(response, 'render'):
+        response.render()
+      return response
+
+class ClientSearchMixin:
+  """
+  Поиск без LIKE '%…%': номер телефона ищется префиксом по уникальному индексу Client.phone.
+  С fulltext_search подстрока имени или email ищется по индексу booking/fulltext.py,
+  и результаты упорядочены по релевантности; иначе — по search_fields (префикс имени, точный email).
+  """
+  client_phone_lookup = 'client__phone__startswith'
+  fulltext_search = False
+
+  def _ranked(self, request):
+    term = request.GET.get(SEARCH_VAR, '')
+    return self.fulltext_search and not clients.search_prefix(term) and fulltext.words(term) is not None
+
+  def get_ordering(self, request):
+    if self._ranked(request):
+      # F разрешается при выполнении запроса — аннотацию добавляет get_search_results
+      return (F('search_rank').asc(),)
+    return super().get_ordering(request)
+
+  def get_search_results(self, request, queryset, search_term):
+    prefix = clients.search_prefix(search_term)
+    if prefix:
+      return queryset.filter(**{self.client_phone_lookup: prefix}), False
+    if self._ranked(request):
+      ids = fulltext.search(search_term)
+      if ids is not None:
+        rank = Case(*(When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)), default=Value(len(ids)))
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank), False
+      queryset = queryset.annotate(search_rank=Value(0))
+    return super().get_search_results(request, queryset, search_term)
+
+@admin.register(Client)
+class AdminClient(ClientSearchMixin, admin.ModelAdmin):
+  list_display = ('phone', 'name', 'email', 'created_at')
+  search_fields = ('^name', '=email')
+  ordering = ('-created_at',)
+  client_phone_lookup = 'phone__startswith'
+
+BOOKING_LIST_DISPLAY = (
+  'client_name',
+  'client_phone',
+  'barber',
+  'service',
+  'booking_date',
+  'booking_time',
+  'status',
+  'created_at',
+  'user'
+)
+
 @admin.register(Booking)
-class AdminBooking(admin.ModelAdmin):
-  list_display = (
-    'client_name',
-    'client_phone',
-    'barber',
-    'service',
-    'booking_date',
-    'booking_time',
-    'status',
-    'created_at',
-    'user'
-  )
-  list_filter = ('status', 'barber', 'service', 'booking_date')
-  search_fields = ('client_name', 'client_phone','client_email')
+class AdminBooking(ClientSearchMixin, ReplicaChangelistMixin, admin.ModelAdmin):
+  list_display = BOOKING_LIST_DISPLAY
+  list_filter = ('shop', 'status', 'barber', 'service', 'booking_date')
+  search_fields = ('^client_name', '=client_email')
+  fulltext_search = True
   ordering = ('-booking_time', '-booking_date')
+  actions = ['mark_confirmed', 'mark_completed', 'mark_no_show', 'mark_canceled']
+
+  def _apply_status(self, request, queryset, status):
+    # Один UPDATE на всю выборку, записи с недопустимым переходом пропускаются
+    outcomes = transitions.apply(queryset, status)
+    skipped = sorted(pk for pk, (outcome, _status) in outcomes.items() if outcome == transitions.OUTCOME_SKIPPED)
+    self.message_user(request, f"Обновлено записей: {len(outcomes) - len(skipped)}.", messages.SUCCESS)
+    if skipped:
+      ids = ', '.join(f"#{pk}" for pk in skipped[:20]) + (' …' if len(skipped) > 20 else '')
+      self.message_user(request, f"Пропущено {len(skipped)} (из текущего статуса так перевести нельзя): {ids}", messages.WARNING)
+
+  @admin.action(description="Подтвердить", permissions=['change'])
+  def mark_confirmed(self, request, queryset):
+    self._apply_status(request, queryset, Booking.STATUS_CONFIRMED)
+
+  @admin.action(description="Отметить выполненными", permissions=['change'])
+  def mark_completed(self, request, queryset):
+    self._apply_status(request, queryset, Booking.STATUS_COMPLETED)
+
+  @admin.action(description="Отметить неявку", permissions=['change'])
+  def mark_no_show(self, request, queryset):
+    self._apply_status(request, queryset, Booking.STATUS_NO_SHOW)
+
+  @admin.action(description="Отменить", permissions=['change'])
+  def mark_canceled(self, request, queryset):
+    self._apply_status(request, queryset, Booking.STATUS_CANCELED)
+
+  def change_view(self, request, object_id, form_url='', extra_context=None):
+    # Старая запись могла уехать в архив — открываем её там
+    if str(object_id).isdigit() and not Booking.objects.filter(pk=object_id).exists():
+      if ArchivedBooking.objects.filter(pk=object_id).exists():
+        return redirect('admin:booking_archivedbooking_change', object_id)
+    return super().change_view(request, object_id, form_url, extra_context)
+
+@admin.register(ArchivedBooking)
+class AdminArchivedBooking(ClientSearchMixin, ReplicaChangelistMixin, admin.ModelAdmin):
+  list_display = BOOKING_LIST_DISPLAY + ('archived_at',)
+  list_filter = ('shop', 'status', 'barber', 'service', 'booking_date')
+  search_fields = ('^client_name', '=client_email')
+  ordering = ('-booking_date', '-booking_time')
+
+  def has_add_permission(self, request):
+    return False
+
+  def has_change_permission(self, request, obj=None):
+    return False
 
 
 @admin.register(SiteContent)
-class SiteContentAdmin(admin.ModelAdmin):
-  list_display = ('id', 'about_image_preview')
+class SiteContentAdmin(DefaultShopMixin, admin.ModelAdmin):
+  list_display = ('id', 'shop', 'about_image_preview')
   readonly_fields = ('about_image_preview',)
-  fields = ('about_image', 'about_image_preview')
+  fields = ('shop', 'about_image', 'about_image_preview')
 
   def about_image_preview(self, obj):
     if obj.about_image:
@@ -52,3 +196,68 @@ class SiteContentAdmin(admin.ModelAdmin):
     return "—"
   about_image_preview.short_description = "About image"
   
+
+
+@admin.register(OutboxEvent)
+class AdminOutboxEvent(admin.ModelAdmin):
+  list_display = ('event_type', 'channel', 'booking', 'status', 'attempts', 'created_at', 'sent_at')
+  list_filter = ('status', 'channel', 'event_type')
+  readonly_fields = ('event_type', 'channel', 'booking', 'payload', 'attempts', 'last_error', 'created_at', 'sent_at')
+
+
+@admin.register(WaitlistEntry)
+class AdminWaitlistEntry(admin.ModelAdmin):
+  list_display = ('client_name', 'client_phone', 'barber', 'service', 'date_from', 'date_to', 'time_from', 'time_to', 'status', 'created_at')
+  list_filter = ('shop', 'status', 'barber')
+  search_fields = ('client_name', 'client_phone', 'client_email')
+  readonly_fields = ('notified_at',)
+
+
+def _report_date(value, default):
+  try:
+    return datetime.date.fromisoformat(value)
+  except (TypeError, ValueError):
+    return default
+
+
+@admin.register(DailyRollup)
+class AdminDailyRollup(admin.ModelAdmin):
+  # Вместо списка строк — отчёт, собранный только из дневных сводок (booking/rollups.py)
+  REPORT_DAYS = 30
+  MAX_REPORT_DAYS = 92
+  WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+
+  def has_add_permission(self, request):
+    return False
+
+  def has_change_permission(self, request, obj=None):
+    return False
+
+  def has_delete_permission(self, request, obj=None):
+    return False
+
+  def changelist_view(self, request, extra_context=None):
+    shops = list(Shop.objects.filter(is_active=True))
+    shop = next((s for s in shops if str(s.pk) == request.GET.get('shop')), None) or Shop.objects.default()
+    end = _report_date(request.GET.get('end'), timezone.localdate())
+    start = _report_date(request.GET.get('start'), end - datetime.timedelta(days=self.REPORT_DAYS - 1))
+    start = min(max(start, end - datetime.timedelta(days=self.MAX_REPORT_DAYS - 1)), end)
+
+    with read_replica():
+      report = rollups.report(shop, start, end)
+      context = {
+        **self.admin_site.each_context(request),
+        **(extra_context or {}),
+        'opts': self.model._meta,
+        'title': f"Отчёт: {shop.name}",
+        'shops': shops,
+        'shop': shop,
+        'start': start,
+        'end': end,
+        'report': report,
+        'utilization_rows': list(zip(self.WEEKDAYS, report['utilization'])),
+      }
+      response = TemplateResponse(request, 'admin/booking/dailyrollup/report.html', context)
+      response.render()
+    return response
+
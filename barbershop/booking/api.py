@@ -0,0 +1,271 @@
+"""
+JSON API v1 (/api/v1/) для мобильного приложения и партнёров.
+
+- GET  bookings/                    — записи пользователя, курсор по (booking_date, booking_time, id);
+- POST bookings/                    — создать запись (barber можно не указывать — "любой барбер");
+- POST bookings/<id>/cancel/        — отменить;
+- POST bookings/<id>/reschedule/    — перенести: {"booking_date": ..., "booking_time": ...};
+- POST batch/                       — несколько операций за один запрос: {"operations": [...]}.
+
+Тела запросов и ответов — JSON, ошибки в том же формате, что у booking_api:
+{"ok": false, "errors": {...}}. Списки собираются из values() без создания моделей.
+
+Аутентификация — обычная сессия Django, токенов API нет: клиент входит через /login/
+и хранит cookie (sessionid, csrftoken), а каждый POST передаёт заголовок X-CSRFToken
+(токен отдаёт csrf_token_api). Без входа доступно только создание записи, остальные
+операции отвечают 401. Создание записи без входа (POST bookings/ и op "create" в batch)
+требует form_token из csrf_token_api — та же защита от спама, что у формы на сайте
+(booking/spam.py); после входа form_token не нужен, создание ограничено лимитом на пользователя.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.db.models import BooleanField, F, Q, Value
+from django.http import JsonResponse
+from django.utils.translation import gettext as _
+from django.views.decorators.http import require_POST, require_http_methods
+
+from . import operations, outbox, spam
+from .forms import BookingForm
+from .idempotency import idempotent
+from .models import ArchivedBooking, Booking, OutboxEvent
+from .utils import booking_write, rate_limited
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_OPERATIONS = 20
+
+FIELDS = (
+  'id', 'booking_date', 'booking_time', 'status', 'barber_id', 'service_id',
+  'client_name', 'client_phone', 'client_email', 'message', 'updated_at',
+)
+RELATED_FIELDS = {
+  'barber_name': F('barber__name'),
+  'service_name': F('service__name'),
+  'price': F('service__price'),
+}
+
+
+class ApiError(Exception):
+  def __init__(self, errors, status=400):
+    super().__init__(errors)
+    self.errors = errors
+    self.status = status
+
+
+def _error(message, status=400, field='__all__'):
+  return ApiError({field: [message]}, status)
+
+
+def _serialize(row):
+  row['booking_date'] = row['booking_date'].isoformat()
+  row['booking_time'] = row['booking_time'].strftime('%H:%M')
+  row['price'] = str(row['price'])
+  row['updated_at'] = row['updated_at'].isoformat()
+  return row
+
+
+def _rows(queryset, archived):
+  return queryset.values(*FIELDS, **RELATED_FIELDS, archived=Value(archived, output_field=BooleanField()))
+
+
+def _booking_json(booking_id):
+  return _serialize(_rows(Booking.objects.filter(pk=booking_id), False).get())
+
+
+def _encode_cursor(row):
+  raw = f"{row['booking_date']}|{row['booking_time']}|{row['id']}"
+  return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+  # В batch курсор приходит из JSON и может оказаться числом или списком
+  if not isinstance(cursor, str):
+    raise _error(_("Некорректный курсор."), field='cursor')
+  try:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    date, time, pk = raw.split('|')
+    return datetime.date.fromisoformat(date), datetime.time.fromisoformat(time), int(pk)
+  except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, AttributeError):
+    raise _error(_("Некорректный курсор."), field='cursor')
+
+
+def _after(cursor):
+  date, time, pk = cursor
+  return (
+    Q(booking_date__gt=date)
+    | Q(booking_date=date, booking_time__gt=time)
+    | Q(booking_date=date, booking_time=time, id__gt=pk)
+  )
+
+
+def _json_body(request):
+  try:
+    data = json.loads(request.body or b'{}')
+  except ValueError:
+    raise _error(_("Тело запроса должно быть JSON-объектом."))
+  if not isinstance(data, dict):
+    raise _error(_("Тело запроса должно быть JSON-объектом."))
+  return data
+
+
+def _api_view(view):
+  """View возвращает (status, body); ApiError превращается в ответ с ошибками."""
+  def wrapper(request, *args, **kwargs):
+    try:
+      status, body = view(request, *args, **kwargs)
+    except ApiError as exc:
+      status, body = exc.status, {"ok": False, "errors": exc.errors}
+    return JsonResponse(body, status=status)
+  wrapper.__name__ = view.__name__
+  wrapper.__doc__ = view.__doc__
+  return wrapper
+
+
+def _require_user(request):
+  if not request.user.is_authenticated:
+    raise _error(_("Требуется вход в аккаунт."), status=401)
+
+
+def _user_booking(request, booking_id):
+  _require_user(request)
+  booking = Booking.objects.filter(pk=booking_id, user=request.user).select_related('barber', 'service').first()
+  if booking is None:
+    raise _error(_("Запись не найдена."), status=404)
+  return booking
+
+
+# Операции — (status, body); их же выполняет batch
+
+def _list(request, params):
+  _require_user(request)
+  try:
+    limit = min(max(int(params.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+  except (TypeError, ValueError):
+    raise _error(_("limit должен быть числом."), field='limit')
+
+  # Архивные визиты идут в той же ленте: каждая таблица отдаёт не больше limit + 1 строк
+  # по индексу (user, booking_date, booking_time), дальше — слияние двух отсортированных списков
+  pages = []
+  for model, archived in ((Booking, False), (ArchivedBooking, True)):
+    queryset = model.objects.filter(user=request.user)
+    if params.get('cursor'):
+      queryset = queryset.filter(_after(_decode_cursor(params['cursor'])))
+    pages.extend(_rows(queryset, archived).order_by('booking_date', 'booking_time', 'id')[:limit + 1])
+  pages.sort(key=lambda row: (row['booking_date'], row['booking_time'], row['id']))
+
+  results = pages[:limit]
+  next_cursor = _encode_cursor(results[-1]) if len(pages) > limit else None
+  return 200, {"ok": True, "results": [_serialize(row) for row in results], "next_cursor": next_cursor}
+
+
+def _create(request, data):
+  if rate_limited(request, 'booking_api', limit=3, window=600):
+    raise _error(_("Слишком много попыток. Попробуйте через 10 минут."), status=429)
+  form = BookingForm(data, user=request.user, shop=request.shop)
+  with booking_write(data.get('barber'), shop_id=request.shop.pk):
+    if not form.is_valid():
+      raise ApiError({field: [str(err) for err in errs] for field, errs in form.errors.items()})
+    booking = form.save(commit=False)
+    if request.user.is_authenticated:
+      booking.user = request.user
+    booking.save()
+    outbox.record(OutboxEvent.EVENT_CREATED, booking)
+  return 201, {"ok": True, "booking": _booking_json(booking.pk)}
+
+
+def _cancel(request, booking_id):
+  booking = _user_booking(request, booking_id)
+  try:
+    operations.cancel(booking)
+  except operations.OperationError as exc:
+    raise ApiError({"__all__": [str(exc)], "code": [exc.code]}, status=409)
+  return 200, {"ok": True, "booking": _booking_json(booking.pk)}
+
+
+def _reschedule(request, booking_id, data):
+  booking = _user_booking(request, booking_id)
+  try:
+    selected_date = datetime.date.fromisoformat(str(data.get('booking_date')))
+    selected_time = datetime.datetime.strptime(str(data.get('booking_time')), '%H:%M').time()
+  except ValueError:
+    raise _error(_("Укажите booking_date (YYYY-MM-DD) и booking_time (HH:MM)."))
+  try:
+    operations.reschedule(booking, request.user, selected_date, selected_time)
+  except operations.OperationError as exc:
+    raise ApiError({"__all__": [str(exc)], "code": [exc.code]}, status=409)
+  return 200, {"ok": True, "booking": _booking_json(booking.pk)}
+
+
+# Views
+
+@require_http_methods(['GET', 'POST'])
+@idempotent('api_v1_bookings')
+@_api_view
+def bookings(request):
+  if request.method == 'GET':
+    return _list(request, request.GET)
+  return _create(request, _json_body(request))
+
+
+@require_POST
+@_api_view
+def cancel_booking(request, booking_id):
+  return _cancel(request, booking_id)
+
+
+@require_POST
+@_api_view
+def reschedule_booking(request, booking_id):
+  return _reschedule(request, booking_id, _json_body(request))
+
+
+def _run(request, operation):
+  if not isinstance(operation, dict):
+    raise _error(_("Операция должна быть JSON-объектом."))
+  op = operation.get('op')
+  booking_id = operation.get('id')
+  data = operation.get('data')
+  if data is None:
+    data = {}
+  elif not isinstance(data, dict):
+    raise _error(_("data должно быть JSON-объектом."), field='data')
+  if op == 'list':
+    return _list(request, data)
+  if op == 'create':
+    # POST bookings/ проверяет SpamGuardMiddleware, batch — здесь: form_token и hp_field в data
+    if not request.user.is_authenticated and spam.check_form(data):
+      raise _error(str(spam.REJECTED_MESSAGE))
+    return _create(request, data)
+  if op in ('cancel', 'reschedule') and type(booking_id) is not int:
+    raise _error(_("Укажите id записи."), field='id')
+  if op == 'cancel':
+    return _cancel(request, booking_id)
+  if op == 'reschedule':
+    return _reschedule(request, booking_id, data)
+  raise _error(_("Неизвестная операция: %(op)s.") % {'op': op}, field='op')
+
+
+@require_POST
+@idempotent('api_v1_batch')
+@_api_view
+def batch(request):
+  """
+  Несколько операций за один запрос: {"operations": [{"op": "cancel", "id": 5}, ...]}.
+  Операции выполняются по порядку, каждая в своей транзакции: ошибка одной не отменяет остальные.
+  """
+  operations_list = _json_body(request).get('operations')
+  if not isinstance(operations_list, list) or not 0 < len(operations_list) <= MAX_BATCH_OPERATIONS:
+    raise _error(
+      _("Передайте от 1 до %(max)s операций.") % {'max': MAX_BATCH_OPERATIONS}, field='operations'
+    )
+  results = []
+  for operation in operations_list:
+    try:
+      status, body = _run(request, operation)
+    except ApiError as exc:
+      status, body = exc.status, {"ok": False, "errors": exc.errors}
+    results.append({"status": status, "body": body})
+  return 200, {"ok": True, "results": results}
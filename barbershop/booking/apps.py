@@ -1,5 +1,23 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_triggers(sender, using, **kwargs):
+    # Пересоздание таблицы в SQLite (часть ALTER TABLE) удаляет триггеры FTS — ставим заново
+    from .fulltext import ensure_triggers
+    ensure_triggers(connections[using])
 
 
 class BookingConfig(AppConfig):
     name = 'booking'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(ensure_search_triggers, sender=self)
+
+        if settings.STARTUP_WARM_UP:
+            from .startup import warm_up_process
+            warm_up_process()
@@ -0,0 +1,48 @@
+"""
+Перенос старых записей из Booking в ArchivedBooking небольшими пачками.
+
+Каждая пачка — отдельная короткая транзакция: копия в архив и удаление из Booking
+фиксируются вместе, а блокировки не держатся дольше, чем нужно на одну пачку.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedBooking, Booking, BookingReminder, OutboxEvent
+
+
+def archive_cutoff(days=None):
+  days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+  return timezone.localdate() - datetime.timedelta(days=days)
+
+
+def archive_chunk(cutoff, chunk_size):
+  """
+  Переносит до chunk_size записей с датой раньше cutoff. Возвращает число перенесённых.
+  """
+  with transaction.atomic():
+    ids = list(
+      Booking.objects.filter(booking_date__lt=cutoff)
+      .order_by('booking_date', 'id')
+      .values_list('id', flat=True)[:chunk_size]
+    )
+    if not ids:
+      return 0
+    rows = Booking.objects.filter(id__in=ids).values(*ArchivedBooking.COPIED_FIELDS)
+    ArchivedBooking.objects.bulk_create([ArchivedBooking(**row) for row in rows], ignore_conflicts=True)
+    # Зависимые строки убираем сами: история уведомлений остаётся, напоминания больше не нужны
+    OutboxEvent.objects.filter(booking_id__in=ids).update(booking=None)
+    BookingReminder.objects.filter(booking_id__in=ids).delete()
+    Booking.objects.filter(id__in=ids).delete()
+  return len(ids)
+
+
+def archive_bookings(cutoff, chunk_size=1000):
+  """Переносит всё, что старше cutoff; отдаёт размер каждой пачки."""
+  while True:
+    moved = archive_chunk(cutoff, chunk_size)
+    if not moved:
+      return
+    yield moved
@@ -0,0 +1,182 @@
+"""
+Бэкенд аутентификации: пользователь с профилем из кэша и защита CPU от перебора паролей.
+
+На каждый запрос залогиненного пользователя AuthenticationMiddleware вызывает get_user:
+здесь User и UserProfile читаются одним JOIN и кэшируются на AUTH_USER_CACHE_TIMEOUT секунд,
+так что request.user.profile (форма записи, кабинет) не делает отдельного запроса.
+Хэш пароля в кэш не попадает: поле password у пользователя из кэша отложенное (читается
+из БД при check_password), а для проверки сессии кэшируется её HMAC (get_session_auth_hash).
+Кэш сбрасывается сигналами при сохранении User или UserProfile (ProfileForm.save,
+смена пароля, last_login при входе). С LocMemCache у каждого воркера своя копия, поэтому
+в остальных воркерах изменения видны через AUTH_USER_CACHE_TIMEOUT.
+
+Хэширование пароля (PBKDF2) — самая дорогая операция сайта, поэтому при входе:
+- неудачные попытки считаются по IP клиента (за прокси — см. TRUSTED_PROXY_COUNT) и по паре (логин, IP); после LOGIN_IP_LIMIT / LOGIN_USERNAME_LIMIT
+  за LOGIN_THROTTLE_WINDOW секунд вход отклоняется ещё до хэширования. Счётчик логина привязан
+  к IP, иначе чужие неудачные попытки блокировали бы вход владельцу аккаунта;
+- одновременно хэшируется не больше AUTH_HASH_CONCURRENCY паролей на процесс, остальные
+  ждут свободного места не дольше AUTH_HASH_WAIT_SECONDS.
+В обоих случаях поднимается Throttled, и AuthThrottleMiddleware отвечает 429 — потоки
+остаются свободными для страниц записи. Счётчики и семафор живут в памяти процесса, поэтому
+gunicorn.conf.py запускает один воркер gthread с числом потоков больше AUTH_HASH_CONCURRENCY.
+"""
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.db import router
+
+from .models import UserProfile
+from .utils import get_client_ip
+
+_hash_slots = None
+_hash_slots_lock = threading.Lock()
+
+
+class Throttled(Exception):
+  """Вход или регистрация отклонены без хэширования; retry_after — через сколько секунд повторить."""
+
+  def __init__(self, retry_after):
+    super().__init__(retry_after)
+    self.retry_after = retry_after
+
+
+def _user_key(user_id):
+  return f"auth:user:{user_id}"
+
+
+def invalidate(user_id):
+  cache.delete(_user_key(user_id))
+
+
+def hash_slots():
+  global _hash_slots
+  if _hash_slots is None:
+    with _hash_slots_lock:
+      if _hash_slots is None:
+        _hash_slots = threading.BoundedSemaphore(settings.AUTH_HASH_CONCURRENCY)
+  return _hash_slots
+
+
+@contextmanager
+def hashing_slot():
+  """Место для одного хэширования пароля; если все заняты дольше AUTH_HASH_WAIT_SECONDS — Throttled."""
+  slots = hash_slots()
+  if not slots.acquire(timeout=settings.AUTH_HASH_WAIT_SECONDS):
+    raise Throttled(retry_after=1)
+  try:
+    yield
+  finally:
+    slots.release()
+
+
+def _username_key(request, username):
+  return f"auth:fail:user:{username.lower()}:{get_client_ip(request)}"
+
+
+def _failure_keys(request, username):
+  keys = {f"auth:fail:ip:{get_client_ip(request)}": settings.LOGIN_IP_LIMIT}
+  if username:
+    keys[_username_key(request, username)] = settings.LOGIN_USERNAME_LIMIT
+  return keys
+
+
+def _check_throttle(request, username):
+  keys = _failure_keys(request, username)
+  counts = cache.get_many(keys)
+  if any(counts.get(key, 0) >= limit for key, limit in keys.items()):
+    raise Throttled(retry_after=settings.LOGIN_THROTTLE_WINDOW)
+
+
+def _record_failure(request, username):
+  for key in _failure_keys(request, username):
+    cache.add(key, 0, timeout=settings.LOGIN_THROTTLE_WINDOW)
+    try:
+      cache.incr(key)
+    except ValueError:
+      pass
+
+
+def _values(instance, exclude=()):
+  return {field.attname: getattr(instance, field.attname)
+          for field in instance._meta.concrete_fields if field.attname not in exclude}
+
+
+def _snapshot(user):
+  """Запись кэша: поля пользователя без password, профиль и HMAC сессии."""
+  try:
+    profile = _values(user.profile)
+  except ObjectDoesNotExist:
+    profile = None
+  return {
+    'user': _values(user, exclude={'password'}),
+    'profile': profile,
+    'session_hashes': [user.get_session_auth_hash(), *user.get_session_auth_fallback_hash()],
+  }
+
+
+def _session_hash(user, cached):
+  # После set_password (смена пароля) поле загружено — считаем по нему, как обычно
+  if 'password' in user.get_deferred_fields():
+    return cached
+  return type(user).get_session_auth_hash(user)
+
+
+def _session_fallback_hashes(user, cached):
+  if 'password' in user.get_deferred_fields():
+    return iter(cached)
+  return type(user).get_session_auth_fallback_hash(user)
+
+
+def _from_db(model, values):
+  return model.from_db(router.db_for_read(model), list(values), list(values.values()))
+
+
+def _restore(data):
+  user = _from_db(get_user_model(), data['user'])
+  hashes = data['session_hashes']
+  user.get_session_auth_hash = partial(_session_hash, user, hashes[0])
+  user.get_session_auth_fallback_hash = partial(_session_fallback_hashes, user, hashes[1:])
+  if data['profile'] is None:
+    # Как после select_related без профиля: user.profile — DoesNotExist без запроса
+    UserProfile.user.field.remote_field.set_cached_value(user, None)
+  else:
+    user.profile = _from_db(UserProfile, data['profile'])
+  return user
+
+
+class ProfileBackend(ModelBackend):
+  def authenticate(self, request, username=None, password=None, **kwargs):
+    if username is None:
+      username = kwargs.get(get_user_model().USERNAME_FIELD)
+    if request is not None:
+      _check_throttle(request, username)
+    with hashing_slot():
+      user = super().authenticate(request, username, password, **kwargs)
+    if request is not None and username and password:
+      if user is None:
+        _record_failure(request, username)
+      else:
+        cache.delete(_username_key(request, username))
+    if user is None:
+      # Останавливает перебор бэкендов: ModelBackend в AUTHENTICATION_BACKENDS нужен только
+      # для старых сессий и не должен хэшировать пароль второй раз
+      raise PermissionDenied
+    return user
+
+  def get_user(self, user_id):
+    key = _user_key(user_id)
+    data = cache.get(key)
+    if data is None:
+      user = get_user_model()._default_manager.select_related('profile').filter(pk=user_id).first()
+      if user is None:
+        return None
+      cache.set(key, _snapshot(user), settings.AUTH_USER_CACHE_TIMEOUT)
+    else:
+      user = _restore(data)
+    return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,74 @@
+"""
+Справочник клиентов (Client): заполнение для старых записей и поиск по телефону.
+
+Новые записи привязываются к клиенту в Booking.save. Записи, созданные до появления
+справочника, и архив привязывает manage.py backfill_clients — пачками по id, каждая пачка
+в своей транзакции: клиенты вставляются одним bulk_create, ссылки — одним UPDATE на клиента.
+"""
+import re
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import ArchivedBooking, Booking, Client
+
+# Короче этого число цифр в поиске считаем не телефоном, а частью имени
+MIN_SEARCH_DIGITS = 3
+
+
+def search_prefix(term):
+  """
+  Префикс нормализованного телефона для поиска ("+380 50", "050-12") или None, если
+  в строке не только телефонные символы.
+  """
+  term = term.strip()
+  if not term or not re.fullmatch(r'[\d\s\-\(\)\+]+', term):
+    return None
+  digits = re.sub(r'\D', '', term)
+  if len(digits) < MIN_SEARCH_DIGITS:
+    return None
+  # Как в Client.normalize_phone: местный номер с 0 начинается с кода 38
+  if digits.startswith('0') and not term.startswith('+'):
+    digits = f"38{digits}"
+  return f"+{digits}"
+
+
+def link_chunk(model, after_pk, chunk_size):
+  """
+  Привязывает к клиентам до chunk_size записей model с pk > after_pk и без клиента.
+  Возвращает (последний pk пачки или None, число привязанных).
+  """
+  with transaction.atomic():
+    rows = list(
+      model.objects.filter(pk__gt=after_pk, client__isnull=True)
+      .order_by('pk')
+      .values_list('pk', 'client_phone', 'client_name', 'client_email')[:chunk_size]
+    )
+    if not rows:
+      return None, 0
+
+    by_phone = defaultdict(list)
+    first_seen = {}
+    for pk, raw_phone, name, email in rows:
+      phone = Client.normalize_phone(raw_phone)
+      if phone is None:
+        continue
+      by_phone[phone].append(pk)
+      first_seen.setdefault(phone, Client(phone=phone, name=name, email=email))
+
+    Client.objects.bulk_create(first_seen.values(), ignore_conflicts=True)
+    ids = dict(Client.objects.filter(phone__in=by_phone).values_list('phone', 'pk'))
+    for phone, pks in by_phone.items():
+      model.objects.filter(pk__in=pks).update(client_id=ids[phone])
+  return rows[-1][0], sum(len(pks) for pks in by_phone.values())
+
+
+def backfill(chunk_size=1000):
+  """Привязывает все записи без клиента; отдаёт (модель, число привязанных) после каждой пачки."""
+  for model in (Booking, ArchivedBooking):
+    after_pk = 0
+    while True:
+      after_pk, linked = link_chunk(model, after_pk, chunk_size)
+      if after_pk is None:
+        break
+      yield model, linked
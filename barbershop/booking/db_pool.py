@@ -0,0 +1,48 @@
+from django.db import connections
+
+
+def get_pools():
+  """
+  Пулы psycopg по алиасам DATABASES (есть только у PostgreSQL с OPTIONS['pool']).
+  """
+  pools = {}
+  for alias in connections:
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is not None:
+      pools[alias] = pool
+  return pools
+
+
+def warm_up():
+  """
+  Открывает пулы и ждёт, пока наберётся min_size соединений.
+  Вызывается при старте воркера, чтобы первый запрос не платил за handshake.
+  """
+  for pool in get_pools().values():
+    pool.open(wait=True, timeout=pool.timeout)
+
+
+def pool_stats():
+  stats = {}
+  for alias, pool in get_pools().items():
+    raw = pool.get_stats()
+    # Ещё не открытый пул сообщает min_size как размер, хотя соединений нет
+    size = 0 if pool.closed else raw.get('pool_size', 0)
+    available = raw.get('pool_available', 0)
+    stats[alias] = {
+      'open': not pool.closed,
+      'min_size': raw.get('pool_min', pool.min_size),
+      'max_size': raw.get('pool_max', pool.max_size),
+      'size': size,
+      'in_use': size - available,
+      'available': available,
+      'waiting': raw.get('requests_waiting', 0),
+      'requests': raw.get('requests_num', 0),
+      'wait_ms': raw.get('requests_wait_ms', 0),
+      'timeouts': raw.get('requests_errors', 0),
+      'connections': raw.get('connections_num', 0),
+      'connect_ms': raw.get('connections_ms', 0),
+      'connection_errors': raw.get('connections_errors', 0),
+      'connections_lost': raw.get('connections_lost', 0),
+    }
+  return stats
@@ -0,0 +1,95 @@
+"""
+Чтение с реплики (алиас 'replica', включается DATABASE_REPLICA_URL).
+
+На реплику уходят только чтения внутри read_replica — view и блоков, которые сами ничего
+не пишут (слоты, кабинет, календарь, отчёты). Всё остальное, включая чтения внутри
+транзакции, идёт в default. Записавший пользователь получает cookie и REPLICA_STICKY_SECONDS
+читает только с primary, чтобы не увидеть свой же слот свободным из-за задержки репликации.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+PRIMARY_COOKIE = 'db_primary'
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+  __slots__ = ('pinned', 'replica', 'wrote')
+
+  def __init__(self, pinned):
+    self.pinned = pinned
+    self.replica = False
+    self.wrote = False
+
+
+@contextmanager
+def read_replica():
+  """
+  Разрешает чтение с реплики в view (@read_replica()) или блоке. Вне запроса (команды, бот)
+  ничего не меняет.
+  """
+  state = _state.get()
+  if state is None:
+    yield
+    return
+  previous, state.replica = state.replica, True
+  try:
+    yield
+  finally:
+    state.replica = previous
+
+
+def pin_to_primary():
+  """Остаток запроса и следующие REPLICA_STICKY_SECONDS читать с primary."""
+  state = _state.get()
+  if state is not None:
+    state.wrote = True
+
+
+class ReplicaRouter:
+  def db_for_read(self, model, **hints):
+    state = _state.get()
+    if (
+      state is not None
+      and state.replica
+      and not state.pinned
+      and not state.wrote
+      and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+      return REPLICA_ALIAS
+    return DEFAULT_DB_ALIAS
+
+  def db_for_write(self, model, **hints):
+    # Явно default: иначе объект, прочитанный с реплики, Django сохранил бы туда же
+    pin_to_primary()
+    return DEFAULT_DB_ALIAS
+
+  def allow_relation(self, obj1, obj2, **hints):
+    return True
+
+
+class ReplicaRoutingMiddleware:
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    state = RoutingState(pinned=PRIMARY_COOKIE in request.COOKIES)
+    token = _state.set(state)
+    try:
+      response = self.get_response(request)
+    finally:
+      _state.reset(token)
+    if state.wrote:
+      response.set_cookie(
+        PRIMARY_COOKIE,
+        '1',
+        max_age=settings.REPLICA_STICKY_SECONDS,
+        httponly=True,
+        samesite='Lax',
+      )
+    return response
@@ -0,0 +1,84 @@
+import logging
+import urllib.request
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+logger = logging.getLogger(__name__)
+
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+
+# Ключи с id филиала: изменения в одном филиале не чистят кэш другого
+def home_key(shop_id):
+  return f"home-{shop_id}"
+
+
+def slots_key(shop_id):
+  return f"slots-{shop_id}"
+
+
+def barber_key(barber_id):
+  return f"barber-{barber_id}"
+
+
+def edge_cache(surrogate_keys, anonymous_only=True):
+  """
+  Политика кэширования для reverse proxy (nginx / Varnish) перед Gunicorn.
+
+  GET от анонимного пользователя (или от любого, если `anonymous_only=False`) получает
+  `request.edge_cacheable = True` — шаблон не вставляет в такую страницу CSRF-токен.
+  Если ответ 200 и не ставит cookie, он помечается `public, max-age, s-maxage`
+  и получает Surrogate-Key для адресной очистки, иначе — `private`.
+  """
+  def decorator(view_func):
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+      request.edge_cacheable = (
+        request.method in ('GET', 'HEAD')
+        and not (anonymous_only and request.user.is_authenticated)
+      )
+      response = view_func(request, *args, **kwargs)
+      patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+
+      cacheable = (
+        request.edge_cacheable
+        and response.status_code == 200
+        and not response.cookies
+        # CSRF-cookie добавит middleware уже после view
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+      )
+      if cacheable:
+        patch_cache_control(
+          response,
+          public=True,
+          max_age=settings.EDGE_CACHE_MAX_AGE,
+          s_maxage=settings.EDGE_CACHE_S_MAXAGE,
+        )
+        response[SURROGATE_KEY_HEADER] = ' '.join(surrogate_keys(request))
+      else:
+        patch_cache_control(response, private=True, max_age=0)
+      return response
+    return wrapper
+  return decorator
+
+
+def purge(keys):
+  """
+  Просит прокси выбросить ответы с указанными Surrogate-Key.
+  Запрос уходит после коммита транзакции, ошибки только логируются.
+  """
+  url = settings.EDGE_CACHE_PURGE_URL
+  keys = sorted(set(keys))
+  if not url or not keys:
+    return
+  transaction.on_commit(lambda: _send_purge(url, keys))
+
+
+def _send_purge(url, keys):
+  request = urllib.request.Request(url, method='PURGE', headers={SURROGATE_KEY_HEADER: ' '.join(keys)})
+  try:
+    urllib.request.urlopen(request, timeout=settings.EDGE_CACHE_PURGE_TIMEOUT).close()
+  except (OSError, ValueError) as exc:
+    logger.warning("Edge cache purge failed for %s: %s", keys, exc)
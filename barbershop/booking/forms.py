@@ -1,5 +1,4 @@
 import datetime
-import re
 
 from django import forms
 from django.core.exceptions import ValidationError
@@ -8,7 +7,9 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 
-from .models import Booking, UserProfile
+from .models import Barber, Booking, Client, Service, UserProfile, WaitlistEntry
+from .reference import get_default_shop
+from .search import pick_barber
 from .utils import get_available_slots
 
 
@@ -92,7 +93,7 @@ class BookingForm(forms.ModelForm):
       'client_name': _('Ваше имя *'),
       'client_phone': _('Телефон *'),
       'client_email': 'Email',
-      'barber': _('Выберите барбера *'),
+      'barber': _('Выберите барбера'),
       'service': _('Выберите услугу *'),
       'booking_date': _('Дата *'),
       'booking_time': _('Время сеанса *'),
@@ -132,7 +133,18 @@ class BookingForm(forms.ModelForm):
   def __init__(self, *args, **kwargs):
     available_slots = kwargs.pop('available_slots', None)
     self.user = kwargs.pop('user', None)
+    shop = kwargs.pop('shop', None)
     super().__init__(*args, **kwargs)
+    self.shop = shop or get_default_shop()
+
+    # Барберы и услуги — только своего филиала
+    if shop is not None:
+      self.fields['barber'].queryset = self.fields['barber'].queryset.filter(shop=shop)
+      self.fields['service'].queryset = self.fields['service'].queryset.filter(shop=shop)
+
+    # Пустой выбор — "любой барбер": в clean() подставится первый свободный
+    self.fields['barber'].required = False
+    self.fields['barber'].empty_label = _('Любой барбер')
 
     # Запрещаем выбор прошедшей даты
     self.fields['booking_date'].widget.attrs.setdefault('min', datetime.date.today().isoformat())
@@ -150,7 +162,7 @@ class BookingForm(forms.ModelForm):
 
     # Настраиваем выпадающий список времени
     if available_slots is None:
-      slot_choices = [('', _('Сначала выберите барбера и дату'))]
+      slot_choices = [('', _('Сначала выберите дату'))]
     elif available_slots:
       slot_choices = [('', _('Выберите время'))] + [
         (slot.strftime('%H:%M'), slot.strftime('%H:%M')) for slot in available_slots
@@ -163,15 +175,20 @@ class BookingForm(forms.ModelForm):
   def clean(self):
     cleaned_data = super().clean()
     barber = cleaned_data.get('barber')
+    service = cleaned_data.get('service')
     booking_date = cleaned_data.get('booking_date')
     booking_time = cleaned_data.get('booking_time')
 
-    if not barber or not booking_date or not booking_time:
+    if not booking_date or not booking_time:
         return cleaned_data
 
-    available = get_available_slots(barber, booking_date)
-    if booking_time not in available:
+    if not barber:
+      barber = pick_barber(self.shop, booking_date, booking_time, service)
+      if barber is None:
         raise ValidationError(_("Это время уже занято. Выберите другое."))
+      cleaned_data['barber'] = barber
+    elif booking_time not in get_available_slots(barber, booking_date, service):
+      raise ValidationError(_("Это время уже занято. Выберите другое."))
 
     # Проверяем, что у пользователя нет другой записи в это же время
     if self.user and self.user.is_authenticated:
@@ -191,21 +208,57 @@ class BookingForm(forms.ModelForm):
     return cleaned_data
 
   def clean_client_phone(self):
-    phone = (self.cleaned_data.get('client_phone') or '').strip()
-    digits = re.sub(r'\D', '', phone)
-
-    if len(digits) < 10 or len(digits) > 15:
+    # Тот же формат, что у ключа Client: +380501234567
+    phone = Client.normalize_phone(self.cleaned_data.get('client_phone'))
+    if phone is None:
       raise ValidationError(_("Введите телефон в формате +380501234567 (10–15 цифр)."))
+    return phone
 
-    if len(digits) == 10 and digits.startswith('0'):
-      digits = f"38{digits}"
 
-    formatted = digits if phone.startswith('+') else f"+{digits}"
-    pure_digits = re.sub(r'\D', '', formatted)
-    if len(pure_digits) < 10 or len(pure_digits) > 15:
-      raise ValidationError(_("Введите телефон в формате +380501234567 (10–15 цифр)."))
+class WaitlistForm(forms.ModelForm):
+  # Насколько вперёд можно растянуть одну заявку
+  MAX_RANGE_DAYS = 31
+
+  class Meta:
+    model = WaitlistEntry
+    fields = [
+      'client_name',
+      'client_phone',
+      'client_email',
+      'barber',
+      'service',
+      'date_from',
+      'date_to',
+      'time_from',
+      'time_to',
+    ]
+
+  def __init__(self, *args, **kwargs):
+    shop = kwargs.pop('shop', None)
+    super().__init__(*args, **kwargs)
+    self.fields['barber'].required = False
+    self.fields['barber'].queryset = Barber.objects.filter(is_active=True)
+    if shop is not None:
+      self.fields['barber'].queryset = self.fields['barber'].queryset.filter(shop=shop)
+      self.fields['service'].queryset = Service.objects.filter(shop=shop)
+
+  clean_client_phone = BookingForm.clean_client_phone
 
-    return formatted
+  def clean(self):
+    cleaned_data = super().clean()
+    date_from = cleaned_data.get('date_from')
+    date_to = cleaned_data.get('date_to')
+    time_from = cleaned_data.get('time_from')
+    time_to = cleaned_data.get('time_to')
+
+    if date_from and date_to:
+      if date_from > date_to or date_to < datetime.date.today():
+        raise ValidationError(_("Выберите корректный диапазон дат."))
+      if (date_to - date_from).days > self.MAX_RANGE_DAYS:
+        raise ValidationError(_("Диапазон дат не может быть больше %(days)s дней.") % {'days': self.MAX_RANGE_DAYS})
+    if time_from and time_to and time_from > time_to:
+      raise ValidationError(_("Выберите корректный интервал времени."))
+    return cleaned_data
 
 
 class ProfileForm(forms.ModelForm):
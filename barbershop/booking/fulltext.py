@@ -0,0 +1,109 @@
+"""
+Поиск записей по подстроке имени и email для админки — по индексу, а не сканированием таблицы.
+
+- PostgreSQL: GIN-индекс pg_trgm по выражению client_name || ' ' || client_email;
+  ILIKE '%…%' идёт по индексу, порядок — по similarity().
+- SQLite: теневая таблица FTS5 (tokenize='trigram') с external content на booking_booking,
+  синхронизируется триггерами; порядок — по bm25 (rank).
+
+Схему ставит миграция 0022 (в PostgreSQL — CREATE INDEX CONCURRENTLY). Сигнал post_migrate
+только возвращает триггеры SQLite: часть ALTER TABLE пересоздаёт таблицу, и её триггеры
+пропадают вместе со старой копией.
+Если бэкенд не поддерживается или индекса нет, search() возвращает None — админка
+тогда ищет обычным способом.
+"""
+import logging
+
+from django.db import DatabaseError, connections, router, transaction
+
+from .models import Booking
+
+logger = logging.getLogger(__name__)
+
+# Больше совпадений не ранжируем: поиск в админке смотрят глазами, а не выгружают
+SEARCH_LIMIT = 200
+# Триграммный индекс не помогает для более коротких слов
+MIN_WORD_LENGTH = 3
+
+TABLE = 'booking_booking'
+FTS_TABLE = 'booking_search'
+TRGM_INDEX = 'booking_search_trgm_idx'
+TRGM_EXPRESSION = f"(\"{TABLE}\".\"client_name\" || ' ' || \"{TABLE}\".\"client_email\")"
+
+# Триггеры синхронизации FTS5 — те же, что ставит миграция 0022
+SQLITE_TRIGGERS = [
+  f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+  f"INSERT INTO {FTS_TABLE}(rowid, client_name, client_email) VALUES (new.id, new.client_name, new.client_email); END",
+  f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+  f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, client_name, client_email) "
+  f"VALUES ('delete', old.id, old.client_name, old.client_email); END",
+  f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF client_name, client_email ON {TABLE} BEGIN "
+  f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, client_name, client_email) "
+  f"VALUES ('delete', old.id, old.client_name, old.client_email); "
+  f"INSERT INTO {FTS_TABLE}(rowid, client_name, client_email) VALUES (new.id, new.client_name, new.client_email); END",
+]
+
+
+def ensure_triggers(connection):
+  """
+  Ставит заново триггеры FTS5 (SQLite), если теневая таблица есть. False — ставить нечего.
+  Индекс PostgreSQL создаёт только миграция: здесь его не трогаем.
+  """
+  if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+    return False
+  with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+    for sql in SQLITE_TRIGGERS:
+      cursor.execute(sql)
+  return True
+
+
+def words(term):
+  """Слова запроса или None, если запрос не подходит для триграммного поиска."""
+  parts = term.split()
+  if not parts or any(len(word) < MIN_WORD_LENGTH for word in parts):
+    return None
+  return parts
+
+
+def _like(word):
+  return '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _postgres_sql(parts, limit):
+  where = ' AND '.join(f"{TRGM_EXPRESSION} ILIKE %s" for _word in parts)
+  sql = (
+    f"SELECT \"{TABLE}\".\"id\" FROM \"{TABLE}\" WHERE {where} "
+    f"ORDER BY similarity({TRGM_EXPRESSION}, %s) DESC, \"{TABLE}\".\"id\" DESC LIMIT %s"
+  )
+  return sql, [_like(word) for word in parts] + [' '.join(parts), limit]
+
+
+def _sqlite_sql(parts, limit):
+  # Каждое слово — фраза в кавычках: с trigram это поиск подстроки, слова объединяются через AND
+  query = ' '.join('"' + word.replace('"', '""') + '"' for word in parts)
+  sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank, rowid DESC LIMIT %s"
+  return sql, [query, limit]
+
+
+def search(term, limit=SEARCH_LIMIT):
+  """
+  id записей Booking, где все слова term — подстроки имени или email, от лучших совпадений
+  к худшим. None — индекс недоступен или запрос слишком короткий.
+  """
+  parts = words(term)
+  if parts is None:
+    return None
+  connection = connections[router.db_for_read(Booking)]
+  if connection.vendor == 'postgresql':
+    sql, params = _postgres_sql(parts, limit)
+  elif connection.vendor == 'sqlite':
+    sql, params = _sqlite_sql(parts, limit)
+  else:
+    return None
+  try:
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+      cursor.execute(sql, params)
+      return [row[0] for row in cursor.fetchall()]
+  except DatabaseError:
+    logger.warning("Full-text booking search failed, falling back to LIKE", exc_info=True)
+    return None
@@ -0,0 +1,154 @@
+"""
+ICS-фиды записей барбера (/calendar/<id>.ics) для Google Calendar, Apple Calendar и т.п.
+
+Календарные клиенты опрашивают фид часто, а меняется он редко, поэтому:
+- ETag считается одним агрегатным запросом по индексу (barber, booking_date) — число записей
+  в окне и последний updated_at, — и на неизменённый фид отдаётся 304 без чтения самих записей;
+- каждый VEVENT кэшируется по (id, updated_at): после изменения перерисовываются только
+  изменённые записи, остальные берутся из кэша.
+Календарные клиенты не умеют входить в аккаунт, поэтому доступ — по подписанной ссылке.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .models import Booking
+from .reminders import appointment_at
+
+CRLF = '\r\n'
+UID_DOMAIN = 'barbershop'
+_signer = signing.Signer(salt='booking.calendar')
+
+STATUSES = {
+  Booking.STATUS_PENDING: 'TENTATIVE',
+  Booking.STATUS_CANCELED: 'CANCELLED',
+}
+
+
+def feed_key(barber_id):
+  return _signer.signature(str(barber_id))
+
+
+def check_key(barber_id, key):
+  return constant_time_compare(feed_key(barber_id), key)
+
+
+def feed_url(barber_id):
+  return f"{reverse('calendar_feed', args=[barber_id])}?key={feed_key(barber_id)}"
+
+
+def feed_window():
+  today = timezone.localdate()
+  return (
+    today - datetime.timedelta(days=settings.CALENDAR_FEED_PAST_DAYS),
+    today + datetime.timedelta(days=settings.CALENDAR_FEED_FUTURE_DAYS),
+  )
+
+
+def _bookings(barber):
+  start, end = feed_window()
+  return Booking.objects.filter(barber=barber, booking_date__gte=start, booking_date__lte=end)
+
+
+def feed_etag(barber):
+  """
+  Версия фида: меняется при создании, изменении и удалении записи в окне,
+  при сдвиге окна и при переименовании барбера.
+  """
+  stats = _bookings(barber).aggregate(count=Count('id'), last=Max('updated_at'))
+  last = stats['last'].timestamp() if stats['last'] else 0
+  raw = f"{barber.pk}:{barber.name}:{feed_window()[0]}:{stats['count']}:{last}"
+  return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _escape(value):
+  return (
+    value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+    .replace('\r\n', '\\n').replace('\n', '\\n')
+  )
+
+
+def _fold(line):
+  """RFC 5545: строка не длиннее 75 октетов, продолжение начинается с пробела."""
+  if len(line.encode()) <= 75:
+    return line
+  parts, chunk, size, limit = [], '', 0, 75
+  for char in line:
+    width = len(char.encode())
+    if size + width > limit:
+      parts.append(chunk)
+      chunk, size, limit = '', 0, 74
+    chunk += char
+    size += width
+  parts.append(chunk)
+  return (CRLF + ' ').join(parts)
+
+
+def _utc(value):
+  return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event_cache_key(booking_id, updated_at):
+  return f"ics:event:{booking_id}:{updated_at.timestamp()}"
+
+
+def render_event(booking):
+  start = appointment_at(booking)
+  end = start + datetime.timedelta(minutes=booking.service.duration_minutes)
+  description = '\n'.join(filter(None, [booking.client_phone, booking.client_email, booking.message]))
+  lines = [
+    'BEGIN:VEVENT',
+    f"UID:booking-{booking.pk}@{UID_DOMAIN}",
+    f"DTSTAMP:{_utc(booking.updated_at)}",
+    f"LAST-MODIFIED:{_utc(booking.updated_at)}",
+    f"DTSTART:{_utc(start)}",
+    f"DTEND:{_utc(end)}",
+    f"SUMMARY:{_escape(f'{booking.service.name}: {booking.client_name}')}",
+    f"DESCRIPTION:{_escape(description)}",
+    f"STATUS:{STATUSES.get(booking.status, 'CONFIRMED')}",
+    'END:VEVENT',
+  ]
+  return CRLF.join(_fold(line) for line in lines)
+
+
+def render_feed(barber, etag):
+  """
+  Собирает фид из закэшированных VEVENT; из БД целиком читаются только изменённые записи.
+  """
+  feed_cache_key = f"ics:feed:{barber.pk}:{etag}"
+  body = cache.get(feed_cache_key)
+  if body is not None:
+    return body
+
+  rows = list(_bookings(barber).order_by('booking_date', 'booking_time').values_list('id', 'updated_at'))
+  keys = {pk: _event_cache_key(pk, updated_at) for pk, updated_at in rows}
+  cached = cache.get_many(keys.values())
+  events = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+  missing = [pk for pk in keys if pk not in events]
+  if missing:
+    fresh = {}
+    for booking in Booking.objects.filter(pk__in=missing).select_related('service'):
+      events[booking.pk] = fresh[_event_cache_key(booking.pk, booking.updated_at)] = render_event(booking)
+    cache.set_many(fresh, settings.CALENDAR_FEED_CACHE_TIMEOUT)
+
+  lines = [
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    f"PRODID:-//{UID_DOMAIN}//booking//RU",
+    'CALSCALE:GREGORIAN',
+    'METHOD:PUBLISH',
+    _fold(f"X-WR-CALNAME:{_escape(barber.name)}"),
+    *(events[pk] for pk, _updated_at in rows if pk in events),
+    'END:VCALENDAR',
+  ]
+  body = CRLF.join(lines) + CRLF
+  cache.set(feed_cache_key, body, settings.CALENDAR_FEED_CACHE_TIMEOUT)
+  return body
@@ -0,0 +1,145 @@
+"""
+Заголовок Idempotency-Key для POST API: повтор запроса с тем же ключом (ретрай fetch
+на плохой связи, двойное нажатие) получает сохранённый ответ первого запроса — без
+валидации формы, запросов слотов и повторной брони.
+
+Ключ хранится в БД, чтобы повтор, попавший в другой воркер, тоже его увидел. Запись ключа
+вставляется до обработки запроса: уникальный индекс пропускает только один из
+параллельных дублей, остальные до появления ответа получают 409 с Retry-After.
+"""
+import hashlib
+import json
+import random
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .models import IdempotencyKey
+from .utils import get_client_ip
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# Просроченные ключи удаляются примерно на каждой сотой новой записи
+PURGE_EVERY = 100
+
+
+def _digest(*parts):
+  sha = hashlib.sha256()
+  for part in parts:
+    sha.update(part if isinstance(part, bytes) else str(part).encode())
+    sha.update(b'\0')
+  return sha.hexdigest()
+
+
+# Поля, которые меняются между повторами одной отправки и на результат не влияют
+VOLATILE_FIELDS = {'csrfmiddlewaretoken', 'form_token'}
+
+
+def _payload(request):
+  """
+  Содержимое запроса для отпечатка. Сырое тело не подходит: браузер выбирает новый
+  boundary multipart для каждого fetch с FormData, и повтор выглядел бы другим запросом.
+  """
+  if request.content_type in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+    return json.dumps(sorted((name, values) for name, values in request.POST.lists() if name not in VOLATILE_FIELDS))
+  if request.content_type == 'application/json':
+    try:
+      return json.dumps(json.loads(request.body), sort_keys=True)
+    except ValueError:
+      pass
+  return request.body
+
+
+def _client(request):
+  return f"user:{request.user.id}" if request.user.is_authenticated else f"ip:{get_client_ip(request)}"
+
+
+def _error(message, status):
+  return JsonResponse({"ok": False, "errors": {"__all__": [message]}}, status=status)
+
+
+def _claim(key, fingerprint):
+  """
+  Захватывает ключ для обработки. Возвращает (запись, True), если запрос нужно выполнить,
+  или (запись или None, False), если ключ уже занят.
+  """
+  now = timezone.now()
+  try:
+    with transaction.atomic():
+      record = IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, created_at=now)
+  except IntegrityError:
+    record = IdempotencyKey.objects.filter(key=key).first()
+  else:
+    if random.randrange(PURGE_EVERY) == 0:
+      IdempotencyKey.objects.filter(created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)).delete()
+    return record, True
+
+  if record is None:
+    return None, False
+  expired = record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+  abandoned = record.status_code is None and record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+  if expired or abandoned:
+    # Условие по created_at: из нескольких перехватчиков выиграет один
+    taken = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+      fingerprint=fingerprint, status_code=None, content_type='', body='', created_at=now,
+    )
+    if taken:
+      return record, True
+  return record, False
+
+
+def _replay(record, fingerprint):
+  if record is None or record.status_code is None:
+    response = _error(_("Запрос уже обрабатывается, повторите через секунду."), 409)
+    response['Retry-After'] = '1'
+    return response
+  if record.fingerprint != fingerprint:
+    return _error(_("Этот Idempotency-Key уже использован для другого запроса."), 422)
+  response = HttpResponse(record.body, status=record.status_code, content_type=record.content_type)
+  response[REPLAYED_HEADER] = 'true'
+  return response
+
+
+def idempotent(scope):
+  """
+  Декоратор view: при заголовке Idempotency-Key первый ответ сохраняется на
+  IDEMPOTENCY_KEY_TTL секунд и отдаётся на повторы. Ответы 429 и 5xx не сохраняются —
+  такой запрос можно повторить с тем же ключом.
+  """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+      raw_key = request.headers.get(HEADER, '').strip()
+      if not raw_key:
+        return view(request, *args, **kwargs)
+      if len(raw_key) > MAX_KEY_LENGTH:
+        return _error(_("Слишком длинный Idempotency-Key."), 400)
+
+      key = _digest(scope, _client(request), raw_key)
+      fingerprint = _digest(request.method, request.path, _payload(request))
+      record, owned = _claim(key, fingerprint)
+      if not owned:
+        return _replay(record, fingerprint)
+
+      try:
+        response = view(request, *args, **kwargs)
+      except Exception:
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        raise
+      if response.streaming or response.status_code == 429 or response.status_code >= 500:
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+      else:
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+          status_code=response.status_code,
+          content_type=response.get('Content-Type', ''),
+          body=response.content.decode(response.charset),
+        )
+      return response
+    return wrapper
+  return decorator
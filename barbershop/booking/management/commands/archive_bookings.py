@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.archive import archive_bookings, archive_cutoff
+from booking.models import Booking
+
+
+class Command(BaseCommand):
+  help = (
+    "Переносит записи старше ARCHIVE_AFTER_DAYS дней в архив (ArchivedBooking), "
+    "чтобы горячая таблица Booking содержала только недавние и будущие визиты."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--days', type=int, help="Архивировать записи старше стольких дней.")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=0,
+                        help="Пауза между пачками в секундах, чтобы не мешать рабочей нагрузке.")
+    parser.add_argument('--dry-run', action='store_true', help="Только посчитать записи.")
+
+  def handle(self, *args, **options):
+    cutoff = archive_cutoff(options['days'])
+    if options['dry_run']:
+      count = Booking.objects.filter(booking_date__lt=cutoff).count()
+      self.stdout.write(f"to archive before {cutoff}: {count}")
+      return
+
+    total = 0
+    for moved in archive_bookings(cutoff, options['chunk_size']):
+      total += moved
+      self.stdout.write(f"archived {moved} (total {total})")
+      if options['pause']:
+        time.sleep(options['pause'])
+    self.stdout.write(f"archived before {cutoff}: {total}")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.clients import backfill
+
+
+class Command(BaseCommand):
+  help = (
+    "Создаёт клиентов (Client) по телефонам старых записей и привязывает к ним Booking и ArchivedBooking. "
+    "Записи с телефоном, который не нормализуется, остаются без клиента."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=0,
+                        help="Пауза между пачками в секундах, чтобы не мешать рабочей нагрузке.")
+
+  def handle(self, *args, **options):
+    total = 0
+    for model, linked in backfill(options['chunk_size']):
+      total += linked
+      self.stdout.write(f"{model._meta.model_name}: linked {linked} (total {total})")
+      if options['pause']:
+        time.sleep(options['pause'])
+    self.stdout.write(f"bookings linked to clients: {total}")
@@ -0,0 +1,96 @@
+import datetime
+import multiprocessing
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test import RequestFactory
+
+from booking.models import Barber, Booking, Service
+from booking.utils import generate_slot
+from booking.views import booking_api
+
+
+def _run_worker(args):
+  worker_no, barber_id, service_id, date_str, times = args
+  factory = RequestFactory()
+  results = []
+  for i, time_str in enumerate(times):
+    request = factory.post('/api/book/', {
+      'client_name': f"Bench {worker_no}",
+      'client_phone': '+380501234567',
+      'barber': barber_id,
+      'service': service_id,
+      'booking_date': date_str,
+      'booking_time': time_str,
+    }, REMOTE_ADDR=f"10.{worker_no}.{i // 250}.{i % 250}")
+    request.user = AnonymousUser()
+    started = time.perf_counter()
+    try:
+      outcome = booking_api(request).status_code
+    except OperationalError:
+      outcome = 'locked'
+    results.append((outcome, (time.perf_counter() - started) * 1000))
+  connections.close_all()
+  return results
+
+
+class Command(BaseCommand):
+  help = (
+    "Параллельные записи через booking_api из нескольких процессов (как воркеры Gunicorn): "
+    "все процессы борются за одни и те же слоты. Считает успешные записи, отказы, "
+    "ошибки 'database is locked' и двойные брони."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--days', type=int, default=5, help="Сколько дней слотов разыгрывается.")
+    parser.add_argument('--keep', action='store_true', help="Не удалять созданные данные.")
+
+  def handle(self, *args, **options):
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+      raise CommandError("Нужна файловая БД: процессы не видят общую in-memory SQLite.")
+
+    # Неактивный барбер не показывается на сайте, но форма его принимает
+    barber = Barber.objects.create(name="Bench barber", is_active=False)
+    service = Service.objects.create(icon='⏱', name="Bench service", price=0)
+    first_day = datetime.date.today() + datetime.timedelta(days=365)
+    try:
+      tasks = []
+      for day in range(options['days']):
+        date = first_day + datetime.timedelta(days=day)
+        times = [t.strftime('%H:%M') for t in generate_slot(date)]
+        for worker_no in range(options['workers']):
+          tasks.append((worker_no, barber.id, service.id, date.isoformat(), times))
+
+      connections.close_all()
+      started = time.perf_counter()
+      with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+        results = [r for chunk in pool.map(_run_worker, tasks) for r in chunk]
+      elapsed = time.perf_counter() - started
+
+      self._report(barber, results, elapsed)
+    finally:
+      if not options['keep']:
+        Booking.objects.filter(barber=barber).delete()
+        barber.delete()
+        service.delete()
+
+  def _report(self, barber, results, elapsed):
+    latencies = sorted(ms for _outcome, ms in results)
+    outcomes = {}
+    for outcome, _ms in results:
+      outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    slots_total = Booking.objects.filter(barber=barber).values('booking_date', 'booking_time').distinct().count()
+    bookings_total = Booking.objects.filter(barber=barber).count()
+
+    self.stdout.write(f"engine: {connection.vendor}, requests: {len(results)} in {elapsed:.2f} s "
+                      f"({len(results) / elapsed:.0f} req/s)")
+    self.stdout.write(f"outcomes: {outcomes}")
+    self.stdout.write(f"latency: mean {statistics.mean(latencies):.1f} ms, "
+                      f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms, max {latencies[-1]:.1f} ms")
+    self.stdout.write(f"bookings: {bookings_total}, distinct slots: {slots_total}, "
+                      f"double bookings: {bookings_total - slots_total}")
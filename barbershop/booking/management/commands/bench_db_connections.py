@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+  help = "Сравнивает стоимость нового соединения с PostgreSQL и соединения из пула psycopg."
+
+  def add_arguments(self, parser):
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--database', default='default')
+
+  def handle(self, *args, **options):
+    wrapper = connections[options['database']]
+    if wrapper.vendor != 'postgresql':
+      raise CommandError("Бенчмарк имеет смысл только для PostgreSQL (DATABASE_URL=postgres://...).")
+
+    try:
+      import psycopg
+      from psycopg_pool import ConnectionPool
+    except ImportError as err:
+      raise CommandError("Нужен psycopg[pool].") from err
+
+    params = wrapper.get_connection_params()
+    params['autocommit'] = True
+    iterations = options['iterations']
+
+    def direct():
+      conn = psycopg.connect(**params)
+      conn.execute('SELECT 1')
+      conn.close()
+
+    with ConnectionPool(kwargs=params, min_size=1, max_size=1, open=True) as pool:
+      pool.wait()
+
+      def pooled():
+        with pool.connection() as conn:
+          conn.execute('SELECT 1')
+
+      self._report('direct connect', self._measure(direct, iterations))
+      self._report('pooled', self._measure(pooled, iterations))
+
+  def _measure(self, func, iterations):
+    timings = []
+    for _ in range(iterations):
+      started = time.perf_counter()
+      func()
+      timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+  def _report(self, label, timings):
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    self.stdout.write(
+      f"{label:>15}: mean {statistics.mean(timings):.2f} ms, "
+      f"p95 {p95:.2f} ms, total {sum(timings):.0f} ms ({len(timings)} ops)"
+    )
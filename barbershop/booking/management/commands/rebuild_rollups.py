@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.rollups import rebuild
+
+
+class Command(BaseCommand):
+  help = (
+    "Пересобирает дневные сводки (DailyRollup) по Booking и ArchivedBooking окнами по несколько дней. "
+    "Нужна для первичного заполнения и после удаления записей."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('--since', type=datetime.date.fromisoformat, help="Первая дата (YYYY-MM-DD), по умолчанию — самая ранняя запись.")
+    parser.add_argument('--until', type=datetime.date.fromisoformat, help="Последняя дата (YYYY-MM-DD), по умолчанию — самая поздняя запись.")
+    parser.add_argument('--chunk-days', type=int, default=31)
+
+  def handle(self, *args, **options):
+    if options['chunk_days'] < 1:
+      raise CommandError("--chunk-days must be at least 1")
+    total = 0
+    for start, end, count in rebuild(options['since'], options['until'], options['chunk_days']):
+      total += count
+      self.stdout.write(f"{start}..{end}: {count}")
+    self.stdout.write(f"rollups rebuilt: {total}")
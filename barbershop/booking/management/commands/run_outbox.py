@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from booking.outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+  help = "Отдельный процесс доставки уведомлений из outbox (email / Telegram)."
+
+  def add_arguments(self, parser):
+    parser.add_argument('--once', action='store_true', help="Отправить, что есть в очереди, и выйти.")
+    parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+    parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                        help="Пауза в секундах, когда очередь пуста.")
+
+  def handle(self, *args, **options):
+    while True:
+      sent, failed = dispatch_batch(options['batch_size'])
+      if sent or failed:
+        self.stdout.write(f"sent: {sent}, failed: {failed}")
+      # Полная пачка — в очереди, скорее всего, есть ещё, забираем сразу
+      if sent + failed >= options['batch_size']:
+        continue
+      if options['once']:
+        return
+      connections.close_all()
+      time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from booking.reminders import ReminderScheduler
+
+
+class Command(BaseCommand):
+  help = "Планировщик напоминаний о визитах: ставит их в outbox к нужному времени."
+
+  def add_arguments(self, parser):
+    parser.add_argument('--interval', type=float, default=settings.REMINDER_POLL_INTERVAL,
+                        help="Как часто (в секундах) подхватывать новые и перенесённые записи.")
+
+  def handle(self, *args, **options):
+    scheduler = ReminderScheduler()
+    scheduler.refill()
+    self.stdout.write(f"scheduled reminders: {len(scheduler)}")
+    while True:
+      fired = scheduler.fire_due()
+      if fired:
+        self.stdout.write(f"reminders queued: {fired}")
+      connections.close_all()
+
+      # Спим до ближайшего напоминания, но не дольше интервала опроса изменений
+      sleep_for = options['interval']
+      next_fire_at = scheduler.next_fire_at()
+      if next_fire_at is not None:
+        sleep_for = min(sleep_for, max((next_fire_at - timezone.now()).total_seconds(), 0))
+      time.sleep(sleep_for)
+      scheduler.poll_changes()
@@ -0,0 +1,30 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.models import Shop
+from booking.telegram_bot import BookingBot, BotApi
+
+
+class Command(BaseCommand):
+  help = "Telegram-бот для записи (long polling)."
+
+  def add_arguments(self, parser):
+    parser.add_argument('--poll-timeout', type=int, default=25)
+    parser.add_argument('--concurrency', type=int, default=200,
+                        help="Сколько чатов обрабатывается одновременно.")
+    parser.add_argument('--shop', help="Slug филиала, по умолчанию DEFAULT_SHOP_SLUG.")
+
+  def handle(self, *args, **options):
+    if not settings.TELEGRAM_BOT_TOKEN:
+      raise CommandError("Укажите TELEGRAM_BOT_TOKEN.")
+    if options['shop']:
+      shop = Shop.objects.filter(slug=options['shop']).first()
+      if shop is None:
+        raise CommandError(f"Филиал {options['shop']} не найден.")
+    else:
+      shop = Shop.objects.default()
+    api = BotApi(settings.TELEGRAM_BOT_TOKEN, settings.TELEGRAM_API_URL)
+    bot = BookingBot(api, shop, concurrency=options['concurrency'])
+    asyncio.run(bot.run(poll_timeout=options['poll_timeout']))
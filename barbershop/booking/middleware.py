@@ -0,0 +1,156 @@
+import json
+import logging
+
+from django.conf import settings
+from django.conf.urls.i18n import is_language_prefix_patterns_used
+from django.http import HttpResponse, JsonResponse
+from django.middleware.locale import LocaleMiddleware
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import gettext as _
+
+from . import auth, reference, spam
+from .utils import get_client_ip, rate_limited
+
+logger = logging.getLogger(__name__)
+
+
+class LanguageNegotiationMiddleware(LocaleMiddleware):
+  """
+  Определение языка без редиректа на /<lang>/.
+
+  Если язык по умолчанию не имеет префикса (PREFIX_DEFAULT_LANGUAGE = False),
+  то на URL без префикса язык выбирается по cookie / Accept-Language прямо на месте,
+  а в ответ добавляются Vary и Content-Language, чтобы кэши не путали варианты.
+  При PREFIX_DEFAULT_LANGUAGE = True работает как обычный LocaleMiddleware.
+  """
+
+  def _negotiates(self, request):
+    urlconf = getattr(request, 'urlconf', settings.ROOT_URLCONF)
+    i18n_patterns_used, prefixed_default_language = is_language_prefix_patterns_used(urlconf)
+    if not i18n_patterns_used or prefixed_default_language:
+      return False
+    return not translation.get_language_from_path(request.path_info)
+
+  def process_request(self, request):
+    # URL резолвится с языком по умолчанию (иначе LocalePrefixPattern ждёт префикс),
+    # а выбранный язык включаем уже в process_view.
+    super().process_request(request)
+    request._negotiated_language = None
+    if self._negotiates(request):
+      request._negotiated_language = translation.get_language_from_request(request, check_path=False)
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    language = getattr(request, '_negotiated_language', None)
+    if language:
+      translation.activate(language)
+      request.LANGUAGE_CODE = translation.get_language()
+    return None
+
+  def process_response(self, request, response):
+    response = super().process_response(request, response)
+    if getattr(request, '_negotiated_language', None):
+      patch_vary_headers(response, ('Accept-Language', 'Cookie'))
+    return response
+
+
+class ShopMiddleware:
+  """
+  Определяет филиал по домену запроса: request.shop. Список филиалов берётся из кэша справочников.
+  """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    request.shop = reference.get_shop(request.get_host())
+    return self.get_response(request)
+
+
+class SpamGuardMiddleware:
+  """
+  Отклоняет спам в формах записи до формы и запросов к БД (см. booking/spam.py).
+  Проверяются только POST на view из GUARDED_VIEWS — все публичные точки, где создаётся
+  запись или заявка; JSON-ответ — для AJAX и API, для обычной отправки формы — короткий текст.
+  Тело application/json проверяется так же, как форма (form_token и hp_field — ключи объекта).
+  Создание через POST /api/v1/batch/ проверяет api._run: batch смешивает создание с отменой и переносом.
+
+  Проверка идёт в process_view, когда request.user уже есть: лимит считается по пользователю
+  или по IP, а form_token и honeypot нужны только анонимам — вошедший пользователь
+  (в том числе мобильное приложение по сессии) уже прошёл вход и ограничен лимитами view.
+  Запрос без cookie сессии — заведомо аноним, и пользователь из БД для него не загружается.
+  """
+
+  # имя view -> отвечать JSON
+  GUARDED_VIEWS = {'booking_api': True, 'home': False, 'waitlist_api': True, 'api_v1_bookings': True}
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    return self.get_response(request)
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    if request.method != 'POST':
+      return None
+    as_json = self.GUARDED_VIEWS.get(request.resolver_match.url_name)
+    if as_json is None:
+      return None
+
+    if rate_limited(request, 'spam_guard', limit=settings.SPAM_GUARD_RATE_LIMIT, window=settings.SPAM_GUARD_WINDOW):
+      return _reject(as_json, _("Слишком много попыток. Попробуйте через 10 минут."), 429)
+    if not _anonymous(request):
+      return None
+    # Сначала буферизуем тело: после разбора multipart из потока request.body уже не прочитать,
+    # а он нужен дальше (отпечаток Idempotency-Key)
+    request.body
+    reason = spam.check_form(_submitted(request))
+    if reason:
+      logger.info("spam guard rejected %s: %s", request.path_info, reason)
+      return _reject(as_json, str(spam.REJECTED_MESSAGE), 400)
+    return None
+
+
+def _anonymous(request):
+  if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+    return True
+  return not request.user.is_authenticated
+
+
+def _submitted(request):
+  if request.content_type != 'application/json':
+    return request.POST
+  try:
+    data = json.loads(request.body)
+  except ValueError:
+    return {}
+  return data if isinstance(data, dict) else {}
+
+
+def _reject(as_json, message, status):
+  if as_json:
+    return JsonResponse({"ok": False, "errors": {"__all__": [message]}}, status=status)
+  return HttpResponse(message, status=status, content_type='text/plain; charset=utf-8')
+
+
+class AuthThrottleMiddleware:
+  """
+  Ответ 429 с Retry-After, если вход или регистрация отклонены защитой от перебора
+  (auth.Throttled из бэкенда или из hashing_slot). Работает и для входа в админку.
+  """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    return self.get_response(request)
+
+  def process_exception(self, request, exception):
+    if not isinstance(exception, auth.Throttled):
+      return None
+    logger.warning("auth throttled %s from %s", request.path_info, get_client_ip(request))
+    response = HttpResponse(
+      _("Слишком много попыток входа. Попробуйте позже."), status=429, content_type='text/plain; charset=utf-8'
+    )
+    response['Retry-After'] = str(exception.retry_after)
+    return response
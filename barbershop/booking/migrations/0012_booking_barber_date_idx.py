@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0011_reminders'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['barber', 'booking_date'], name='booking_barber_date_idx'),
+        ),
+    ]
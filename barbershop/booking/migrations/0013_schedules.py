@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0012_booking_barber_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkingHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')], verbose_name='День недели')),
+                ('start_time', models.TimeField(verbose_name='Начало')),
+                ('end_time', models.TimeField(verbose_name='Конец')),
+                ('break_start', models.TimeField(blank=True, null=True, verbose_name='Начало перерыва')),
+                ('break_end', models.TimeField(blank=True, null=True, verbose_name='Конец перерыва')),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='working_hours', to='booking.barber')),
+            ],
+            options={
+                'verbose_name': 'Рабочие часы',
+                'verbose_name_plural': 'Рабочие часы',
+                'ordering': ['weekday', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('start_time', models.TimeField(blank=True, null=True, verbose_name='Начало')),
+                ('end_time', models.TimeField(blank=True, null=True, verbose_name='Конец')),
+                ('note', models.CharField(blank=True, max_length=100, verbose_name='Комментарий')),
+                ('barber', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='booking.barber')),
+            ],
+            options={
+                'verbose_name': 'Исключение в графике',
+                'verbose_name_plural': 'Исключения в графике',
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['barber', 'date'], name='schedule_exception_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,106 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+import booking.models
+
+
+def assign_default_shop(apps, schema_editor):
+    Shop = apps.get_model('booking', 'Shop')
+    shop, _created = Shop.objects.get_or_create(slug=settings.DEFAULT_SHOP_SLUG, defaults={'name': 'Barbershop'})
+    for model_name in ('Barber', 'Service', 'SiteContent', 'ScheduleException'):
+        apps.get_model('booking', model_name).objects.filter(shop__isnull=True).update(shop=shop)
+
+    Barber = apps.get_model('booking', 'Barber')
+    Booking = apps.get_model('booking', 'Booking')
+    Booking.objects.filter(shop__isnull=True).update(
+        shop=Subquery(Barber.objects.filter(pk=OuterRef('barber_id')).values('shop')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0013_schedules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Shop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(unique=True)),
+                ('domain', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Филиал',
+                'verbose_name_plural': 'Филиалы',
+            },
+        ),
+        migrations.AddField(
+            model_name='barber',
+            name='shop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='barbers', to='booking.shop'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='shop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='services', to='booking.shop'),
+        ),
+        migrations.AddField(
+            model_name='sitecontent',
+            name='shop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='site_contents', to='booking.shop'),
+        ),
+        migrations.AddField(
+            model_name='scheduleexception',
+            name='shop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='booking.shop'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='shop',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='booking.shop'),
+        ),
+        migrations.RunPython(assign_default_shop, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='barber',
+            name='shop',
+            field=models.ForeignKey(default=booking.models.default_shop_id, on_delete=django.db.models.deletion.CASCADE, related_name='barbers', to='booking.shop'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='shop',
+            field=models.ForeignKey(default=booking.models.default_shop_id, on_delete=django.db.models.deletion.CASCADE, related_name='services', to='booking.shop'),
+        ),
+        migrations.AlterField(
+            model_name='sitecontent',
+            name='shop',
+            field=models.ForeignKey(default=booking.models.default_shop_id, on_delete=django.db.models.deletion.CASCADE, related_name='site_contents', to='booking.shop'),
+        ),
+        migrations.AlterField(
+            model_name='scheduleexception',
+            name='shop',
+            field=models.ForeignKey(default=booking.models.default_shop_id, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='booking.shop'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='shop',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='booking.shop'),
+        ),
+        migrations.AddIndex(
+            model_name='barber',
+            index=models.Index(fields=['shop', 'is_active'], name='barber_shop_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['shop', 'booking_date', 'booking_time'], name='booking_shop_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduleexception',
+            index=models.Index(fields=['shop', 'date'], name='schedule_shop_date_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0014_shops'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('client_name', models.CharField(max_length=100)),
+                ('client_phone', models.CharField(max_length=20)),
+                ('client_email', models.EmailField(blank=True, max_length=254)),
+                ('booking_date', models.DateField()),
+                ('booking_time', models.TimeField()),
+                ('message', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'В ожидание'), ('confirmed', 'Подтверждено'), ('canceled', 'Отменено'), ('completed', 'Выполнено'), ('no_show', 'Не явился')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='booking.barber')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='booking.service')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='booking.shop')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Архивная запись',
+                'verbose_name_plural': 'Архив записей',
+                'indexes': [models.Index(fields=['user', 'booking_date'], name='archived_user_date_idx'), models.Index(fields=['shop', 'booking_date'], name='archived_shop_date_idx')],
+            },
+        ),
+    ]
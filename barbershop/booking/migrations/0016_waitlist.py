@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0015_archived_booking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='event_type',
+            field=models.CharField(choices=[('created', 'Запись создана'), ('canceled', 'Запись отменена'), ('rescheduled', 'Запись перенесена'), ('reminder', 'Напоминание'), ('slot_freed', 'Освободилось время')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_name', models.CharField(max_length=100)),
+                ('client_phone', models.CharField(max_length=20)),
+                ('client_email', models.EmailField(blank=True, max_length=254)),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('time_from', models.TimeField()),
+                ('time_to', models.TimeField()),
+                ('status', models.CharField(choices=[('active', 'Ожидает'), ('notified', 'Уведомлён'), ('canceled', 'Отменено')], default='active', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('barber', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='booking.barber')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='booking.service')),
+                ('shop', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='booking.shop')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Лист ожидания',
+                'verbose_name_plural': 'Лист ожидания',
+                'indexes': [models.Index(condition=models.Q(('status', 'active')), fields=['shop', 'date_to', 'date_from'], name='waitlist_active_idx')],
+            },
+        ),
+    ]
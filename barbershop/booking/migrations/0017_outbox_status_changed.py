@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0016_waitlist'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='event_type',
+            field=models.CharField(choices=[('created', 'Запись создана'), ('canceled', 'Запись отменена'), ('rescheduled', 'Запись перенесена'), ('reminder', 'Напоминание'), ('slot_freed', 'Освободилось время'), ('status_changed', 'Статус записи изменён')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0017_outbox_status_changed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('canceled', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('booked_minutes', models.PositiveIntegerField(default=0)),
+                ('booked_mask', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='booking.barber')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='booking.service')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='booking.shop')),
+            ],
+            options={
+                'verbose_name': 'Отчёт',
+                'verbose_name_plural': 'Отчёты',
+                'indexes': [models.Index(fields=['shop', 'date'], name='rollup_shop_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'barber', 'service'), name='rollup_day_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0020_booking_user_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Client',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(max_length=20, unique=True, verbose_name='Телефон')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='Имя')),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Клиент',
+                'verbose_name_plural': 'Клиенты',
+                'indexes': [models.Index(fields=['name'], name='client_name_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_bookings', to='booking.client'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='client',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='booking.client'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+# SQL зафиксирован здесь, а не импортируется из booking/fulltext.py: миграция не должна
+# меняться вместе с кодом приложения
+TABLE = 'booking_booking'
+FTS_TABLE = 'booking_search'
+TRGM_INDEX = 'booking_search_trgm_idx'
+TRGM_EXPRESSION = f"(\"{TABLE}\".\"client_name\" || ' ' || \"{TABLE}\".\"client_email\")"
+
+SQLITE_INSTALL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"client_name, client_email, content='{TABLE}', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, client_name, client_email) VALUES (new.id, new.client_name, new.client_email); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, client_name, client_email) "
+    f"VALUES ('delete', old.id, old.client_name, old.client_email); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF client_name, client_email ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, client_name, client_email) "
+    f"VALUES ('delete', old.id, old.client_name, old.client_email); "
+    f"INSERT INTO {FTS_TABLE}(rowid, client_name, client_email) VALUES (new.id, new.client_name, new.client_email); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def install(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        # Миграция не атомарная: CONCURRENTLY не блокирует запись в booking_booking на время построения
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRGM_INDEX} ON {TABLE} USING gin ({TRGM_EXPRESSION} gin_trgm_ops)"
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                for sql in SQLITE_INSTALL:
+                    schema_editor.execute(sql)
+        except DatabaseError:
+            # SQLite собран без FTS5 или старше 3.34 (нет trigram) — админка ищет обычным способом
+            logger.warning("SQLite FTS5 trigram is unavailable, admin search falls back to LIKE")
+
+
+def uninstall(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {TRGM_INDEX}")
+    elif connection.vendor == 'sqlite':
+        for sql in SQLITE_UNINSTALL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('booking', '0021_clients'),
+    ]
+
+    operations = [
+        # GIN-индекс pg_trgm (PostgreSQL) или FTS5-таблица с триггерами (SQLite), см. booking/fulltext.py
+        migrations.RunPython(install, uninstall),
+    ]
@@ -1,10 +1,54 @@
+import re
+
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+class ShopManager(models.Manager):
+  def default(self):
+    # Сначала обычное чтение: get_or_create считается записью и прижал бы запрос к primary
+    shop = self.filter(slug=settings.DEFAULT_SHOP_SLUG).first()
+    if shop is None:
+      shop, _created = self.get_or_create(slug=settings.DEFAULT_SHOP_SLUG, defaults={'name': 'Barbershop'})
+    return shop
+
+
+class Shop(models.Model):
+  """
+  Филиал. Запрос относится к филиалу по домену (см. ShopMiddleware), без совпадения — к филиалу
+  по умолчанию (DEFAULT_SHOP_SLUG).
+  """
+  name = models.CharField(max_length=100)
+  slug = models.SlugField(unique=True)
+  domain = models.CharField(max_length=255, blank=True, db_index=True)
+  is_active = models.BooleanField(default=True)
+
+  objects = ShopManager()
+
+  class Meta:
+    verbose_name = _('Филиал')
+    verbose_name_plural = _('Филиалы')
+
+  def __str__(self):
+    return self.name
+
+
+def default_shop_id():
+  # Default вызывается в каждом конструкторе модели (и сохранён в миграциях), поэтому без
+  # запросов к БД. Филиал по умолчанию подставляют save() и формы админки.
+  return None
+
+
+def _ensure_shop(instance):
+  if instance.shop_id is None:
+    instance.shop = Shop.objects.default()
+
+
 class Barber(models.Model):
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='barbers', default=default_shop_id)
   name = models.CharField(max_length=100)
   photo = models.ImageField(
     upload_to='barbers/',
@@ -15,11 +59,17 @@ class Barber(models.Model):
   experience_years = models.PositiveIntegerField(default=0)
   description = models.TextField(blank=True)
   is_active = models.BooleanField(default=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['shop', 'is_active'], name='barber_shop_active_idx'),
+    ]
   
   def __str__(self):
     return self.name
 
   def save(self, *args, **kwargs):
+    _ensure_shop(self)
     if self.pk:
       old = Barber.objects.filter(pk=self.pk).first()
       if old and old.photo and old.photo != self.photo:
@@ -33,6 +83,7 @@ class Barber(models.Model):
 
 
 class SiteContent(models.Model):
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='site_contents', default=default_shop_id)
   about_image = models.ImageField(
     upload_to='about/',
     blank=True,
@@ -47,7 +98,12 @@ class SiteContent(models.Model):
   def __str__(self):
     return "Site content"
 
+  def save(self, *args, **kwargs):
+    _ensure_shop(self)
+    super().save(*args, **kwargs)
+
 class Service(models.Model):
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='services', default=default_shop_id)
   icon = models.CharField(max_length=10)
   name = models.CharField(max_length=100)
   description = models.TextField(blank=True)
@@ -57,10 +113,65 @@ class Service(models.Model):
   def __str__(self):
     return self.name
 
+  def save(self, *args, **kwargs):
+    _ensure_shop(self)
+    super().save(*args, **kwargs)
+
+class ClientManager(models.Manager):
+  def for_phone(self, phone, name='', email=''):
+    """Клиент по телефону (любой формат); None, если телефон не нормализуется."""
+    phone = Client.normalize_phone(phone)
+    if phone is None:
+      return None
+    client, _created = self.get_or_create(phone=phone, defaults={'name': name, 'email': email})
+    return client
+
+
+class Client(models.Model):
+  """
+  Клиент, определяемый нормализованным телефоном (+380501234567). Записи ссылаются на него,
+  поэтому все визиты по номеру находятся по индексу, а не поиском по тексту в Booking.
+  Имя и email — из первой записи; в самих записях остаётся то, что клиент ввёл.
+  """
+  phone = models.CharField(max_length=20, unique=True, verbose_name=_('Телефон'))
+  name = models.CharField(max_length=100, blank=True, verbose_name=_('Имя'))
+  email = models.EmailField(blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+
+  objects = ClientManager()
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['name'], name='client_name_idx'),
+    ]
+    verbose_name = _('Клиент')
+    verbose_name_plural = _('Клиенты')
+
+  def __str__(self):
+    return f"{self.name} {self.phone}".strip()
+
+  @staticmethod
+  def normalize_phone(phone):
+    """+ и 10–15 цифр; местный номер 0XXXXXXXXX дополняется кодом 38. Иначе None."""
+    phone = (phone or '').strip()
+    digits = re.sub(r'\D', '', phone)
+    if len(digits) == 10 and digits.startswith('0'):
+      digits = f"38{digits}"
+    if len(digits) < 10 or len(digits) > 15:
+      return None
+    return f"+{digits}"
+
+
 class Booking(models.Model):
+  # Дублирует barber.shop: выборки по филиалу и дате идут по индексу без JOIN
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='bookings', editable=False)
   client_name = models.CharField(max_length=100)
   client_phone = models.CharField(max_length=20)
   client_email = models.EmailField(blank=True)
+  # Заполняется в save() по client_phone
+  client = models.ForeignKey(
+    Client, null=True, blank=True, on_delete=models.SET_NULL, related_name='bookings', editable=False
+  )
   user = models.ForeignKey(
     settings.AUTH_USER_MODEL,
     null=True,
@@ -74,6 +185,7 @@ class Booking(models.Model):
   booking_time = models.TimeField()
   message = models.TextField(blank=True)
   created_at = models.DateTimeField(auto_now_add=True)
+  updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
   STATUS_PENDING = 'pending'
   STATUS_CONFIRMED = 'confirmed'
@@ -96,6 +208,90 @@ class Booking(models.Model):
     verbose_name=_('Статус')
   )
 
+  class Meta:
+    indexes = [
+      models.Index(fields=['booking_date', 'booking_time'], name='booking_date_time_idx'),
+      models.Index(fields=['barber', 'booking_date'], name='booking_barber_date_idx'),
+      models.Index(fields=['shop', 'booking_date', 'booking_time'], name='booking_shop_date_idx'),
+      # Лента записей пользователя в API v1: курсор по (booking_date, booking_time, id)
+      models.Index(fields=['user', 'booking_date', 'booking_time'], name='booking_user_date_idx'),
+    ]
+
+  is_archived = False
+
+  @classmethod
+  def from_db(cls, db, field_names, values):
+    instance = super().from_db(db, field_names, values)
+    # Ключ сводки на момент загрузки: при переносе пересчитывается и прежний день (booking/rollups.py)
+    loaded = dict(zip(field_names, values))
+    instance._loaded_rollup_key = (loaded.get('booking_date'), loaded.get('barber_id'), loaded.get('service_id'))
+    instance._loaded_client_phone = loaded.get('client_phone')
+    return instance
+
+  def __str__(self):
+    return f"{self.client_name} - {self.barber.name} - {self.service.name} - {self.booking_date}"
+
+  def save(self, *args, **kwargs):
+    # Филиал берётся у барбера, только если барбер сохраняется: смена статуса не читает Barber
+    update_fields = kwargs.get('update_fields')
+    if self.barber_id and (update_fields is None or {'barber', 'barber_id'} & set(update_fields)):
+      self.shop_id = self.barber.shop_id
+      if update_fields is not None:
+        kwargs['update_fields'] = {*update_fields, 'shop'}
+    # Частичные сохранения (статус, перенос) клиента не меняют
+    phone_changed = self.client_phone != getattr(self, '_loaded_client_phone', None)
+    if kwargs.get('update_fields') is None and (self.client_id is None or phone_changed):
+      self.client = Client.objects.for_phone(self.client_phone, self.client_name, self.client_email)
+    super().save(*args, **kwargs)
+    self._loaded_client_phone = self.client_phone
+
+
+class ArchivedBooking(models.Model):
+  """
+  Старые записи, перенесённые из Booking командой archive_bookings, чтобы таблица,
+  по которой считаются слоты, содержала только недавние и будущие визиты. id сохраняется.
+  """
+  id = models.BigIntegerField(primary_key=True)
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='archived_bookings')
+  client_name = models.CharField(max_length=100)
+  client_phone = models.CharField(max_length=20)
+  client_email = models.EmailField(blank=True)
+  client = models.ForeignKey(
+    Client, null=True, blank=True, on_delete=models.SET_NULL, related_name='archived_bookings'
+  )
+  user = models.ForeignKey(
+    settings.AUTH_USER_MODEL,
+    null=True,
+    blank=True,
+    on_delete=models.SET_NULL,
+    related_name='archived_bookings',
+  )
+  barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='archived_bookings')
+  service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='archived_bookings')
+  booking_date = models.DateField()
+  booking_time = models.TimeField()
+  message = models.TextField(blank=True)
+  status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES, verbose_name=_('Статус'))
+  created_at = models.DateTimeField()
+  updated_at = models.DateTimeField()
+  archived_at = models.DateTimeField(auto_now_add=True)
+
+  is_archived = True
+
+  # Поля, которые переносятся из Booking как есть
+  COPIED_FIELDS = [
+    'id', 'shop_id', 'client_name', 'client_phone', 'client_email', 'client_id', 'user_id', 'barber_id', 'service_id',
+    'booking_date', 'booking_time', 'message', 'status', 'created_at', 'updated_at',
+  ]
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['user', 'booking_date'], name='archived_user_date_idx'),
+      models.Index(fields=['shop', 'booking_date'], name='archived_shop_date_idx'),
+    ]
+    verbose_name = _('Архивная запись')
+    verbose_name_plural = _('Архив записей')
+
   def __str__(self):
     return f"{self.client_name} - {self.barber.name} - {self.service.name} - {self.booking_date}"
 
@@ -106,3 +302,266 @@ class UserProfile(models.Model):
 
   def __str__(self):
     return f"Профиль {self.user.username}"
+
+
+class OutboxEvent(models.Model):
+  """
+  Уведомление о событии брони. Пишется в той же транзакции, что и сама бронь,
+  а доставляет его отдельный процесс (manage.py run_outbox).
+  """
+  EVENT_CREATED = 'created'
+  EVENT_CANCELED = 'canceled'
+  EVENT_RESCHEDULED = 'rescheduled'
+  EVENT_REMINDER = 'reminder'
+  EVENT_SLOT_FREED = 'slot_freed'
+  EVENT_STATUS_CHANGED = 'status_changed'
+
+  EVENT_CHOICES = [
+    (EVENT_CREATED, _('Запись создана')),
+    (EVENT_CANCELED, _('Запись отменена')),
+    (EVENT_RESCHEDULED, _('Запись перенесена')),
+    (EVENT_REMINDER, _('Напоминание')),
+    (EVENT_SLOT_FREED, _('Освободилось время')),
+    (EVENT_STATUS_CHANGED, _('Статус записи изменён')),
+  ]
+
+  CHANNEL_EMAIL = 'email'
+  CHANNEL_TELEGRAM = 'telegram'
+
+  CHANNEL_CHOICES = [
+    (CHANNEL_EMAIL, 'Email'),
+    (CHANNEL_TELEGRAM, 'Telegram'),
+  ]
+
+  STATUS_PENDING = 'pending'
+  STATUS_SENT = 'sent'
+  STATUS_FAILED = 'failed'
+
+  STATUS_CHOICES = [
+    (STATUS_PENDING, _('В очереди')),
+    (STATUS_SENT, _('Отправлено')),
+    (STATUS_FAILED, _('Ошибка')),
+  ]
+
+  event_type = models.CharField(max_length=20, choices=EVENT_CHOICES)
+  channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+  booking = models.ForeignKey(Booking, null=True, blank=True, on_delete=models.SET_NULL, related_name='outbox_events')
+  payload = models.JSONField(default=dict)
+  status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+  attempts = models.PositiveIntegerField(default=0)
+  available_at = models.DateTimeField(default=timezone.now)
+  last_error = models.TextField(blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+  sent_at = models.DateTimeField(null=True, blank=True)
+
+  class Meta:
+    indexes = [
+      models.Index(
+        fields=['available_at'],
+        condition=models.Q(status='pending'),
+        name='outbox_pending_idx',
+      ),
+    ]
+
+  def __str__(self):
+    return f"{self.get_event_type_display()} #{self.booking_id} ({self.channel})"
+
+
+class BookingReminder(models.Model):
+  """
+  Отметка об отправленном напоминании. Уникальность защищает от повторной отправки
+  после перезапуска планировщика; после переноса записи appointment_at меняется,
+  и напоминание о новом времени отправляется заново.
+  """
+  booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='reminders')
+  lead_minutes = models.PositiveIntegerField()
+  appointment_at = models.DateTimeField()
+  sent_at = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['booking', 'lead_minutes', 'appointment_at'], name='unique_booking_reminder'),
+    ]
+
+  def __str__(self):
+    return f"#{self.booking_id} за {self.lead_minutes} мин"
+
+
+class WorkingHours(models.Model):
+  """
+  Недельный график барбера. День недели без строки — выходной. Если у барбера нет
+  ни одной строки, действует общий график из booking/utils.py (WORK_DAY_START–WORK_DAY_END).
+  """
+  WEEKDAY_CHOICES = [
+    (0, _('Понедельник')),
+    (1, _('Вторник')),
+    (2, _('Среда')),
+    (3, _('Четверг')),
+    (4, _('Пятница')),
+    (5, _('Суббота')),
+    (6, _('Воскресенье')),
+  ]
+
+  barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='working_hours')
+  weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, verbose_name=_('День недели'))
+  start_time = models.TimeField(verbose_name=_('Начало'))
+  end_time = models.TimeField(verbose_name=_('Конец'))
+  break_start = models.TimeField(null=True, blank=True, verbose_name=_('Начало перерыва'))
+  break_end = models.TimeField(null=True, blank=True, verbose_name=_('Конец перерыва'))
+
+  class Meta:
+    ordering = ['weekday', 'start_time']
+    verbose_name = _('Рабочие часы')
+    verbose_name_plural = _('Рабочие часы')
+
+  def __str__(self):
+    return f"{self.barber.name}: {self.get_weekday_display()} {self.start_time:%H:%M}–{self.end_time:%H:%M}"
+
+
+class ScheduleException(models.Model):
+  """
+  Исключение на конкретную дату: без барбера — для всего филиала (праздник).
+  Без времени — день нерабочий, со временем — особые часы вместо недельного графика.
+  Исключение барбера важнее общего.
+  """
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='schedule_exceptions', default=default_shop_id)
+  barber = models.ForeignKey(
+    Barber,
+    null=True,
+    blank=True,
+    on_delete=models.CASCADE,
+    related_name='schedule_exceptions',
+  )
+  date = models.DateField(verbose_name=_('Дата'))
+  start_time = models.TimeField(null=True, blank=True, verbose_name=_('Начало'))
+  end_time = models.TimeField(null=True, blank=True, verbose_name=_('Конец'))
+  note = models.CharField(max_length=100, blank=True, verbose_name=_('Комментарий'))
+
+  class Meta:
+    ordering = ['date']
+    indexes = [
+      models.Index(fields=['barber', 'date'], name='schedule_exception_idx'),
+      models.Index(fields=['shop', 'date'], name='schedule_shop_date_idx'),
+    ]
+    verbose_name = _('Исключение в графике')
+    verbose_name_plural = _('Исключения в графике')
+
+  def save(self, *args, **kwargs):
+    if self.barber_id:
+      self.shop_id = self.barber.shop_id
+    _ensure_shop(self)
+    super().save(*args, **kwargs)
+
+  def __str__(self):
+    who = self.barber.name if self.barber_id else _('Все барберы')
+    return f"{who}: {self.date} {self.note}".strip()
+
+
+class WaitlistEntry(models.Model):
+  """
+  Заявка "сообщите, если освободится время": барбер (или любой), диапазон дат и окно
+  времени начала. Подбор — booking/waitlist.py, уведомление уходит через outbox.
+  """
+  STATUS_ACTIVE = 'active'
+  STATUS_NOTIFIED = 'notified'
+  STATUS_CANCELED = 'canceled'
+
+  STATUS_CHOICES = [
+    (STATUS_ACTIVE, _('Ожидает')),
+    (STATUS_NOTIFIED, _('Уведомлён')),
+    (STATUS_CANCELED, _('Отменено')),
+  ]
+
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='waitlist_entries', editable=False)
+  user = models.ForeignKey(
+    settings.AUTH_USER_MODEL,
+    null=True,
+    blank=True,
+    on_delete=models.SET_NULL,
+    related_name='waitlist_entries',
+  )
+  client_name = models.CharField(max_length=100)
+  client_phone = models.CharField(max_length=20)
+  client_email = models.EmailField(blank=True)
+  barber = models.ForeignKey(Barber, null=True, blank=True, on_delete=models.CASCADE, related_name='waitlist_entries')
+  service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='waitlist_entries')
+  date_from = models.DateField()
+  date_to = models.DateField()
+  time_from = models.TimeField()
+  time_to = models.TimeField()
+  status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+  created_at = models.DateTimeField(auto_now_add=True)
+  notified_at = models.DateTimeField(null=True, blank=True)
+
+  class Meta:
+    indexes = [
+      # Подбор: филиал + date_to >= дата слота. Закрытые заявки в индекс не попадают,
+      # прошедшие отсекаются диапазоном по date_to
+      models.Index(
+        fields=['shop', 'date_to', 'date_from'],
+        condition=models.Q(status='active'),
+        name='waitlist_active_idx',
+      ),
+    ]
+    verbose_name = _('Лист ожидания')
+    verbose_name_plural = _('Лист ожидания')
+
+  def __str__(self):
+    return f"{self.client_name}: {self.date_from}–{self.date_to} {self.time_from:%H:%M}–{self.time_to:%H:%M}"
+
+
+class DailyRollup(models.Model):
+  """
+  Итоги за день по (барбер, услуга): число записей по статусам, выручка и занятые слоты.
+  Пересчитываются по затронутым ключам при изменении записей (booking/rollups.py),
+  отчёт в админке читает только эту таблицу.
+  """
+  date = models.DateField()
+  shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='daily_rollups')
+  barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='daily_rollups')
+  service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='daily_rollups')
+  bookings = models.PositiveIntegerField(default=0)
+  completed = models.PositiveIntegerField(default=0)
+  canceled = models.PositiveIntegerField(default=0)
+  no_show = models.PositiveIntegerField(default=0)
+  # Выручка — выполненные визиты по текущей цене услуги
+  revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+  booked_minutes = models.PositiveIntegerField(default=0)
+  # Битовая маска слотов дня, занятых неотменёнными записями (как в booking/schedule.py)
+  booked_mask = models.BigIntegerField(default=0)
+  updated_at = models.DateTimeField(auto_now=True)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['date', 'barber', 'service'], name='rollup_day_key'),
+    ]
+    indexes = [
+      models.Index(fields=['shop', 'date'], name='rollup_shop_date_idx'),
+    ]
+    verbose_name = _('Отчёт')
+    verbose_name_plural = _('Отчёты')
+
+  def __str__(self):
+    return f"{self.date} {self.barber_id}/{self.service_id}"
+
+
+class IdempotencyKey(models.Model):
+  """
+  Сохранённый ответ на запрос с заголовком Idempotency-Key (booking/idempotency.py):
+  повтор с тем же ключом получает его без повторной обработки.
+  """
+  # sha256 от (назначение, клиент, ключ) — длина и состав ключа от клиента не важны
+  key = models.CharField(max_length=64, unique=True)
+  # sha256 тела запроса: тот же ключ с другими данными — ошибка клиента
+  fingerprint = models.CharField(max_length=64)
+  # None — первый запрос ещё обрабатывается
+  status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+  content_type = models.CharField(max_length=100, blank=True)
+  body = models.TextField(blank=True)
+  created_at = models.DateTimeField()
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['created_at'], name='idempotency_created_idx'),
+    ]
+
@@ -0,0 +1,84 @@
+"""
+Отмена и перенос записи клиентом — общие правила для страниц кабинета и JSON API.
+"""
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from . import outbox, waitlist
+from .models import Booking, OutboxEvent
+from .utils import booking_write, get_available_slots
+
+CANCEL_LIMIT_HOURS = 3
+
+
+class OperationError(Exception):
+  """Операцию нельзя выполнить; текст — для клиента, code — для API."""
+
+  def __init__(self, message, code):
+    super().__init__(message)
+    self.code = code
+
+
+def _appointment_at(booking):
+  return timezone.make_aware(datetime.datetime.combine(booking.booking_date, booking.booking_time))
+
+
+def check_cancel(booking):
+  if booking.status == Booking.STATUS_COMPLETED:
+    raise OperationError(_('Вы не можете отменить выполненную запись.'), 'completed')
+  appointment_dt = _appointment_at(booking)
+  if appointment_dt <= timezone.now():
+    raise OperationError(_('Вы не можете отменить прошедшую запись.'), 'past')
+  if appointment_dt - timezone.now() < datetime.timedelta(hours=CANCEL_LIMIT_HOURS):
+    raise OperationError(
+      _('Отмена возможна минимум за %(hours)s часа до визита.') % {'hours': CANCEL_LIMIT_HOURS}, 'too_late'
+    )
+
+
+def cancel(booking):
+  check_cancel(booking)
+  with transaction.atomic():
+    booking.status = Booking.STATUS_CANCELED
+    booking.save(update_fields=['status', 'updated_at'])
+    outbox.record(OutboxEvent.EVENT_CANCELED, booking)
+    waitlist.slot_freed(booking)
+
+
+def check_reschedule(booking):
+  if booking.status in [Booking.STATUS_CANCELED, Booking.STATUS_COMPLETED, Booking.STATUS_NO_SHOW]:
+    raise OperationError(_("Эту запись нельзя перенести."), 'status')
+  appointment_dt = _appointment_at(booking)
+  if appointment_dt <= timezone.now():
+    raise OperationError(_("Прошедшую запись нельзя перенести."), 'past')
+  if appointment_dt - timezone.now() < datetime.timedelta(hours=CANCEL_LIMIT_HOURS):
+    raise OperationError(
+      _("Перенос возможен минимум за %(hours)s часа до визита.") % {'hours': CANCEL_LIMIT_HOURS}, 'too_late'
+    )
+
+
+def reschedule(booking, user, selected_date, selected_time):
+  """Переносит запись к тому же барберу; слот проверяется внутри транзакции записи."""
+  check_reschedule(booking)
+  with booking_write(booking.barber_id):
+    if selected_time not in get_available_slots(booking.barber, selected_date, booking.service, exclude_id=booking.pk):
+      raise OperationError(_("Этот слот уже занят. Выберите другое время."), 'slot_taken')
+    # Проверим, что нет другой активной записи пользователя в это же время
+    conflict = Booking.objects.filter(
+      user=user,
+      booking_date=selected_date,
+      booking_time=selected_time,
+      status__in=[Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED],
+    ).exclude(id=booking.id).exists()
+    if conflict:
+      raise OperationError(_("У вас уже есть запись на это время."), 'conflict')
+
+    old_date, old_time = booking.booking_date, booking.booking_time
+    booking.booking_date = selected_date
+    booking.booking_time = selected_time
+    booking.status = Booking.STATUS_PENDING  # после переноса снова "ожидает"
+    booking.save(update_fields=['booking_date', 'booking_time', 'status', 'updated_at'])
+    outbox.record(OutboxEvent.EVENT_RESCHEDULED, booking)
+    waitlist.slot_freed(booking, old_date, old_time)
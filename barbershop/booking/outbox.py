@@ -0,0 +1,211 @@
+import json
+import logging
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .models import Booking, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Сколько времени захваченное событие считается "в работе" у одного диспетчера
+CLAIM_LEASE = timedelta(minutes=2)
+# Максимальная длина текста sendMessage в Bot API
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Напоминания и лист ожидания — только клиенту, персоналу копия не нужна
+CLIENT_ONLY_EVENTS = {OutboxEvent.EVENT_REMINDER, OutboxEvent.EVENT_SLOT_FREED}
+
+
+def channels_for(event_type, booking):
+  """Каналы уведомления о событии брони; email — только если у письма будет получатель."""
+  channels = []
+  staff_email = event_type not in CLIENT_ONLY_EVENTS and settings.BOOKING_NOTIFY_EMAILS
+  if booking.client_email or staff_email:
+    channels.append(OutboxEvent.CHANNEL_EMAIL)
+  if settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_STAFF_CHAT_ID:
+    channels.append(OutboxEvent.CHANNEL_TELEGRAM)
+  return channels
+
+
+def build(event_type, booking, channels=None, **extra):
+  """Несохранённые события outbox о брони — для bulk_create сразу по многим броням."""
+  payload = {
+    **extra,
+    'booking_id': booking.id,
+    'client_name': booking.client_name,
+    'client_phone': booking.client_phone,
+    'client_email': booking.client_email,
+    'barber': booking.barber.name,
+    'service': booking.service.name,
+    'booking_date': booking.booking_date.isoformat(),
+    'booking_time': booking.booking_time.strftime('%H:%M'),
+  }
+  return [
+    OutboxEvent(event_type=event_type, channel=channel, booking=booking, payload=payload)
+    for channel in (channels_for(event_type, booking) if channels is None else channels)
+  ]
+
+
+def record(event_type, booking, channels=None, **extra):
+  """
+  Ставит уведомления о событии брони в outbox.
+  Вызывать внутри транзакции, которая меняет бронь, — тогда событие и бронь фиксируются вместе.
+  """
+  OutboxEvent.objects.bulk_create(build(event_type, booking, channels, **extra))
+
+
+def title(event):
+  titles = {
+    OutboxEvent.EVENT_CREATED: _("Новая запись"),
+    OutboxEvent.EVENT_CANCELED: _("Запись отменена"),
+    OutboxEvent.EVENT_RESCHEDULED: _("Запись перенесена"),
+    OutboxEvent.EVENT_REMINDER: _("Напоминание о записи"),
+    OutboxEvent.EVENT_SLOT_FREED: _("Освободилось время из листа ожидания"),
+    OutboxEvent.EVENT_STATUS_CHANGED: _("Статус записи изменён"),
+  }
+  number = event.payload.get('booking_id', event.payload.get('waitlist_id'))
+  return f"{titles.get(event.event_type, event.event_type)} #{number}"
+
+
+def describe(event):
+  p = event.payload
+  text = (
+    f"{title(event)}: {p['booking_date']} {p['booking_time']}, {p['barber']}, {p['service']}. "
+    f"{p['client_name']} {p['client_phone']}"
+  )
+  if 'status' in p:
+    text += f". {_('Статус')}: {dict(Booking.STATUS_CHOICES).get(p['status'], p['status'])}"
+  return text
+
+
+def claim_batch(limit):
+  """
+  Забирает до `limit` готовых к отправке событий и продлевает им available_at на CLAIM_LEASE,
+  чтобы параллельный диспетчер их не взял. Если процесс упадёт, события вернутся в очередь сами.
+  """
+  now = timezone.now()
+  with transaction.atomic():
+    ids = list(
+      OutboxEvent.objects.select_for_update(skip_locked=True)
+      .filter(status=OutboxEvent.STATUS_PENDING, available_at__lte=now)
+      .order_by('available_at', 'id')
+      .values_list('id', flat=True)[:limit]
+    )
+    OutboxEvent.objects.filter(id__in=ids).update(available_at=now + CLAIM_LEASE, attempts=F('attempts') + 1)
+  return list(OutboxEvent.objects.filter(id__in=ids).order_by('id'))
+
+
+def _deliver_email(events):
+  """Все письма пачки уходят через одно SMTP-соединение, ошибка учитывается по каждому письму."""
+  errors = {}
+  connection = mail.get_connection()
+  try:
+    connection.open()
+  except OSError as exc:
+    return {event.id: str(exc) for event in events}
+  try:
+    for event in events:
+      client_email = event.payload.get('client_email')
+      staff = [] if event.event_type in CLIENT_ONLY_EVENTS else settings.BOOKING_NOTIFY_EMAILS
+      message = mail.EmailMessage(
+        subject=title(event),
+        body=describe(event),
+        to=[client_email] if client_email else staff,
+        bcc=staff if client_email else [],
+        connection=connection,
+      )
+      try:
+        message.send()
+      except OSError as exc:
+        errors[event.id] = str(exc)
+  finally:
+    connection.close()
+  return errors
+
+
+def _telegram_chunks(events):
+  """Делит пачку на сообщения не длиннее TELEGRAM_MESSAGE_LIMIT: [(события, текст), ...]."""
+  chunks = []
+  # length — длина текста с переводами строк; -1, чтобы не считать перевод перед первой строкой
+  chunk_events, lines, length = [], [], -1
+  for event in events:
+    line = describe(event)[:TELEGRAM_MESSAGE_LIMIT]
+    if lines and length + 1 + len(line) > TELEGRAM_MESSAGE_LIMIT:
+      chunks.append((chunk_events, '\n'.join(lines)))
+      chunk_events, lines, length = [], [], -1
+    chunk_events.append(event)
+    lines.append(line)
+    length += 1 + len(line)
+  if lines:
+    chunks.append((chunk_events, '\n'.join(lines)))
+  return chunks
+
+
+def _send_telegram(text):
+  """Одно сообщение персоналу через Bot API sendMessage; возвращает текст ошибки или None."""
+  url = f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+  body = json.dumps({'chat_id': settings.TELEGRAM_STAFF_CHAT_ID, 'text': text}).encode()
+  request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+  try:
+    with urllib.request.urlopen(request, timeout=settings.OUTBOX_HTTP_TIMEOUT) as response:
+      result = json.loads(response.read() or b'{}')
+  except (OSError, ValueError) as exc:
+    return str(exc)
+  if not result.get('ok'):
+    return result.get('description', 'Telegram API error')
+  return None
+
+
+def _deliver_telegram(events):
+  """
+  Пачка событий уходит персоналу сообщениями по несколько строк: Telegram не принимает
+  текст длиннее 4096 символов. Ошибка учитывается по событиям своего сообщения.
+  """
+  errors = {}
+  for chunk, text in _telegram_chunks(events):
+    error = _send_telegram(text)
+    if error is not None:
+      errors.update((event.id, error) for event in chunk)
+  return errors
+
+
+DELIVERERS = {
+  OutboxEvent.CHANNEL_EMAIL: _deliver_email,
+  OutboxEvent.CHANNEL_TELEGRAM: _deliver_telegram,
+}
+
+
+def dispatch_batch(limit=None):
+  """
+  Отправляет одну пачку событий. Возвращает (отправлено, с ошибкой).
+  """
+  events = claim_batch(limit or settings.OUTBOX_BATCH_SIZE)
+  errors = {}
+  for channel, deliver in DELIVERERS.items():
+    channel_events = [event for event in events if event.channel == channel]
+    if channel_events:
+      errors.update(deliver(channel_events))
+
+  now = timezone.now()
+  sent_ids = [event.id for event in events if event.id not in errors]
+  OutboxEvent.objects.filter(id__in=sent_ids).update(status=OutboxEvent.STATUS_SENT, sent_at=now, last_error='')
+
+  for event in events:
+    if event.id not in errors:
+      continue
+    logger.warning("Outbox event %s failed (attempt %s): %s", event.id, event.attempts, errors[event.id])
+    if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+      update = {'status': OutboxEvent.STATUS_FAILED}
+    else:
+      # Экспоненциальная пауза: 30 с, 1 мин, 2 мин, ...
+      update = {'available_at': now + timedelta(seconds=30 * 2 ** (event.attempts - 1))}
+    OutboxEvent.objects.filter(id=event.id).update(last_error=errors[event.id], **update)
+
+  return len(sent_ids), len(errors)
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Barber, Service, Shop, SiteContent
+
+SHOPS_KEY = 'ref:shops'
+
+
+def _shop_key(shop_id, name):
+  # Своё пространство ключей у каждого филиала: изменения в одном не сбрасывают кэш другого
+  return f"ref:shop:{shop_id}:{name}"
+
+
+def _cached(key, loader):
+  # Значение храним в кортеже, чтобы закэшированный None (нет SiteContent) отличался от промаха
+  hit = cache.get(key)
+  if hit is None:
+    hit = (loader(),)
+    cache.set(key, hit, settings.REFERENCE_CACHE_TIMEOUT)
+  return hit[0]
+
+
+def _load_shops():
+  default = Shop.objects.default()
+  by_domain = {shop.domain.lower(): shop for shop in Shop.objects.filter(is_active=True).exclude(domain='')}
+  return {'default': default, 'by_domain': by_domain}
+
+
+def get_shop(host):
+  """
+  Филиал по домену запроса (без порта), иначе филиал по умолчанию.
+  """
+  shops = _cached(SHOPS_KEY, _load_shops)
+  return shops['by_domain'].get(host.split(':')[0].lower(), shops['default'])
+
+
+def get_default_shop():
+  return _cached(SHOPS_KEY, _load_shops)['default']
+
+
+def get_active_barbers(shop):
+  return _cached(_shop_key(shop.pk, 'barbers'), lambda: list(Barber.objects.filter(shop=shop, is_active=True)))
+
+
+def get_services(shop):
+  return _cached(_shop_key(shop.pk, 'services'), lambda: list(Service.objects.filter(shop=shop)))
+
+
+def get_site_content(shop):
+  return _cached(_shop_key(shop.pk, 'site_content'), lambda: SiteContent.objects.filter(shop=shop).first())
+
+
+def invalidate(shop_id=None):
+  """
+  Сбрасывает справочники филиала (без shop_id — список филиалов). С LocMemCache у каждого
+  воркера своя копия, поэтому в остальных воркерах данные обновятся по REFERENCE_CACHE_TIMEOUT.
+  """
+  if shop_id is None:
+    cache.delete(SHOPS_KEY)
+    return
+  cache.delete_many([_shop_key(shop_id, name) for name in ('barbers', 'services', 'site_content')])
+
+
+def warm_up():
+  shops = [get_default_shop(), *_cached(SHOPS_KEY, _load_shops)['by_domain'].values()]
+  for shop in {shop.pk: shop for shop in shops}.values():
+    get_active_barbers(shop)
+    get_services(shop)
+    get_site_content(shop)
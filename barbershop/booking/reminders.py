@@ -0,0 +1,140 @@
+"""
+Планировщик напоминаний о визитах (по умолчанию за 24 ч и за 2 ч).
+
+Вместо полного просмотра Booking каждую минуту планировщик держит в памяти heap
+ближайших напоминаний. Heap заполняется запросом по индексу (booking_date, booking_time)
+на горизонт в пару дней, а дальше обновляется инкрементально — по записям, у которых
+изменился updated_at. Окна опроса перекрываются на REMINDER_POLL_OVERLAP секунд: updated_at
+ставится до коммита, и запись из долгой транзакции иначе проскочила бы между опросами;
+повторно прочитанные записи отсекаются по _scheduled. Отмена не требует удаления из heap:
+при срабатывании запись перечитывается, и устаревшие напоминания просто отбрасываются.
+"""
+import datetime
+import heapq
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import outbox
+from .models import Booking, BookingReminder, OutboxEvent
+
+ACTIVE_STATUSES = [Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED]
+
+
+def appointment_at(booking):
+  return timezone.make_aware(datetime.datetime.combine(booking.booking_date, booking.booking_time))
+
+
+class ReminderScheduler:
+  def __init__(self, leads_minutes=None, now=timezone.now):
+    # От большего к меньшему: напоминание за 24 ч актуально только до окна следующего (за 2 ч)
+    self.leads = sorted(leads_minutes or settings.REMINDER_LEADS_MINUTES, reverse=True)
+    self.now = now
+    self._heap = []
+    self._scheduled = set()
+    self._changes_since = None
+    self._horizon_end = None
+
+  def __len__(self):
+    return len(self._heap)
+
+  def _next_lead(self, lead):
+    smaller = [m for m in self.leads if m < lead]
+    return smaller[0] if smaller else 0
+
+  def _push(self, booking):
+    at = appointment_at(booking)
+    for lead in self.leads:
+      key = (booking.id, lead, at)
+      if key in self._scheduled:
+        continue
+      self._scheduled.add(key)
+      heapq.heappush(self._heap, (at - datetime.timedelta(minutes=lead), booking.id, lead, at))
+
+  def _horizon(self, now):
+    return (now + datetime.timedelta(minutes=self.leads[0]) + datetime.timedelta(days=1)).date()
+
+  def refill(self):
+    """
+    Загружает активные записи до конца горизонта (range scan по booking_date, booking_time).
+    """
+    now = self.now()
+    self._changes_since = now
+    # Ключи сработавших напоминаний держим до самого визита, чтобы перекрытие окон их не вернуло
+    self._scheduled = {key for key in self._scheduled if key[2] > now}
+    start = timezone.localtime(now).date()
+    self._horizon_end = self._horizon(now)
+    bookings = Booking.objects.filter(
+      booking_date__gte=start,
+      booking_date__lte=self._horizon_end,
+      status__in=ACTIVE_STATUSES,
+    ).only('id', 'booking_date', 'booking_time')
+    for booking in bookings:
+      self._push(booking)
+
+  def poll_changes(self):
+    """
+    Инкрементальное обновление: новые и перенесённые записи с момента прошлой проверки.
+    Раз в сутки горизонт сдвигается, и недостающий день дочитывается через refill().
+    """
+    now = self.now()
+    if self._changes_since is None or self._horizon(now) > self._horizon_end:
+      self.refill()
+      return
+    since, self._changes_since = self._changes_since, now
+    bookings = Booking.objects.filter(
+      updated_at__gte=since - datetime.timedelta(seconds=settings.REMINDER_POLL_OVERLAP),
+      booking_date__gte=timezone.localtime(now).date(),
+      booking_date__lte=self._horizon_end,
+      status__in=ACTIVE_STATUSES,
+    ).only('id', 'booking_date', 'booking_time')
+    for booking in bookings:
+      self._push(booking)
+
+  def next_fire_at(self):
+    return self._heap[0][0] if self._heap else None
+
+  def fire_due(self):
+    """
+    Отправляет наступившие напоминания. Возвращает количество поставленных в outbox.
+    """
+    now = self.now()
+    due = []
+    while self._heap and self._heap[0][0] <= now:
+      due.append(heapq.heappop(self._heap))
+    if not due:
+      return 0
+
+    bookings = Booking.objects.select_related('barber', 'service').in_bulk({entry[1] for entry in due})
+    fired = 0
+    for fire_at, booking_id, lead, at in due:
+      booking = bookings.get(booking_id)
+      if not self._still_valid(booking, fire_at, lead, at, now):
+        continue
+      if self._send(booking, lead, at):
+        fired += 1
+    return fired
+
+  def _still_valid(self, booking, fire_at, lead, at, now):
+    if booking is None or booking.status not in ACTIVE_STATUSES:
+      return False
+    # Запись перенесли — для нового времени в heap уже есть свои напоминания
+    if appointment_at(booking) != at:
+      return False
+    # Клиент только что записался или перенёс визит — напоминать рано
+    if booking.updated_at > fire_at:
+      return False
+    # Пропущенное (например, планировщик был остановлен) шлём, пока не наступило окно следующего
+    return now < at - datetime.timedelta(minutes=self._next_lead(lead))
+
+  def _send(self, booking, lead, at):
+    channels = [OutboxEvent.CHANNEL_EMAIL] if booking.client_email else []
+    try:
+      with transaction.atomic():
+        BookingReminder.objects.create(booking=booking, lead_minutes=lead, appointment_at=at)
+        outbox.record(OutboxEvent.EVENT_REMINDER, booking, channels=channels, lead_minutes=lead)
+    except IntegrityError:
+      # Уже отправлено до перезапуска или другим экземпляром планировщика
+      return False
+    return True
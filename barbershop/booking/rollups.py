@@ -0,0 +1,223 @@
+"""
+Дневные сводки DailyRollup для отчёта владельца: выручка, неявки, загрузка по слотам.
+
+Сводка не накапливает дельты, а пересчитывает затронутые ключи (date, barber, service)
+по их записям — это небольшой срез по индексу (barber, booking_date), зато результат
+не расходится с данными при повторных и параллельных изменениях. Записи в архиве
+(ArchivedBooking) учитываются наравне с горячей таблицей.
+
+Сигналы post_save и post_delete и массовые UPDATE (booking/transitions.py) ставят ключи
+в refresh_on_commit: пересчёт идёт после коммита, вне блокировки booking_write, и ключи
+одной транзакции (например, пачки архивации) пересчитываются одним проходом.
+Неявки в кабинете обновляются вне транзакции и вызывают refresh сами.
+"""
+import datetime
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from . import schedule
+from .models import ArchivedBooking, Barber, Booking, DailyRollup, Service
+from .utils import BASE_SLOT_MINUTES, DEFAULT_DAY_MASK, slot_index, slots_needed
+
+COUNTERS = ('bookings', 'completed', 'canceled', 'no_show', 'revenue', 'booked_minutes', 'booked_mask')
+ROW_FIELDS = ('booking_date', 'barber_id', 'service_id', 'shop_id', 'status', 'booking_time')
+
+
+def key_of(booking):
+  return (booking.booking_date, booking.barber_id, booking.service_id)
+
+
+def _rows(**filters):
+  for model in (Booking, ArchivedBooking):
+    yield from model.objects.filter(**filters).order_by().values_list(*ROW_FIELDS).iterator(chunk_size=2000)
+
+
+def _aggregate(rows, services):
+  totals = {}
+  for date, barber_id, service_id, shop_id, status, time in rows:
+    service = services[service_id]
+    item = totals.get((date, barber_id, service_id))
+    if item is None:
+      item = totals[(date, barber_id, service_id)] = dict.fromkeys(COUNTERS, 0)
+      item['shop_id'] = shop_id
+    item['bookings'] += 1
+    if status == Booking.STATUS_CANCELED:
+      item['canceled'] += 1
+      continue
+    if status == Booking.STATUS_COMPLETED:
+      item['completed'] += 1
+      item['revenue'] += service.price
+    elif status == Booking.STATUS_NO_SHOW:
+      item['no_show'] += 1
+    item['booked_minutes'] += service.duration_minutes
+    first = slot_index(time)
+    if first is not None:
+      item['booked_mask'] |= ((1 << slots_needed(service)) - 1) << first
+  return totals
+
+
+def _services(ids):
+  return Service.objects.in_bulk(set(ids))
+
+
+def _save(totals):
+  DailyRollup.objects.bulk_create(
+    [
+      DailyRollup(date=date, barber_id=barber_id, service_id=service_id, **item)
+      for (date, barber_id, service_id), item in totals.items()
+    ],
+    update_conflicts=True,
+    unique_fields=['date', 'barber', 'service'],
+    update_fields=[*COUNTERS, 'shop', 'updated_at'],
+  )
+
+
+_pending = threading.local()
+
+
+def refresh_on_commit(keys):
+  """Пересчитывает сводки для keys после коммита текущей транзакции (сразу — вне транзакции)."""
+  pending = _pending.__dict__.setdefault('keys', set())
+  pending.update(keys)
+  transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+  # Первый колбэк транзакции забирает все её ключи, остальные получают пустой набор.
+  # Ключи из откаченной транзакции доедут со следующим коммитом — пересчёт идемпотентен.
+  keys, _pending.keys = getattr(_pending, 'keys', set()), set()
+  refresh(keys)
+
+
+def refresh(keys):
+  """Пересчитывает сводки для ключей (date, barber_id, service_id)."""
+  keys = {key for key in keys if all(part is not None for part in key)}
+  if not keys:
+    return
+  rows = [
+    row for row in _rows(
+      booking_date__in={date for date, _barber, _service in keys},
+      barber_id__in={barber_id for _date, barber_id, _service in keys},
+      service_id__in={service_id for _date, _barber, service_id in keys},
+    )
+    if row[:3] in keys
+  ]
+  totals = _aggregate(rows, _services(key[2] for key in keys))
+  with transaction.atomic():
+    _save(totals)
+    gone = keys - totals.keys()
+    for date, barber_id, service_id in gone:
+      DailyRollup.objects.filter(date=date, barber_id=barber_id, service_id=service_id).delete()
+
+
+def rebuild(start=None, end=None, chunk_days=31):
+  """
+  Пересобирает сводки за [start, end] окнами по chunk_days дней (по умолчанию — всю историю).
+  Генератор: после каждого окна отдаёт (первая дата, последняя дата, число сводок).
+  """
+  if chunk_days < 1:
+    raise ValueError("chunk_days must be at least 1")
+  bounds = [
+    model.objects.order_by(field).values_list('booking_date', flat=True).first()
+    for model in (Booking, ArchivedBooking)
+    for field in ('booking_date', '-booking_date')
+  ]
+  known = [date for date in bounds if date]
+  if not known:
+    return
+  start = start or min(known)
+  end = end or max(known)
+  services = _services(Service.objects.values_list('pk', flat=True))
+
+  while start <= end:
+    window_end = min(start + datetime.timedelta(days=chunk_days - 1), end)
+    totals = _aggregate(_rows(booking_date__gte=start, booking_date__lte=window_end), services)
+    with transaction.atomic():
+      DailyRollup.objects.filter(date__gte=start, date__lte=window_end).delete()
+      _save(totals)
+    yield start, window_end, len(totals)
+    start = window_end + datetime.timedelta(days=1)
+
+
+def _popcount(mask):
+  return bin(mask).count('1')
+
+
+def report(shop, start, end):
+  """
+  Данные отчёта филиала за [start, end] только из DailyRollup: итоги и выручка по дням
+  для каждого барбера и тепловая карта загрузки (день недели x слот).
+  Рабочие часы берутся из текущих графиков, поэтому загрузка прошлых дней приблизительная.
+  """
+  rows = list(
+    DailyRollup.objects.filter(shop=shop, date__gte=start, date__lte=end)
+    .order_by()
+    .values_list('date', 'barber_id', *COUNTERS)
+  )
+  barber_ids = {barber_id for _date, barber_id, *_counters in rows}
+  barber_ids.update(Barber.objects.filter(shop=shop, is_active=True).values_list('pk', flat=True))
+  barbers = sorted(Barber.objects.filter(pk__in=barber_ids), key=lambda barber: barber.name)
+  dates = [start + datetime.timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+  totals = {pk: dict.fromkeys(COUNTERS[:-1], 0) for pk in barber_ids}
+  day_booked = defaultdict(int)
+  day_revenue = defaultdict(Decimal)
+  for date, barber_id, *counters in rows:
+    item = dict(zip(COUNTERS, counters))
+    for name in COUNTERS[:-1]:
+      totals[barber_id][name] += item[name]
+    day_booked[(barber_id, date)] |= item['booked_mask']
+    day_revenue[(barber_id, date)] += item['revenue']
+
+  working = schedule.day_masks(
+    [(barber.pk, date) for barber in barbers for date in dates], DEFAULT_DAY_MASK, BASE_SLOT_MINUTES
+  )
+  slots_per_day = 24 * 60 // BASE_SLOT_MINUTES
+  available = [[0] * slots_per_day for _weekday in range(7)]
+  booked = [[0] * slots_per_day for _weekday in range(7)]
+  working_minutes = defaultdict(int)
+  for (barber_id, date), mask in working.items():
+    taken = day_booked.get((barber_id, date), 0)
+    working_minutes[barber_id] += _popcount(mask) * BASE_SLOT_MINUTES
+    weekday = date.weekday()
+    while mask:
+      low = mask & -mask
+      slot = low.bit_length() - 1
+      available[weekday][slot] += 1
+      booked[weekday][slot] += bool(taken & low)
+      mask ^= low
+
+  for barber_id, item in totals.items():
+    visited = item['completed'] + item['no_show']
+    item['no_show_rate'] = item['no_show'] / visited if visited else None
+    item['utilization'] = (
+      min(item['booked_minutes'] / working_minutes[barber_id], 1) if working_minutes[barber_id] else None
+    )
+
+  # Ячейки тепловых карт — (значение, доля от максимума для яркости)
+  top_revenue = max(day_revenue.values(), default=0) or 1
+  open_slots = [slot for slot in range(slots_per_day) if any(available[weekday][slot] for weekday in range(7))]
+  return {
+    'dates': dates,
+    'barbers': [
+      (
+        barber,
+        totals[barber.pk],
+        [
+          (day_revenue.get((barber.pk, date), Decimal(0)), float(day_revenue.get((barber.pk, date), 0) / top_revenue))
+          for date in dates
+        ],
+      )
+      for barber in barbers
+    ],
+    'slots': [
+      datetime.time(slot * BASE_SLOT_MINUTES // 60, slot * BASE_SLOT_MINUTES % 60) for slot in open_slots
+    ],
+    'utilization': [
+      [booked[weekday][slot] / available[weekday][slot] if available[weekday][slot] else None for slot in open_slots]
+      for weekday in range(7)
+    ],
+  }
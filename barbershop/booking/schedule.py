@@ -0,0 +1,166 @@
+"""
+Рабочие графики барберов, скомпилированные в битовые маски дня.
+
+Бит i маски — слот, начинающийся через i * step минут после полуночи. Недельный график
+и исключения барбера компилируются в маски один раз и лежат в кэше до изменения графика
+(сигналы в booking/signals.py), так что на запрос остаются только поиск по словарю
+и пересечение маски дня с маской занятых слотов.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Barber, ScheduleException, WorkingHours
+
+
+def _barber_key(barber_id):
+  return f"schedule:barber:{barber_id}"
+
+
+def _holidays_key(shop_id):
+  return f"schedule:holidays:{shop_id}"
+
+
+def _minutes(value):
+  return value.hour * 60 + value.minute
+
+
+def _bits(first, last):
+  return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def interval_mask(start, end, step):
+  """Слоты, целиком помещающиеся в [start, end)."""
+  return _bits(-(-_minutes(start) // step), _minutes(end) // step)
+
+
+def _overlap_mask(start, end, step):
+  """Слоты, хотя бы частично попадающие в [start, end)."""
+  return _bits(_minutes(start) // step, -(-_minutes(end) // step))
+
+
+def _hours_mask(row, step):
+  mask = interval_mask(row.start_time, row.end_time, step)
+  if row.break_start and row.break_end:
+    mask &= ~_overlap_mask(row.break_start, row.break_end, step)
+  return mask
+
+
+def _exceptions_mask(rows, step):
+  # Любая запись "весь день выходной" закрывает день, особые часы объединяются
+  if any(row.start_time is None or row.end_time is None for row in rows):
+    return 0
+  mask = 0
+  for row in rows:
+    mask |= interval_mask(row.start_time, row.end_time, step)
+  return mask
+
+
+def _compile_exceptions(rows, step):
+  by_date = {}
+  for row in rows:
+    by_date.setdefault(row.date, []).append(row)
+  return {date: _exceptions_mask(day_rows, step) for date, day_rows in by_date.items()}
+
+
+def _compile_barbers(barber_ids, step):
+  since = timezone.localdate() - datetime.timedelta(days=1)
+  shops = dict(Barber.objects.filter(pk__in=barber_ids).values_list('pk', 'shop_id'))
+  weekly = {barber_id: None for barber_id in barber_ids}
+  for row in WorkingHours.objects.filter(barber_id__in=barber_ids).order_by():
+    if weekly[row.barber_id] is None:
+      weekly[row.barber_id] = [0] * 7
+    weekly[row.barber_id][row.weekday] |= _hours_mask(row, step)
+
+  exceptions = {barber_id: [] for barber_id in barber_ids}
+  for row in ScheduleException.objects.filter(barber_id__in=barber_ids, date__gte=since).order_by():
+    exceptions[row.barber_id].append(row)
+
+  return {
+    barber_id: {
+      'shop_id': shops.get(barber_id),
+      # None — у барбера нет своего графика, действует общий
+      'weekly': tuple(weekly[barber_id]) if weekly[barber_id] else None,
+      'dates': _compile_exceptions(exceptions[barber_id], step),
+    }
+    for barber_id in barber_ids
+  }
+
+
+def _holidays(shop_ids, step):
+  """Общие исключения филиалов {shop_id: {date: mask}}."""
+  keys = {shop_id: _holidays_key(shop_id) for shop_id in shop_ids}
+  hits = cache.get_many(keys.values())
+  result = {shop_id: hits[key] for shop_id, key in keys.items() if key in hits}
+  missing = [shop_id for shop_id in keys if shop_id not in result]
+  if missing:
+    since = timezone.localdate() - datetime.timedelta(days=1)
+    rows = {shop_id: [] for shop_id in missing}
+    for row in ScheduleException.objects.filter(shop_id__in=missing, barber__isnull=True, date__gte=since).order_by():
+      rows[row.shop_id].append(row)
+    fresh = {shop_id: _compile_exceptions(shop_rows, step) for shop_id, shop_rows in rows.items()}
+    cache.set_many({keys[shop_id]: compiled for shop_id, compiled in fresh.items()}, settings.SCHEDULE_CACHE_TIMEOUT)
+    result.update(fresh)
+  return result
+
+
+def compiled_schedules(barber_ids, step):
+  """
+  Скомпилированные графики {barber_id: {...}}; промахи кэша дочитываются тремя запросами на всех.
+  """
+  keys = {barber_id: _barber_key(barber_id) for barber_id in set(barber_ids)}
+  hits = cache.get_many(keys.values())
+  result = {barber_id: hits[key] for barber_id, key in keys.items() if key in hits}
+  missing = [barber_id for barber_id in keys if barber_id not in result]
+  if missing:
+    fresh = _compile_barbers(missing, step)
+    cache.set_many({keys[barber_id]: compiled for barber_id, compiled in fresh.items()}, settings.SCHEDULE_CACHE_TIMEOUT)
+    result.update(fresh)
+  return result
+
+
+def mask_resolver(barber_ids, default_mask, step):
+  """
+  Функция (barber_id, date) -> маска рабочих слотов: исключение барбера, затем общее
+  исключение филиала (праздник), затем недельный график, иначе default_mask.
+  Графики читаются один раз, сама функция — только поиск по словарям.
+  """
+  schedules = compiled_schedules(barber_ids, step)
+  holidays = _holidays({compiled['shop_id'] for compiled in schedules.values()}, step)
+
+  def resolve(barber_id, date):
+    compiled = schedules[barber_id]
+    shop_holidays = holidays.get(compiled['shop_id'], {})
+    if date in compiled['dates']:
+      return compiled['dates'][date]
+    if date in shop_holidays:
+      return shop_holidays[date]
+    if compiled['weekly'] is not None:
+      return compiled['weekly'][date.weekday()]
+    return default_mask
+
+  return resolve
+
+
+def day_masks(pairs, default_mask, step):
+  """Маски рабочих слотов для пар (barber_id, date)."""
+  resolve = mask_resolver({barber_id for barber_id, _date in pairs}, default_mask, step)
+  return {(barber_id, date): resolve(barber_id, date) for barber_id, date in pairs}
+
+
+def invalidate(barber_id=None, shop_id=None):
+  """
+  Сбрасывает скомпилированный график барбера и/или общие исключения филиала.
+  С LocMemCache остальные воркеры перечитают график по SCHEDULE_CACHE_TIMEOUT.
+  """
+  if barber_id is not None:
+    cache.delete(_barber_key(barber_id))
+  if shop_id is not None:
+    cache.delete(_holidays_key(shop_id))
+
+
+def warm_up(barber_ids, step):
+  schedules = compiled_schedules(barber_ids, step)
+  _holidays({compiled['shop_id'] for compiled in schedules.values()}, step)
@@ -0,0 +1,127 @@
+"""
+Поиск свободного времени вперёд по дням: ближайшие слоты барбера, режим "любой барбер"
+и сводка дней, в которые есть свободное время.
+
+Занятость барберов на весь горизонт читается одним запросом, рабочие графики —
+из кэша (booking/schedule.py). Каждый барбер даёт ленивый поток своих свободных начал
+по возрастанию (date, slot); потоки сливаются k-way слиянием на куче (heapq.merge),
+и поиск останавливается на count-м результате, не разбирая дни, до которых не дошёл.
+"""
+import datetime
+import heapq
+from itertools import islice
+
+from django.conf import settings
+
+from . import schedule
+from .reference import get_active_barbers
+from .utils import (
+  BASE_SLOT_MINUTES,
+  DEFAULT_DAY_MASK,
+  active_bookings,
+  booked_masks,
+  fit_mask,
+  get_available_slots_bulk,
+  past_mask,
+  slots_needed,
+)
+
+
+def _window(start, days):
+  today = datetime.date.today()
+  start = max(start or today, today)
+  return [start + datetime.timedelta(days=offset) for offset in range(days or settings.SLOT_SEARCH_DAYS)]
+
+
+def _fits(barber_ids, service, dates):
+  """
+  Функция (barber_id, date) -> маска начал, от которых услуга помещается целиком.
+  Занятость барберов на все dates читается одним запросом по диапазону дат.
+  """
+  booked = booked_masks(
+    active_bookings()
+    .filter(barber_id__in=barber_ids, booking_date__gte=dates[0], booking_date__lte=dates[-1])
+    .order_by()
+    .values_list('barber_id', 'booking_date', 'booking_time', 'service__duration_minutes')
+  )
+  resolve = schedule.mask_resolver(barber_ids, DEFAULT_DAY_MASK, BASE_SLOT_MINUTES)
+  length = slots_needed(service)
+  today = datetime.date.today()
+  today_past = past_mask()
+
+  def fit(barber_id, date):
+    free = resolve(barber_id, date) & ~booked.get((barber_id, date), 0)
+    if date == today:
+      free &= ~today_past
+    return fit_mask(free, length)
+
+  return fit
+
+
+def _starts(position, barber_id, dates, fit):
+  """Свободные начала одного барбера: (date, slot, position, barber_id) по возрастанию."""
+  for date in dates:
+    mask = fit(barber_id, date)
+    while mask:
+      low = mask & -mask
+      yield date, low.bit_length() - 1, position, barber_id
+      mask ^= low
+
+
+def _merged(barbers, service, count, start, days):
+  if not barbers or count <= 0:
+    return []
+  dates = _window(start, days)
+  fit = _fits([barber.pk for barber in barbers], service, dates)
+  streams = [_starts(position, barber.pk, dates, fit) for position, barber in enumerate(barbers)]
+  by_id = {barber.pk: barber for barber in barbers}
+  result = []
+  for date, slot, _position, barber_id in islice(heapq.merge(*streams), count):
+    minutes = slot * BASE_SLOT_MINUTES
+    result.append((date, datetime.time(minutes // 60, minutes % 60), by_id[barber_id]))
+  return result
+
+
+def earliest_slots(shop, service, count, start=None, days=None):
+  """
+  Ближайшие count начал, в которые у кого-то из барберов помещается услуга целиком.
+  Возвращает [(date, time, barber), ...]; при равном времени порядок — как в списке барберов.
+  """
+  return _merged(get_active_barbers(shop), service, count, start, days)
+
+
+def next_slots(barber, service, count, start=None, days=None):
+  """Ближайшие count свободных начал одного барбера: [(date, time), ...]."""
+  return [(date, time) for date, time, _barber in _merged([barber], service, count, start, days)]
+
+
+def available_days(barbers, service, start=None, days=None):
+  """
+  Даты окна, в которые услуга помещается хотя бы у одного из barbers:
+  (первая дата окна, [bool по дням]).
+  """
+  dates = _window(start, days)
+  if not barbers:
+    return dates[0], [False] * len(dates)
+  fit = _fits([barber.pk for barber in barbers], service, dates)
+  return dates[0], [any(fit(barber.pk, date) for barber in barbers) for date in dates]
+
+
+def any_barber_slots(shop, date, service=None):
+  """
+  Время, на которое свободен хотя бы один барбер филиала (для выпадающего списка);
+  с service — только начала, от которых услуга помещается целиком.
+  """
+  pairs = [(barber.pk, date) for barber in get_active_barbers(shop)]
+  free = get_available_slots_bulk(pairs, service)
+  return sorted({slot for slots in free.values() for slot in slots})
+
+
+def pick_barber(shop, date, time, service=None):
+  """Первый по списку барбер, у которого в date/time помещается service, или None."""
+  barbers = get_active_barbers(shop)
+  free = get_available_slots_bulk([(barber.pk, date) for barber in barbers], service)
+  for barber in barbers:
+    if time in free[(barber.pk, date)]:
+      return barber
+  return None
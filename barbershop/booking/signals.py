@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import auth, edge_cache, reference, rollups, schedule
+from .models import Barber, Booking, ScheduleException, Service, Shop, SiteContent, UserProfile, WorkingHours
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def purge_booking_slots(sender, instance, **kwargs):
+  # Прошедшие даты в слотах не показываются (и массово удаляются при архивации)
+  if instance.booking_date >= timezone.localdate():
+    edge_cache.purge([edge_cache.barber_key(instance.barber_id)])
+
+
+@receiver(post_save, sender=Booking)
+def refresh_rollups(sender, instance, **kwargs):
+  # Прежний ключ — если запись перенесли на другой день, к другому барберу или на другую услугу
+  rollups.refresh_on_commit({rollups.key_of(instance), getattr(instance, '_loaded_rollup_key', (None, None, None))})
+  instance._loaded_rollup_key = rollups.key_of(instance)
+
+
+@receiver(post_delete, sender=Booking)
+def refresh_deleted_rollups(sender, instance, **kwargs):
+  # Архивация переносит запись с тем же ключом — пересчёт учтёт её копию в ArchivedBooking
+  rollups.refresh_on_commit({rollups.key_of(instance)})
+
+
+@receiver([post_save, post_delete], sender=Barber)
+def purge_barber(sender, instance, **kwargs):
+  reference.invalidate(instance.shop_id)
+  schedule.invalidate(instance.pk)
+  edge_cache.purge([edge_cache.home_key(instance.shop_id), edge_cache.barber_key(instance.pk)])
+
+
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=SiteContent)
+def purge_reference_data(sender, instance, **kwargs):
+  reference.invalidate(instance.shop_id)
+  edge_cache.purge([edge_cache.home_key(instance.shop_id)])
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def purge_shop(sender, instance, **kwargs):
+  reference.invalidate()
+  reference.invalidate(instance.pk)
+  schedule.invalidate(shop_id=instance.pk)
+  edge_cache.purge([edge_cache.home_key(instance.pk), edge_cache.slots_key(instance.pk)])
+
+
+@receiver([post_save, post_delete], sender=WorkingHours)
+@receiver([post_save, post_delete], sender=ScheduleException)
+def invalidate_schedule(sender, instance, **kwargs):
+  if instance.barber_id:
+    schedule.invalidate(instance.barber_id)
+    edge_cache.purge([edge_cache.barber_key(instance.barber_id)])
+  else:
+    schedule.invalidate(shop_id=instance.shop_id)
+    edge_cache.purge([edge_cache.slots_key(instance.shop_id), edge_cache.home_key(instance.shop_id)])
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_user(sender, instance, **kwargs):
+  auth.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile(sender, instance, **kwargs):
+  auth.invalidate(instance.user_id)
@@ -0,0 +1,51 @@
+"""
+Ранний отсев спама для форм записи: проверки идут в SpamGuardMiddleware до формы,
+без запросов к БД для анонимов — флуд обходится в подсчёт в кэше и HMAC.
+
+- лимит POST с одного IP или от одного пользователя (SPAM_GUARD_RATE_LIMIT за SPAM_GUARD_WINDOW секунд);
+- honeypot hp_field (то же поле, что проверяет BookingForm);
+- form_token — подписанное время выдачи формы: слишком быстрая отправка
+  (меньше SPAM_FORM_MIN_SECONDS) или устаревший токен отклоняются.
+Honeypot и form_token проверяются только у анонимов: вошедшие пользователи и клиенты API
+ограничены лимитами по пользователю.
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.utils.translation import gettext_lazy as _
+
+TOKEN_FIELD = 'form_token'
+HONEYPOT_FIELD = 'hp_field'
+REJECTED_MESSAGE = _("Спам-фильтр: отправка отклонена. Обновите страницу и попробуйте ещё раз.")
+
+_signer = signing.Signer(salt='booking.spam.form')
+
+
+def form_token(issued_at=None):
+  """Токен для скрытого поля формы; страницы из кэша прокси получают его из csrf_token_api."""
+  issued_at = time.time() if issued_at is None else issued_at
+  return _signer.sign(str(int(issued_at)))
+
+
+def token_age(token):
+  """Сколько секунд назад выдан токен; None, если подпись неверна."""
+  try:
+    return time.time() - int(_signer.unsign(token))
+  except (signing.BadSignature, ValueError, TypeError):
+    # TypeError — в JSON токен пришёл не строкой
+    return None
+
+
+def check_form(data):
+  """Причина отказа (honeypot, token, too_fast, expired) или None, если отправка похожа на человеческую."""
+  if data.get(HONEYPOT_FIELD):
+    return "honeypot"
+  age = token_age(data.get(TOKEN_FIELD, ''))
+  if age is None:
+    return "token"
+  if age < settings.SPAM_FORM_MIN_SECONDS:
+    return "too_fast"
+  if age > settings.SPAM_FORM_MAX_AGE:
+    return "expired"
+  return None
@@ -0,0 +1,70 @@
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError
+from django.template.loader import get_template
+from django.urls import get_resolver
+from django.utils import translation
+
+from . import db_pool, reference, schedule
+from .models import Barber
+from .utils import BASE_SLOT_MINUTES
+
+logger = logging.getLogger(__name__)
+
+
+def _booking_templates():
+  templates_dir = Path(apps.get_app_config('booking').path) / 'templates'
+  return sorted(p.relative_to(templates_dir).as_posix() for p in templates_dir.glob('booking/*.html'))
+
+
+def warm_up_process():
+  """
+  Прогрев без обращения к БД: URL resolver, каталоги переводов и шаблоны.
+  Безопасно вызывать в AppConfig.ready и в мастере Gunicorn до fork.
+  """
+  started = time.perf_counter()
+  resolver = get_resolver()
+  for code, _name in settings.LANGUAGES:
+    # activate() загружает каталог переводов, reverse_dict строится отдельно для каждого языка
+    with translation.override(code):
+      resolver.reverse_dict
+  for name in _booking_templates():
+    get_template(name)
+  elapsed_ms = (time.perf_counter() - started) * 1000
+  logger.info("Process warm-up finished in %.0f ms", elapsed_ms)
+  return elapsed_ms
+
+
+def _database_errors():
+  errors = [DatabaseError]
+  try:
+    import psycopg
+  except ImportError:
+    pass
+  else:
+    # PoolTimeout из pool.open — ошибка psycopg, Django её не оборачивает
+    errors.append(psycopg.Error)
+  return tuple(errors)
+
+
+def warm_up_worker():
+  """
+  Прогрев после fork: соединения с БД, кэши справочников и графики барберов.
+  Необязателен: если БД или пул недоступны, воркер всё равно запускается и прогревается
+  первыми запросами — иначе Gunicorn перезапускал бы падающий воркер по кругу.
+  """
+  started = time.perf_counter()
+  try:
+    db_pool.warm_up()
+    reference.warm_up()
+    barber_ids = Barber.objects.filter(is_active=True).values_list('pk', flat=True)
+    schedule.warm_up(list(barber_ids), BASE_SLOT_MINUTES)
+  except _database_errors() as exc:
+    logger.warning("Worker warm-up skipped, database is unavailable: %s", exc)
+  elapsed_ms = (time.perf_counter() - started) * 1000
+  logger.info("Worker warm-up finished in %.0f ms", elapsed_ms)
+  return elapsed_ms
@@ -0,0 +1,299 @@
+"""
+Telegram-бот для записи: long polling на asyncio поверх тех же слотов и BookingForm, что и сайт.
+
+Один процесс обслуживает тысячи чатов: состояние чата — компактный объект со __slots__,
+обновления из одного getUpdates обрабатываются пачкой (слоты для всех чатов пачки — одним
+запросом к БД), а чаты обрабатываются параллельно, сохраняя порядок внутри одного чата.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import time
+import urllib.request
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.utils.translation import gettext as _
+
+from . import outbox
+from .forms import BookingForm
+from .models import OutboxEvent
+from .reference import get_active_barbers, get_services
+from .utils import booking_write, get_available_slots_bulk
+
+logger = logging.getLogger(__name__)
+
+BOOKING_DAYS_AHEAD = 7
+SLOT_BUTTONS_PER_ROW = 4
+
+STEP_SERVICE = 1
+STEP_BARBER = 2
+STEP_DAY = 3
+STEP_TIME = 4
+STEP_NAME = 5
+STEP_PHONE = 6
+
+
+class BotApiError(Exception):
+  pass
+
+
+class BotApi:
+  """
+  Минимальный клиент Bot API. HTTP-вызовы блокирующие, поэтому уходят в пул потоков.
+  """
+
+  def __init__(self, token, base_url, timeout=10):
+    self.url = f"{base_url.rstrip('/')}/bot{token}/"
+    self.timeout = timeout
+
+  def _call(self, method, params, timeout):
+    request = urllib.request.Request(
+      self.url + method,
+      data=json.dumps(params).encode(),
+      headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+      result = json.loads(response.read())
+    if not result.get('ok'):
+      raise BotApiError(result.get('description', method))
+    return result.get('result')
+
+  async def call(self, method, http_timeout=None, **params):
+    return await asyncio.to_thread(self._call, method, params, http_timeout or self.timeout)
+
+
+class ChatState:
+  __slots__ = ('step', 'service_id', 'barber_id', 'day', 'time', 'name', 'touched')
+
+  def __init__(self):
+    self.step = STEP_SERVICE
+    self.service_id = None
+    self.barber_id = None
+    self.day = None  # date.toordinal()
+    self.time = None  # 'HH:MM'
+    self.name = None
+    self.touched = time.monotonic()
+
+
+class ChatStateStore:
+  """
+  Состояния чатов в памяти процесса: LRU с ограничением размера и временем жизни.
+  """
+
+  def __init__(self, max_chats=100_000, ttl=3600):
+    self.max_chats = max_chats
+    self.ttl = ttl
+    self._states = OrderedDict()
+
+  def __len__(self):
+    return len(self._states)
+
+  def get(self, chat_id):
+    state = self._states.get(chat_id)
+    now = time.monotonic()
+    if state is None or now - state.touched > self.ttl:
+      state = ChatState()
+      self._states[chat_id] = state
+    state.touched = now
+    self._states.move_to_end(chat_id)
+    while len(self._states) > self.max_chats:
+      self._states.popitem(last=False)
+    return state
+
+  def reset(self, chat_id):
+    self._states.pop(chat_id, None)
+
+
+def _keyboard(buttons, per_row=2):
+  rows = [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+  return {'inline_keyboard': [[{'text': text, 'callback_data': data} for text, data in row] for row in rows]}
+
+
+def _parse(update):
+  """(chat_id, kind, data) из update или None, если update нам не интересен."""
+  if 'callback_query' in update:
+    query = update['callback_query']
+    message = query.get('message') or {}
+    chat_id = (message.get('chat') or {}).get('id')
+    return chat_id, 'callback', (query.get('data') or '', query.get('id'))
+  message = update.get('message')
+  if message and 'text' in message:
+    return message['chat']['id'], 'text', message['text'].strip()
+  return None
+
+
+class BookingBot:
+  def __init__(self, api, shop, store=None, concurrency=200):
+    self.api = api
+    self.shop = shop
+    self.store = store or ChatStateStore()
+    self.offset = None
+    self._semaphore = asyncio.Semaphore(concurrency)
+
+  async def run(self, poll_timeout=25):
+    while True:
+      try:
+        await self.poll_once(poll_timeout)
+      except (OSError, ValueError, BotApiError) as exc:
+        logger.warning("getUpdates failed: %s", exc)
+        await asyncio.sleep(1)
+
+  async def poll_once(self, poll_timeout=25):
+    params = {'timeout': poll_timeout, 'allowed_updates': ['message', 'callback_query']}
+    if self.offset is not None:
+      params['offset'] = self.offset
+    updates = await self.api.call('getUpdates', http_timeout=poll_timeout + 10, **params)
+    if updates:
+      self.offset = updates[-1]['update_id'] + 1
+      await self.handle_updates(updates)
+    return len(updates)
+
+  async def handle_updates(self, updates):
+    by_chat = OrderedDict()
+    for update in updates:
+      parsed = _parse(update)
+      if parsed and parsed[0] is not None:
+        by_chat.setdefault(parsed[0], []).append(parsed[1:])
+
+    # Слоты, которые понадобятся в этой пачке, читаем одним запросом на услугу
+    wanted = set()
+    for chat_id, events in by_chat.items():
+      state = self.store.get(chat_id)
+      for kind, data in events:
+        if kind == 'callback' and data[0].startswith('day:') and data[0][4:].isdigit() and state.barber_id:
+          wanted.add((state.service_id, state.barber_id, datetime.date.fromordinal(int(data[0][4:]))))
+    slots = await sync_to_async(self._free_slots)(wanted) if wanted else {}
+
+    await asyncio.gather(*(self._handle_chat(chat_id, events, slots) for chat_id, events in by_chat.items()))
+
+  def _free_slots(self, wanted):
+    """{(service_id, barber_id, date): [time, ...]} — начала, от которых услуга помещается целиком."""
+    services = {service.pk: service for service in get_services(self.shop)}
+    by_service = {}
+    for service_id, barber_id, date in wanted:
+      by_service.setdefault(service_id, set()).add((barber_id, date))
+    slots = {}
+    for service_id, pairs in by_service.items():
+      for (barber_id, date), free in get_available_slots_bulk(pairs, services.get(service_id)).items():
+        slots[(service_id, barber_id, date)] = free
+    return slots
+
+  async def _handle_chat(self, chat_id, events, slots):
+    async with self._semaphore:
+      for kind, data in events:
+        try:
+          if kind == 'callback':
+            await self._on_callback(chat_id, data[0], data[1], slots)
+          else:
+            await self._on_text(chat_id, data)
+        except (OSError, ValueError, BotApiError) as exc:
+          logger.warning("Chat %s update failed: %s", chat_id, exc)
+
+  async def send(self, chat_id, text, keyboard=None):
+    params = {'chat_id': chat_id, 'text': text}
+    if keyboard:
+      params['reply_markup'] = keyboard
+    await self.api.call('sendMessage', **params)
+
+  async def _ask_service(self, chat_id):
+    services = await sync_to_async(get_services)(self.shop)
+    if not services:
+      await self.send(chat_id, _("Нет доступных услуг"))
+      return
+    buttons = [(f"{s.icon} {s.name} — {s.price} ₴", f"svc:{s.id}") for s in services]
+    await self.send(chat_id, _("Выберите услугу"), _keyboard(buttons, per_row=1))
+
+  async def _on_text(self, chat_id, text):
+    state = self.store.get(chat_id)
+    if text.startswith('/start') or text.startswith('/book'):
+      self.store.reset(chat_id)
+      self.store.get(chat_id)
+      await self._ask_service(chat_id)
+    elif state.step == STEP_NAME:
+      state.name = text[:100]
+      state.step = STEP_PHONE
+      await self.send(chat_id, _("Укажите номер телефона для связи."))
+    elif state.step == STEP_PHONE:
+      await self._book(chat_id, state, text)
+    else:
+      await self.send(chat_id, _("Чтобы записаться, отправьте /start"))
+
+  async def _on_callback(self, chat_id, data, query_id, slots):
+    if query_id:
+      await self.api.call('answerCallbackQuery', callback_query_id=query_id)
+    state = self.store.get(chat_id)
+    prefix, _sep, value = data.partition(':')
+
+    if prefix == 'svc' and value.isdigit():
+      state.service_id = int(value)
+      state.step = STEP_BARBER
+      barbers = await sync_to_async(get_active_barbers)(self.shop)
+      buttons = [(b.name, f"brb:{b.id}") for b in barbers]
+      await self.send(chat_id, _("Выберите барбера"), _keyboard(buttons))
+
+    elif prefix == 'brb' and value.isdigit() and state.service_id:
+      state.barber_id = int(value)
+      state.step = STEP_DAY
+      today = datetime.date.today()
+      days = [today + datetime.timedelta(days=i) for i in range(BOOKING_DAYS_AHEAD)]
+      buttons = [(d.strftime('%d.%m'), f"day:{d.toordinal()}") for d in days]
+      await self.send(chat_id, _("Выберите дату"), _keyboard(buttons, per_row=SLOT_BUTTONS_PER_ROW))
+
+    elif prefix == 'day' and value.isdigit() and state.barber_id:
+      state.day = int(value)
+      state.step = STEP_TIME
+      key = (state.service_id, state.barber_id, datetime.date.fromordinal(state.day))
+      if key not in slots:
+        # Барбера выбрали в этой же пачке — слоты не были прочитаны заранее
+        slots = await sync_to_async(self._free_slots)({key})
+      free = slots[key]
+      if not free:
+        await self.send(chat_id, _("Нет свободных слотов на выбранную дату"))
+        return
+      buttons = [(t.strftime('%H:%M'), f"tm:{t.strftime('%H:%M')}") for t in free]
+      await self.send(chat_id, _("Выберите время"), _keyboard(buttons, per_row=SLOT_BUTTONS_PER_ROW))
+
+    elif prefix == 'tm' and state.day:
+      state.time = value
+      state.step = STEP_NAME
+      await self.send(chat_id, _("Введите ваше имя, чтобы мы смогли подтвердить запись."))
+
+    else:
+      await self.send(chat_id, _("Чтобы записаться, отправьте /start"))
+
+  async def _book(self, chat_id, state, phone):
+    booking, errors = await sync_to_async(create_booking)(self.shop, state, phone)
+    if booking:
+      self.store.reset(chat_id)
+      await self.send(chat_id, _("Запись создана, мы свяжемся с вами для подтверждения."))
+      return
+    messages = [str(err) for errs in errors.values() for err in errs]
+    if 'client_phone' not in errors:
+      # Слот заняли или данные устарели — начинаем заново
+      self.store.reset(chat_id)
+      messages.append(_("Чтобы записаться, отправьте /start"))
+    await self.send(chat_id, ' '.join(messages))
+
+
+def create_booking(shop, state, phone):
+  """
+  Та же валидация, что и у booking_api: BookingForm внутри booking_write.
+  Возвращает (booking, {}) или (None, form.errors).
+  """
+  form = BookingForm({
+    'client_name': state.name,
+    'client_phone': phone,
+    'barber': state.barber_id,
+    'service': state.service_id,
+    'booking_date': datetime.date.fromordinal(state.day).isoformat(),
+    'booking_time': state.time,
+    'message': _("Запись через Telegram"),
+  }, shop=shop)
+  with booking_write(state.barber_id):
+    if form.is_valid():
+      booking = form.save()
+      outbox.record(OutboxEvent.EVENT_CREATED, booking)
+      return booking, {}
+  return None, form.errors
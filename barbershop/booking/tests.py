@@ -1,15 +1,57 @@
-from django.test import TestCase
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.http import HttpResponse
+from django.db import OperationalError, connection, transaction
+from django.core import mail
+from django.core.management import call_command
+from django.core.exceptions import PermissionDenied
+from django.core.management.base import CommandError
 from django.urls import reverse
 from django.core.cache import cache
+from django.contrib.auth.models import User
 
+from unittest import mock, skipUnless
 import datetime
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
-from booking.models import Booking, Barber, Service
+from booking.models import (
+    Booking, ArchivedBooking, Barber, Service, Shop, OutboxEvent, BookingReminder, WorkingHours, ScheduleException,
+    WaitlistEntry, DailyRollup, IdempotencyKey, UserProfile, Client,
+)
+from booking.reminders import ReminderScheduler
+from django.utils import timezone
+from booking import outbox
 from booking.utils import get_available_slots
+from booking import reference
+from booking import ics
+from booking import schedule
+from booking import search
+from booking import transitions
+from booking import waitlist
+from booking import rollups
+from booking import idempotency
+from booking import clients
+from booking import fulltext
+from booking import spam
+from booking import auth
+from booking.auth import ProfileBackend
+from django.test.client import encode_multipart
+from django.test.utils import CaptureQueriesContext
+from booking.db_router import PRIMARY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, read_replica
+from booking.startup import warm_up_process, warm_up_worker
+from booking.telegram_bot import BookingBot, BotApi, ChatStateStore, STEP_DAY
+from asgiref.sync import async_to_sync
+from psycopg_pool import PoolTimeout
 
 
 from .utils import generate_slot
 
+# Токен формы, выданный минуту назад: проходит проверку SpamGuardMiddleware
+FORM_TOKEN = spam.form_token(time.time() - 60)
+
 class TimeSlotTest(TestCase):
 
   def test_generate_slot_count(self):
@@ -62,6 +104,7 @@ class BookingApiTests(TestCase):
         )
 
         payload = {
+            "form_token": FORM_TOKEN,
             "client_name": "Kostya",
             "client_phone": "*380092123456",
             "client_email": "k@example.com",
@@ -109,6 +152,7 @@ class BookingApiTests(TestCase):
       )
 
       payload = {
+          "form_token": FORM_TOKEN,
           "client_name": "Kostya",
           "client_phone": "+380501234567",
           "client_email": "k@example.com",
@@ -151,6 +195,7 @@ class BookingApiTests(TestCase):
       )
 
       payload = {
+          "form_token": FORM_TOKEN,
           "client_name": "Kostya",
           "client_phone": "+380501234567",
           "client_email": "k@example.com",
@@ -175,3 +220,1748 @@ class BookingApiTests(TestCase):
 
       # в базе только одна бронь на этот слот
       self.assertEqual(Booking.objects.count(), 1)
+
+
+class LanguageNegotiationTests(TestCase):
+    def test_root_is_served_without_redirect(self):
+        response = self.client.get("/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Language"], "ru")
+
+    def test_root_negotiates_from_accept_language(self):
+        response = self.client.get("/", HTTP_ACCEPT_LANGUAGE="en-US,en;q=0.9")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Language"], "en")
+        vary = {v.strip() for v in response["Vary"].split(",")}
+        self.assertIn("Accept-Language", vary)
+        self.assertIn("Cookie", vary)
+
+    def test_root_prefers_language_cookie(self):
+        self.client.cookies["django_language"] = "uk"
+        response = self.client.get("/", HTTP_ACCEPT_LANGUAGE="en")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Language"], "uk")
+
+    def test_prefixed_url_keeps_its_language(self):
+        response = self.client.get("/en/", HTTP_ACCEPT_LANGUAGE="uk")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Language"], "en")
+
+
+class PurgeRecorder(BaseHTTPRequestHandler):
+    """Локальная замена прокси: запоминает полученные PURGE-запросы."""
+    received = []
+
+    def do_PURGE(self):
+        PurgeRecorder.received.append(self.headers.get("Surrogate-Key"))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class EdgeCacheTests(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+
+    def test_anonymous_home_is_public(self):
+        response = self.client.get(reverse("home"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("s-maxage=300", response["Cache-Control"])
+        self.assertEqual(response["Surrogate-Key"], f"home-{self.barber.shop_id}")
+        self.assertNotIn("csrftoken", response.cookies)
+        vary = {v.strip() for v in response["Vary"].split(",")}
+        self.assertTrue({"Cookie", "Accept-Language"} <= vary)
+
+    def test_authenticated_home_is_private(self):
+        user = User.objects.create_user(username="client", password="pass12345")
+        self.client.force_login(user)
+        response = self.client.get(reverse("home"))
+
+        self.assertIn("private", response["Cache-Control"])
+        self.assertFalse(response.has_header("Surrogate-Key"))
+
+    def test_slots_carry_barber_surrogate_key(self):
+        response = self.client.get(reverse("available_slots_api"), {
+            "barber": self.barber.id,
+            "booking_date": "2030-01-01",
+        })
+
+        self.assertIn("public", response["Cache-Control"])
+        self.assertEqual(response["Surrogate-Key"], f"slots-{self.barber.shop_id} barber-{self.barber.id}")
+
+    def test_non_numeric_barber_adds_no_surrogate_key(self):
+        for barber in (f"{self.barber.id}\r\nX-Injected: 1", f"{self.barber.id} home-999"):
+            with self.subTest(barber=barber):
+                response = self.client.get(reverse("available_slots_api"), {
+                    "barber": barber,
+                    "booking_date": "2030-01-01",
+                })
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["Surrogate-Key"], f"slots-{self.barber.shop_id}")
+
+                response = self.client.get(reverse("home"), {"barber": barber})
+                self.assertEqual(response["Surrogate-Key"], f"home-{self.barber.shop_id}")
+
+    def test_csrf_endpoint_is_not_cached(self):
+        response = self.client.get(reverse("csrf_token_api"))
+
+        self.assertTrue(response.json()["token"])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_booking_change_purges_barber_key(self):
+        server = HTTPServer(("127.0.0.1", 0), PurgeRecorder)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        PurgeRecorder.received = []
+        service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+
+        url = f"http://127.0.0.1:{server.server_port}/"
+        with override_settings(EDGE_CACHE_PURGE_URL=url):
+            with self.captureOnCommitCallbacks(execute=True):
+                Booking.objects.create(
+                    client_name="Test",
+                    client_phone="+380501234567",
+                    barber=self.barber,
+                    service=service,
+                    booking_date=datetime.date(2030, 1, 1),
+                    booking_time=datetime.time(10, 0),
+                )
+
+        self.assertEqual(PurgeRecorder.received, [f"barber-{self.barber.id}"])
+
+
+class DbHealthTests(TestCase):
+    def test_health_reports_ok_without_pools_on_sqlite(self):
+        response = self.client.get(reverse("db_health"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"ok": True, "pools": {}})
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_connection_benchmark_requires_postgres(self):
+        with self.assertRaises(CommandError):
+            call_command("bench_db_connections", iterations=1)
+
+
+class StartupWarmUpTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_process_warm_up_runs_without_database(self):
+        with self.assertNumQueries(0):
+            elapsed_ms = warm_up_process()
+
+        self.assertGreaterEqual(elapsed_ms, 0)
+
+    def test_worker_warm_up_fills_reference_cache(self):
+        Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        warm_up_worker()
+        shop = Shop.objects.default()
+
+        with self.assertNumQueries(0):
+            services = reference.get_services(shop)
+            reference.get_site_content(shop)
+
+        self.assertEqual([s.name for s in services], ["Haircut"])
+
+    def test_worker_warm_up_survives_unavailable_database(self):
+        for error in (OperationalError("connection refused"), PoolTimeout("couldn't get a connection")):
+            with self.subTest(error=type(error).__name__), mock.patch("booking.db_pool.warm_up", side_effect=error):
+                with self.assertLogs("booking.startup", "WARNING"):
+                    elapsed_ms = warm_up_worker()
+                self.assertGreaterEqual(elapsed_ms, 0)
+
+    def test_reference_cache_is_invalidated_on_change(self):
+        shop = Shop.objects.default()
+        reference.get_active_barbers(shop)
+        Barber.objects.create(name="New Barber", is_active=True)
+
+        self.assertEqual([b.name for b in reference.get_active_barbers(shop)], ["New Barber"])
+
+
+class SqliteProfileTests(TestCase):
+    def test_connection_uses_production_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            synchronous = cursor.fetchone()[0]
+            cursor.execute("PRAGMA cache_size")
+            cache_size = cursor.fetchone()[0]
+
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+        self.assertEqual(synchronous, 1)  # NORMAL
+        self.assertEqual(cache_size, -20000)
+
+    def test_write_benchmark_rejects_in_memory_database(self):
+        with self.assertRaises(CommandError):
+            call_command("bench_booking_writes", workers=1, days=1)
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    """Локальная замена Bot API: запоминает sendMessage и отвечает ok."""
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        FakeTelegram.received.append((self.path, json.loads(body)))
+        if len(json.loads(body)["text"]) > 4096:
+            payload = b'{"ok": false, "description": "Bad Request: message is too long"}'
+            self.send_response(400)
+        else:
+            payload = b'{"ok": true, "result": {}}'
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        server = HTTPServer(("127.0.0.1", 0), FakeTelegram)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        FakeTelegram.received = []
+        self.telegram_url = f"http://127.0.0.1:{server.server_port}"
+
+    def book(self, time):
+        return self.client.post(reverse("booking_api"), data={
+            "form_token": FORM_TOKEN,
+            "client_name": "Kostya",
+            "client_phone": "+380501234567",
+            "client_email": "k@example.com",
+            "barber": self.barber.id,
+            "service": self.service.id,
+            "booking_date": "2030-01-01",
+            "booking_time": time,
+        })
+
+    def test_booking_writes_event_without_sending(self):
+        self.book("10:00")
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.event_type, OutboxEvent.EVENT_CREATED)
+        self.assertEqual(event.status, OutboxEvent.STATUS_PENDING)
+        self.assertEqual(event.payload["booking_time"], "10:00")
+        self.assertEqual(mail.outbox, [])
+
+    def test_dispatch_batches_email_and_telegram(self):
+        with self.settings(TELEGRAM_BOT_TOKEN="token", TELEGRAM_STAFF_CHAT_ID="42",
+                           TELEGRAM_API_URL=self.telegram_url):
+            self.book("10:00")
+            self.book("11:00")
+            sent, failed = outbox.dispatch_batch()
+
+        self.assertEqual((sent, failed), (4, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ["k@example.com"])
+        self.assertEqual(len(FakeTelegram.received), 1)
+        path, body = FakeTelegram.received[0]
+        self.assertEqual(path, "/bottoken/sendMessage")
+        self.assertEqual(body["chat_id"], "42")
+        self.assertEqual(len(body["text"].splitlines()), 2)
+        self.assertFalse(OutboxEvent.objects.exclude(status=OutboxEvent.STATUS_SENT).exists())
+
+    def test_long_telegram_batch_is_split_into_messages(self):
+        self.book("10:00")
+        booking = Booking.objects.get()
+        with self.settings(TELEGRAM_BOT_TOKEN="token", TELEGRAM_STAFF_CHAT_ID="42",
+                           TELEGRAM_API_URL=self.telegram_url):
+            for _ in range(60):
+                outbox.record(OutboxEvent.EVENT_CREATED, booking, channels=[OutboxEvent.CHANNEL_TELEGRAM])
+            sent, failed = outbox.dispatch_batch()
+
+        self.assertEqual((sent, failed), (61, 0))
+        texts = [body["text"] for _, body in FakeTelegram.received]
+        self.assertGreater(len(texts), 1)
+        self.assertGreater(sum(len(text) + 1 for text in texts), 4096)
+        self.assertTrue(all(len(text) <= 4096 for text in texts))
+        self.assertEqual(sum(len(text.splitlines()) for text in texts), 60)
+
+    def test_failed_delivery_is_retried_later(self):
+        with self.settings(TELEGRAM_BOT_TOKEN="token", TELEGRAM_STAFF_CHAT_ID="42",
+                           TELEGRAM_API_URL="http://127.0.0.1:9"):
+            self.book("10:00")
+            with self.assertLogs("booking.outbox", "WARNING"):
+                sent, failed = outbox.dispatch_batch()
+
+        self.assertEqual((sent, failed), (1, 1))
+        event = OutboxEvent.objects.get(channel=OutboxEvent.CHANNEL_TELEGRAM)
+        self.assertEqual(event.status, OutboxEvent.STATUS_PENDING)
+        self.assertEqual(event.attempts, 1)
+        self.assertTrue(event.last_error)
+        self.assertEqual(outbox.dispatch_batch(), (0, 0))
+
+
+class FakeBotApi(BaseHTTPRequestHandler):
+    """Локальная замена Bot API для бота: отдаёт очередь updates и запоминает ответы."""
+    updates = []
+    sent = []
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        params = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if method == "getUpdates":
+            result, FakeBotApi.updates = FakeBotApi.updates, []
+        else:
+            FakeBotApi.sent.append((method, params))
+            result = True
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TelegramBotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(icon="✂", name="Haircut", price=25.00, duration_minutes=30)
+        server = HTTPServer(("127.0.0.1", 0), FakeBotApi)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        FakeBotApi.updates, FakeBotApi.sent = [], []
+        self.bot = BookingBot(BotApi("token", f"http://127.0.0.1:{server.server_port}"), Shop.objects.default())
+        self.update_id = 0
+
+    def message(self, chat_id, text):
+        self.update_id += 1
+        return {"update_id": self.update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+    def callback(self, chat_id, data):
+        self.update_id += 1
+        return {"update_id": self.update_id, "callback_query": {
+            "id": str(self.update_id), "data": data, "message": {"chat": {"id": chat_id}},
+        }}
+
+    def replies(self):
+        return [p["text"] for method, p in FakeBotApi.sent if method == "sendMessage"]
+
+    def test_full_booking_flow_over_long_polling(self):
+        day = (datetime.date.today() + datetime.timedelta(days=1)).toordinal()
+        steps = [
+            [self.message(7, "/start")],
+            [self.callback(7, f"svc:{self.service.id}")],
+            [self.callback(7, f"brb:{self.barber.id}")],
+            [self.callback(7, f"day:{day}")],
+            [self.callback(7, "tm:10:00")],
+            [self.message(7, "Kostya")],
+            [self.message(7, "+380501234567")],
+        ]
+        for updates in steps:
+            FakeBotApi.updates = updates
+            self.assertEqual(async_to_sync(self.bot.poll_once)(poll_timeout=0), 1)
+
+        booking = Booking.objects.get()
+        self.assertEqual(booking.client_name, "Kostya")
+        self.assertEqual(booking.booking_time, datetime.time(10, 0))
+        self.assertEqual(booking.booking_date, datetime.date.fromordinal(day))
+        self.assertEqual(self.replies()[-1], "Запись создана, мы свяжемся с вами для подтверждения.")
+        self.assertEqual(self.bot.offset, self.update_id + 1)
+
+    def test_slots_for_many_chats_are_read_in_one_query(self):
+        day = (datetime.date.today() + datetime.timedelta(days=1)).toordinal()
+        for chat_id in (1, 2, 3):
+            state = self.bot.store.get(chat_id)
+            state.service_id, state.barber_id, state.step = self.service.id, self.barber.id, STEP_DAY
+        # Графики и справочник услуг уже в кэше, как после прогрева воркера
+        schedule.warm_up([self.barber.id], 30)
+        reference.get_services(self.bot.shop)
+
+        with self.assertNumQueries(1):
+            async_to_sync(self.bot.handle_updates)([self.callback(c, f"day:{day}") for c in (1, 2, 3)])
+
+        self.assertEqual(len(self.replies()), 3)
+
+    def test_taken_slot_is_rejected_by_form_validation(self):
+        date = datetime.date.today() + datetime.timedelta(days=1)
+        Booking.objects.create(client_name="Other", client_phone="+380501234567", barber=self.barber,
+                               service=self.service, booking_date=date, booking_time=datetime.time(10, 0))
+        state = self.bot.store.get(9)
+        state.service_id, state.barber_id, state.day = self.service.id, self.barber.id, date.toordinal()
+        state.time, state.name, state.step = "10:00", "Kostya", 6
+
+        async_to_sync(self.bot.handle_updates)([self.message(9, "+380501234567")])
+
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertIn("Это время уже занято", self.replies()[-1])
+
+    def test_state_store_evicts_least_recently_used_chats(self):
+        store = ChatStateStore(max_chats=2)
+        store.get(1)
+        store.get(2)
+        store.get(1)
+        store.get(3)
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(list(store._states), [1, 3])
+
+
+class ReminderSchedulerTests(TestCase):
+    def setUp(self):
+        self.base = timezone.now().replace(second=0, microsecond=0)
+        self.clock = [self.base]
+        barber = Barber.objects.create(name="Test Barber", is_active=True)
+        service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        at = timezone.localtime(self.base + datetime.timedelta(hours=30))
+        self.booking = Booking.objects.create(
+            client_name="Kostya",
+            client_phone="+380501234567",
+            client_email="k@example.com",
+            barber=barber,
+            service=service,
+            booking_date=at.date(),
+            booking_time=at.time(),
+        )
+
+    def scheduler(self):
+        scheduler = ReminderScheduler(leads_minutes=[24 * 60, 120], now=lambda: self.clock[0])
+        scheduler.refill()
+        return scheduler
+
+    def advance(self, hours):
+        self.clock[0] = self.base + datetime.timedelta(hours=hours)
+
+    def test_reminders_fire_once_per_lead(self):
+        scheduler = self.scheduler()
+        self.assertEqual(scheduler.fire_due(), 0)
+
+        self.advance(6)
+        self.assertEqual(scheduler.fire_due(), 1)
+        self.advance(28)
+        self.assertEqual(scheduler.fire_due(), 1)
+
+        self.assertEqual(sorted(BookingReminder.objects.values_list("lead_minutes", flat=True)), [120, 1440])
+        event = OutboxEvent.objects.filter(event_type=OutboxEvent.EVENT_REMINDER).first()
+        self.assertEqual(event.channel, OutboxEvent.CHANNEL_EMAIL)
+
+    def test_restart_does_not_send_twice(self):
+        self.advance(6)
+        self.assertEqual(self.scheduler().fire_due(), 1)
+        self.assertEqual(self.scheduler().fire_due(), 0)
+
+        self.assertEqual(BookingReminder.objects.count(), 1)
+
+    def test_reschedule_is_picked_up_incrementally(self):
+        scheduler = self.scheduler()
+        new_at = timezone.localtime(self.base + datetime.timedelta(hours=26))
+        self.booking.booking_date, self.booking.booking_time = new_at.date(), new_at.time()
+        self.booking.save()
+
+        self.advance(3)
+        scheduler.poll_changes()
+        self.assertEqual(scheduler.fire_due(), 1)
+        self.advance(7)
+        self.assertEqual(scheduler.fire_due(), 0)
+
+        reminder = BookingReminder.objects.get()
+        self.assertEqual(reminder.appointment_at, self.base + datetime.timedelta(hours=26))
+
+    def test_late_commit_is_picked_up_by_overlapping_poll(self):
+        scheduler = self.scheduler()
+        self.advance(1)
+        scheduler.poll_changes()
+        # updated_at раньше прошлого опроса: транзакция закоммитилась уже после него
+        at = timezone.localtime(self.base + datetime.timedelta(hours=28))
+        late = Booking.objects.create(
+            client_name="Oleg", client_phone="+380501234568", client_email="o@example.com",
+            barber=self.booking.barber, service=self.booking.service,
+            booking_date=at.date(), booking_time=at.time(),
+        )
+        Booking.objects.filter(pk=late.pk).update(updated_at=self.clock[0] - datetime.timedelta(minutes=1))
+
+        self.advance(1.5)
+        scheduler.poll_changes()
+        scheduler.poll_changes()
+        self.assertEqual(len(scheduler), 4)
+
+        self.advance(6)
+        self.assertEqual(scheduler.fire_due(), 2)
+        self.assertEqual(scheduler.fire_due(), 0)
+
+    def test_canceled_booking_gets_no_reminder(self):
+        scheduler = self.scheduler()
+        self.booking.status = Booking.STATUS_CANCELED
+        self.booking.save()
+
+        self.advance(29)
+        self.assertEqual(scheduler.fire_due(), 0)
+        self.assertFalse(BookingReminder.objects.exists())
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=45)
+        self.booking = Booking.objects.create(
+            client_name="Ivan, Jr.",
+            client_phone="+380501234567",
+            barber=self.barber,
+            service=self.service,
+            booking_date=timezone.localdate() + datetime.timedelta(days=1),
+            booking_time=datetime.time(10, 0),
+        )
+        self.url = ics.feed_url(self.barber.id)
+
+    def test_requires_signed_key(self):
+        response = self.client.get(reverse("calendar_feed", args=[self.barber.id]) + "?key=wrong")
+        self.assertEqual(response.status_code, 404)
+
+    def test_feed_contains_escaped_event(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/calendar"))
+        body = response.content.decode()
+        self.assertIn(f"UID:booking-{self.booking.id}@", body)
+        self.assertIn("SUMMARY:Haircut: Ivan\\, Jr.", body)
+        self.assertIn("STATUS:TENTATIVE", body)
+        self.assertTrue(body.endswith("END:VCALENDAR\r\n"))
+
+    def test_unchanged_feed_is_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        # Барбер и агрегат для ETag — сами записи не читаются
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.booking.status = Booking.STATUS_CANCELED
+        self.booking.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("STATUS:CANCELLED", response.content.decode())
+
+    def test_only_changed_events_are_rendered(self):
+        other = Booking.objects.create(
+            client_name="Petro",
+            client_phone="+380501234568",
+            barber=self.barber,
+            service=self.service,
+            booking_date=self.booking.booking_date,
+            booking_time=datetime.time(11, 0),
+        )
+        self.client.get(self.url)
+        other.status = Booking.STATUS_CONFIRMED
+        other.save()
+
+        rendered = []
+        original = ics.render_event
+        ics.render_event = lambda booking: rendered.append(booking.id) or original(booking)
+        try:
+            self.client.get(self.url)
+        finally:
+            ics.render_event = original
+        self.assertEqual(rendered, [other.id])
+
+    def test_long_lines_are_folded(self):
+        folded = ics._fold("DESCRIPTION:" + "ж" * 60)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in folded.split("\r\n")))
+        self.assertEqual(folded.replace("\r\n ", ""), "DESCRIPTION:" + "ж" * 60)
+
+
+class BarberScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        today = datetime.date.today()
+        self.monday = today + datetime.timedelta(days=7 - today.weekday())
+        WorkingHours.objects.create(
+            barber=self.barber,
+            weekday=0,
+            start_time=datetime.time(10, 0),
+            end_time=datetime.time(14, 0),
+            break_start=datetime.time(12, 0),
+            break_end=datetime.time(12, 30),
+        )
+
+    def tearDown(self):
+        # id барберов в тестах повторяются, скомпилированный график не должен переживать тест
+        cache.clear()
+
+    def times(self, date):
+        return [t.strftime("%H:%M") for t in get_available_slots(self.barber, date)]
+
+    def test_weekly_hours_with_break_and_bookings(self):
+        Booking.objects.create(
+            client_name="Ivan",
+            client_phone="+380501234567",
+            barber=self.barber,
+            service=self.service,
+            booking_date=self.monday,
+            booking_time=datetime.time(11, 0),
+        )
+        self.assertEqual(self.times(self.monday), ["10:00", "10:30", "11:30", "12:30", "13:00", "13:30"])
+        # Вторника в графике нет — выходной
+        self.assertEqual(self.times(self.monday + datetime.timedelta(days=1)), [])
+
+    def test_barber_without_schedule_uses_default_hours(self):
+        other = Barber.objects.create(name="Other", is_active=True)
+        self.assertEqual(get_available_slots(other, self.monday), generate_slot(self.monday))
+
+    def test_holiday_and_barber_exception(self):
+        ScheduleException.objects.create(date=self.monday, note="Holiday")
+        self.assertEqual(self.times(self.monday), [])
+
+        ScheduleException.objects.create(
+            barber=self.barber, date=self.monday, start_time=datetime.time(15, 0), end_time=datetime.time(16, 0)
+        )
+        self.assertEqual(self.times(self.monday), ["15:00", "15:30"])
+
+    def test_compiled_schedule_is_cached_until_changed(self):
+        self.times(self.monday)
+        # Из БД читаются только брони
+        with self.assertNumQueries(1):
+            self.times(self.monday)
+
+        hours = WorkingHours.objects.get()
+        hours.end_time = datetime.time(11, 0)
+        hours.save()
+        self.assertEqual(self.times(self.monday), ["10:00", "10:30"])
+
+
+class ShopTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.main = Shop.objects.default()
+        self.other = Shop.objects.create(name="Podil", slug="podil", domain="podil.example.com")
+        self.main_barber = Barber.objects.create(name="Main Barber", is_active=True)
+        self.other_barber = Barber.objects.create(shop=self.other, name="Podil Barber", is_active=True)
+        self.other_service = Service.objects.create(shop=self.other, name="Fade", price=30.00)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_shop_is_resolved_by_host(self):
+        response = self.client.get(reverse("home"), HTTP_HOST="podil.example.com")
+        self.assertEqual([b.name for b in response.context["barbers"]], ["Podil Barber"])
+        self.assertEqual(response["Surrogate-Key"], f"home-{self.other.pk}")
+
+        response = self.client.get(reverse("home"))
+        self.assertEqual([b.name for b in response.context["barbers"]], ["Main Barber"])
+
+    def test_other_shop_barber_is_not_bookable(self):
+        response = self.client.post(reverse("booking_api"), {
+            "form_token": FORM_TOKEN,
+            "client_name": "Kostya",
+            "client_phone": "+380501234567",
+            "barber": self.other_barber.id,
+            "service": self.other_service.id,
+            "booking_date": "2030-01-01",
+            "booking_time": "10:00",
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("barber", response.json()["errors"])
+
+    def test_booking_inherits_barber_shop(self):
+        response = self.client.post(reverse("booking_api"), {
+            "form_token": FORM_TOKEN,
+            "client_name": "Kostya",
+            "client_phone": "+380501234567",
+            "barber": self.other_barber.id,
+            "service": self.other_service.id,
+            "booking_date": "2030-01-01",
+            "booking_time": "10:00",
+        }, HTTP_HOST="podil.example.com")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Booking.objects.get().shop, self.other)
+
+    def test_default_shop_is_resolved_on_save_not_on_construction(self):
+        Shop.objects.filter(pk=self.main.pk).delete()
+        with self.assertNumQueries(0):
+            barber = Barber(name="New Barber")
+        self.assertFalse(Shop.objects.filter(slug=self.main.slug).exists())
+        barber.save()
+        self.assertEqual(barber.shop.slug, self.main.slug)
+
+    def test_partial_save_keeps_shop_without_reading_barber(self):
+        booking = Booking.objects.create(client_name="Kostya", client_phone="+380501234567", barber=self.other_barber,
+                                         service=self.other_service, booking_date=datetime.date(2030, 1, 1),
+                                         booking_time=datetime.time(10, 0))
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.status = Booking.STATUS_CONFIRMED
+        with self.assertNumQueries(1):
+            booking.save(update_fields=["status"])
+
+        booking.barber = self.main_barber
+        booking.save(update_fields=["barber"])
+        self.assertEqual(Booking.objects.get(pk=booking.pk).shop, self.main)
+
+    def test_reference_cache_is_namespaced_per_shop(self):
+        reference.get_active_barbers(self.main)
+        reference.get_active_barbers(self.other)
+        Barber.objects.create(shop=self.other, name="New Podil Barber", is_active=True)
+
+        with self.assertNumQueries(0):
+            reference.get_active_barbers(self.main)
+        self.assertEqual(len(reference.get_active_barbers(self.other)), 2)
+
+    def test_holiday_applies_only_to_its_shop(self):
+        date = datetime.date.today() + datetime.timedelta(days=3)
+        ScheduleException.objects.create(shop=self.other, date=date, note="Holiday")
+
+        self.assertEqual(get_available_slots(self.other_barber, date), [])
+        self.assertEqual(get_available_slots(self.main_barber, date), generate_slot(date))
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.seen = []
+
+    def run_view(self, view, cookies=None):
+        request = RequestFactory().get("/")
+        request.COOKIES.update(cookies or {})
+        return ReplicaRoutingMiddleware(view)(request)
+
+    def test_only_marked_reads_go_to_replica(self):
+        def view(request):
+            self.seen.append(self.router.db_for_read(Booking))
+            with read_replica():
+                self.seen.append(self.router.db_for_read(Booking))
+            return HttpResponse()
+
+        response = self.run_view(view)
+        self.assertEqual(self.seen, ["default", "replica"])
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_STICKY_SECONDS=15)
+    def test_write_pins_user_to_primary(self):
+        @read_replica()
+        def view(request):
+            self.seen.append(self.router.db_for_read(Booking))
+            self.assertEqual(self.router.db_for_write(Booking), "default")
+            self.seen.append(self.router.db_for_read(Booking))
+            return HttpResponse()
+
+        response = self.run_view(view)
+        self.assertEqual(self.seen, ["replica", "default"])
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]["max-age"], 15)
+
+        self.seen = []
+        self.run_view(view, cookies={PRIMARY_COOKIE: "1"})
+        self.assertEqual(self.seen[0], "default")
+
+    def test_outside_request_reads_use_primary(self):
+        with read_replica():
+            self.assertEqual(self.router.db_for_read(Booking), "default")
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="client", password="pass12345")
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        today = timezone.localdate()
+        self.old = [self.book(today - datetime.timedelta(days=100 + i)) for i in range(5)]
+        self.recent = self.book(today - datetime.timedelta(days=3))
+
+    def book(self, date, **extra):
+        return Booking.objects.create(
+            client_name="Kostya",
+            client_phone="+380501234567",
+            user=self.user,
+            barber=self.barber,
+            service=self.service,
+            booking_date=date,
+            booking_time=datetime.time(10, 0),
+            status=Booking.STATUS_COMPLETED,
+            **extra,
+        )
+
+    def test_old_bookings_move_in_chunks(self):
+        event = OutboxEvent.objects.create(
+            event_type=OutboxEvent.EVENT_CREATED, channel=OutboxEvent.CHANNEL_EMAIL, booking=self.old[0]
+        )
+        call_command("archive_bookings", "--days", "90", "--chunk-size", "2", stdout=io.StringIO())
+
+        self.assertEqual(list(Booking.objects.values_list("id", flat=True)), [self.recent.id])
+        self.assertEqual(
+            sorted(ArchivedBooking.objects.values_list("id", flat=True)), sorted(b.id for b in self.old)
+        )
+        archived = ArchivedBooking.objects.get(id=self.old[0].id)
+        self.assertEqual((archived.status, archived.shop_id), (Booking.STATUS_COMPLETED, self.barber.shop_id))
+        event.refresh_from_db()
+        self.assertIsNone(event.booking_id)
+
+    def test_dashboard_lists_archived_visits(self):
+        call_command("archive_bookings", "--days", "90", stdout=io.StringIO())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("dashboard"))
+
+        past = response.context["past_bookings"]
+        self.assertEqual([b.id for b in past], [self.recent.id] + [b.id for b in self.old])
+        self.assertTrue(past[-1].is_archived)
+
+
+@override_settings(WAITLIST_NOTIFY_LIMIT=2)
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="client", password="pass12345")
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.other = Barber.objects.create(name="Other Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        self.day = timezone.localdate() + datetime.timedelta(days=3)
+        self.booking = Booking.objects.create(
+            client_name="Kostya",
+            client_phone="+380501234567",
+            user=self.user,
+            barber=self.barber,
+            service=self.service,
+            booking_date=self.day,
+            booking_time=datetime.time(12, 0),
+        )
+
+    def wait(self, name, barber=None, time_from=datetime.time(10, 0), time_to=datetime.time(14, 0)):
+        return WaitlistEntry.objects.create(
+            shop=self.barber.shop,
+            client_name=name,
+            client_phone="+380501112233",
+            client_email=f"{name.lower()}@example.com",
+            barber=barber,
+            service=self.service,
+            date_from=self.day - datetime.timedelta(days=1),
+            date_to=self.day + datetime.timedelta(days=1),
+            time_from=time_from,
+            time_to=time_to,
+        )
+
+    def test_cancel_notifies_queue_in_order_up_to_limit(self):
+        first = self.wait("Anna", barber=self.barber)
+        second = self.wait("Boris")
+        third = self.wait("Vera", barber=self.barber)
+        self.wait("Other", barber=self.other)
+        self.wait("Late", time_from=datetime.time(15, 0), time_to=datetime.time(18, 0))
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("cancel_booking", args=[self.booking.id]))
+
+        notified = set(WaitlistEntry.objects.filter(status=WaitlistEntry.STATUS_NOTIFIED).values_list("id", flat=True))
+        self.assertEqual(notified, {first.id, second.id})
+        events = OutboxEvent.objects.filter(event_type=OutboxEvent.EVENT_SLOT_FREED)
+        self.assertEqual(
+            sorted(event.payload["waitlist_id"] for event in events if event.channel == OutboxEvent.CHANNEL_EMAIL),
+            [first.id, second.id],
+        )
+        self.assertEqual(WaitlistEntry.objects.get(id=third.id).status, WaitlistEntry.STATUS_ACTIVE)
+
+    def test_long_service_waits_for_a_gap_it_fits(self):
+        long_service = Service.objects.create(name="Haircut and beard", price=40.00, duration_minutes=90)
+        Booking.objects.create(
+            client_name="Ivan",
+            client_phone="+380501234567",
+            barber=self.barber,
+            service=self.service,
+            booking_date=self.day,
+            booking_time=datetime.time(12, 30),
+        )
+        long_entry = self.wait("Anna", barber=self.barber)
+        WaitlistEntry.objects.filter(id=long_entry.id).update(service=long_service)
+        short_entry = self.wait("Boris", barber=self.barber)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("cancel_booking", args=[self.booking.id]))
+
+        self.assertEqual(WaitlistEntry.objects.get(id=long_entry.id).status, WaitlistEntry.STATUS_ACTIVE)
+        self.assertEqual(WaitlistEntry.objects.get(id=short_entry.id).status, WaitlistEntry.STATUS_NOTIFIED)
+
+    @override_settings(TELEGRAM_BOT_TOKEN="", TELEGRAM_STAFF_CHAT_ID="")
+    def test_entry_without_channel_stays_in_queue(self):
+        silent = self.wait("Anna", barber=self.barber)
+        WaitlistEntry.objects.filter(id=silent.id).update(client_email="")
+        reachable = self.wait("Boris")
+
+        with transaction.atomic():
+            Booking.objects.filter(id=self.booking.id).update(status=Booking.STATUS_CANCELED)
+            self.assertEqual(waitlist.slot_freed(self.booking), 1)
+
+        self.assertEqual(WaitlistEntry.objects.get(id=silent.id).status, WaitlistEntry.STATUS_ACTIVE)
+        self.assertEqual(WaitlistEntry.objects.get(id=reachable.id).status, WaitlistEntry.STATUS_NOTIFIED)
+        self.assertEqual(
+            [event.payload["waitlist_id"] for event in OutboxEvent.objects.filter(event_type=OutboxEvent.EVENT_SLOT_FREED)],
+            [reachable.id],
+        )
+
+    def test_reschedule_frees_previous_slot(self):
+        entry = self.wait("Anna", barber=self.barber)
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("booking_reschedule", args=[self.booking.id]),
+            {"booking_date": self.day.isoformat(), "booking_time": "16:00"},
+        )
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.booking_time, datetime.time(16, 0))
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, WaitlistEntry.STATUS_NOTIFIED)
+        self.assertEqual(
+            OutboxEvent.objects.get(event_type=OutboxEvent.EVENT_SLOT_FREED, channel=OutboxEvent.CHANNEL_EMAIL)
+            .payload["booking_time"],
+            "12:00",
+        )
+
+    def test_api_creates_entry(self):
+        response = self.client.post(reverse("waitlist_api"), {
+            "form_token": FORM_TOKEN,
+            "client_name": "Anna",
+            "client_phone": "+380501112233",
+            "service": self.service.id,
+            "date_from": self.day.isoformat(),
+            "date_to": self.day.isoformat(),
+            "time_from": "10:00",
+            "time_to": "12:00",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        entry = WaitlistEntry.objects.get(id=response.json()["id"])
+        self.assertIsNone(entry.barber_id)
+        self.assertEqual(entry.shop_id, self.barber.shop_id)
+
+        response = self.client.post(reverse("waitlist_api"), {
+            "form_token": FORM_TOKEN,
+            "client_name": "Anna",
+            "client_phone": "+380501112233",
+            "service": self.service.id,
+            "date_from": self.day.isoformat(),
+            "date_to": (self.day - datetime.timedelta(days=1)).isoformat(),
+            "time_from": "10:00",
+            "time_to": "12:00",
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class AnyBarberSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.first = Barber.objects.create(name="First", is_active=True)
+        self.second = Barber.objects.create(name="Second", is_active=True)
+        self.third = Barber.objects.create(name="Third", is_active=True)
+        self.shop = Shop.objects.default()
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        self.long_service = Service.objects.create(name="Haircut + beard", price=40.00, duration_minutes=60)
+        self.day = datetime.date.today() + datetime.timedelta(days=2)
+        for barber, time in [(self.first, "09:00"), (self.second, "09:00"), (self.second, "09:30"), (self.third, "09:30")]:
+            self.book(barber, time)
+
+    def tearDown(self):
+        cache.clear()
+
+    def book(self, barber, time):
+        Booking.objects.create(
+            client_name="Ivan",
+            client_phone="+380501234567",
+            barber=barber,
+            service=self.service,
+            booking_date=self.day,
+            booking_time=datetime.datetime.strptime(time, "%H:%M").time(),
+        )
+
+    def found(self, service, count):
+        return [
+            (time.strftime("%H:%M"), barber.name)
+            for date, time, barber in search.earliest_slots(self.shop, service, count, start=self.day)
+        ]
+
+    def test_merges_barbers_in_time_order(self):
+        self.assertEqual(
+            self.found(self.service, 4),
+            [("09:00", "Third"), ("09:30", "First"), ("10:00", "First"), ("10:00", "Second")],
+        )
+
+    def test_service_needs_consecutive_free_slots(self):
+        # У Third занято 09:30, поэтому часовая услуга в 09:00 к нему не помещается
+        self.assertEqual(self.found(self.long_service, 2), [("09:30", "First"), ("10:00", "First")])
+
+    def test_long_booking_blocks_every_slot_it_covers(self):
+        Booking.objects.create(client_name="Oleg", client_phone="+380501234567", barber=self.first,
+                               service=self.long_service, booking_date=self.day, booking_time=datetime.time(11, 0))
+        slots = get_available_slots(self.first, self.day)
+        self.assertNotIn(datetime.time(11, 0), slots)
+        self.assertNotIn(datetime.time(11, 30), slots)
+        self.assertIn(datetime.time(12, 0), slots)
+        self.assertNotIn(
+            (self.day, datetime.time(11, 30)),
+            search.next_slots(self.first, self.service, 10, start=self.day),
+        )
+
+    def test_slot_list_and_any_barber_use_the_service_length(self):
+        Booking.objects.create(client_name="Oleg", client_phone="+380501234567", barber=self.first,
+                               service=self.service, booking_date=self.day, booking_time=datetime.time(11, 0))
+        slots = get_available_slots(self.first, self.day, self.long_service)
+        self.assertNotIn(datetime.time(10, 30), slots)
+        self.assertNotIn(datetime.time(17, 30), slots)
+        self.assertIn(datetime.time(10, 0), slots)
+        # First не успевает до своей записи в 11:00 — часовую услугу берёт следующий свободный
+        self.assertEqual(search.pick_barber(self.shop, self.day, datetime.time(10, 30), self.long_service), self.second)
+        self.assertEqual(search.pick_barber(self.shop, self.day, datetime.time(10, 30)), self.first)
+
+        response = self.client.get(reverse("available_slots_api"), {
+            "barber": self.first.id, "booking_date": self.day.isoformat(), "service": self.long_service.id,
+        })
+        self.assertNotIn("10:30", response.json()["slots"])
+        self.assertNotIn("17:30", response.json()["slots"])
+
+    def test_search_is_one_query_when_warm(self):
+        reference.get_active_barbers(self.shop)
+        schedule.warm_up([self.first.id, self.second.id, self.third.id], 30)
+        with self.assertNumQueries(1):
+            search.earliest_slots(self.shop, self.service, 5, start=self.day, days=60)
+
+    def test_api_and_booking_without_barber(self):
+        response = self.client.get(reverse("earliest_slots_api"), {
+            "service": self.service.id, "count": 1, "from": self.day.isoformat(),
+        })
+        self.assertEqual(
+            response.json()["slots"],
+            [{"barber": self.third.id, "barber_name": "Third", "date": self.day.isoformat(), "time": "09:00"}],
+        )
+
+        response = self.client.post(reverse("booking_api"), {
+            "form_token": FORM_TOKEN,
+            "client_name": "Anna",
+            "client_phone": "+380501112233",
+            "service": self.service.id,
+            "booking_date": self.day.isoformat(),
+            "booking_time": "09:00",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Booking.objects.get(id=response.json()["id"]).barber_id, self.third.id)
+
+
+class NextSlotsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        self.day = datetime.date.today() + datetime.timedelta(days=2)
+        # Первый день закрыт, во второй занято начало дня
+        ScheduleException.objects.create(barber=self.barber, date=self.day)
+        Booking.objects.create(
+            client_name="Ivan",
+            client_phone="+380501234567",
+            barber=self.barber,
+            service=self.service,
+            booking_date=self.day + datetime.timedelta(days=1),
+            booking_time=datetime.time(9, 0),
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_next_slots_skip_full_days_in_one_query(self):
+        reference.warm_up()
+        schedule.warm_up([self.barber.id], 30)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("next_slots_api"), {
+                "barber": self.barber.id, "service": self.service.id, "count": 2, "from": self.day.isoformat(),
+            })
+
+        next_day = (self.day + datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(
+            response.json()["slots"], [{"date": next_day, "time": "09:30"}, {"date": next_day, "time": "10:00"}]
+        )
+
+    def test_available_days_summary(self):
+        response = self.client.get(reverse("available_days_api"), {
+            "barber": self.barber.id, "service": self.service.id, "from": self.day.isoformat(), "days": 3,
+        })
+        self.assertEqual(response.json(), {"from": self.day.isoformat(), "days": "011"})
+
+        response = self.client.get(reverse("available_days_api"), {"from": self.day.isoformat(), "days": 2})
+        self.assertEqual(response.json()["days"], "00")
+
+
+class BulkStatusTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username="admin", password="pass12345", is_staff=True, is_superuser=True)
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.pending = self.book("09:00", Booking.STATUS_PENDING, client_email="a@example.com")
+        self.confirmed = self.book("10:00", Booking.STATUS_CONFIRMED)
+        self.completed = self.book("11:00", Booking.STATUS_COMPLETED)
+
+    def book(self, time, status, **extra):
+        return Booking.objects.create(
+            client_name="Ivan",
+            client_phone="+380501234567",
+            barber=self.barber,
+            service=self.service,
+            booking_date=self.day,
+            booking_time=datetime.datetime.strptime(time, "%H:%M").time(),
+            status=status,
+            **extra,
+        )
+
+    def post(self, data):
+        return self.client.post(reverse("staff_booking_status_api"), json.dumps(data), content_type="application/json")
+
+    def test_api_reports_outcome_per_row(self):
+        self.client.force_login(self.staff)
+        before = Booking.objects.get(id=self.pending.id).updated_at
+        response = self.post({"status": "confirmed", "ids": [self.pending.id, self.confirmed.id, self.completed.id, 999]})
+
+        self.assertEqual(response.json()["updated"], 1)
+        self.assertEqual(response.json()["results"], [
+            {"id": self.pending.id, "ok": True, "status": "confirmed"},
+            {"id": self.confirmed.id, "ok": False, "status": "confirmed"},
+            {"id": self.completed.id, "ok": False, "status": "completed"},
+            {"id": 999, "ok": False, "error": "not_found"},
+        ])
+        pending = Booking.objects.get(id=self.pending.id)
+        self.assertGreater(pending.updated_at, before)
+        event = OutboxEvent.objects.get(event_type=OutboxEvent.EVENT_STATUS_CHANGED)
+        self.assertEqual((event.booking_id, event.payload["status"]), (self.pending.id, "confirmed"))
+
+    def test_api_closes_out_a_day_by_filter(self):
+        self.client.force_login(self.staff)
+        response = self.post({"status": "completed", "date": self.day.isoformat(), "barber": self.barber.id})
+
+        self.assertEqual(response.json()["updated"], 2)
+        self.assertEqual(Booking.objects.filter(status=Booking.STATUS_COMPLETED).count(), 3)
+        self.assertFalse(OutboxEvent.objects.filter(event_type=OutboxEvent.EVENT_STATUS_CHANGED).exists())
+
+    @override_settings(BOOKING_NOTIFY_EMAILS=["staff@example.com"])
+    def test_status_change_emails_reach_client_and_staff(self):
+        transitions.apply(Booking.objects.filter(pk__in=[self.pending.pk, self.confirmed.pk]), Booking.STATUS_CANCELED)
+        outbox.dispatch_batch()
+
+        recipients = sorted((message.to, message.bcc) for message in mail.outbox)
+        self.assertEqual(recipients, [(["a@example.com"], ["staff@example.com"]), (["staff@example.com"], [])])
+
+    def test_status_change_without_any_recipient_makes_no_email_event(self):
+        transitions.apply(Booking.objects.filter(pk=self.confirmed.pk), Booking.STATUS_CANCELED)
+
+        self.assertFalse(OutboxEvent.objects.filter(event_type=OutboxEvent.EVENT_STATUS_CHANGED).exists())
+
+    def test_api_requires_staff(self):
+        user = User.objects.create_user(username="client", password="pass12345")
+        self.client.force_login(user)
+        self.assertEqual(self.post({"status": "completed", "ids": [self.pending.id]}).status_code, 403)
+
+    def test_admin_action(self):
+        self.client.force_login(self.staff)
+        self.client.post(reverse("admin:booking_booking_changelist"), {
+            "action": "mark_no_show",
+            "_selected_action": [self.pending.id, self.completed.id],
+        })
+
+        statuses = dict(Booking.objects.values_list("id", "status"))
+        self.assertEqual(statuses[self.pending.id], Booking.STATUS_NO_SHOW)
+        self.assertEqual(statuses[self.completed.id], Booking.STATUS_COMPLETED)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=60)
+        self.day = timezone.localdate() - datetime.timedelta(days=1)
+
+    def tearDown(self):
+        cache.clear()
+
+    def book(self, time, status, date=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                client_name="Ivan",
+                client_phone="+380501234567",
+                barber=self.barber,
+                service=self.service,
+                booking_date=date or self.day,
+                booking_time=datetime.datetime.strptime(time, "%H:%M").time(),
+                status=status,
+            )
+
+    def rollup(self, date=None):
+        return DailyRollup.objects.get(date=date or self.day, barber=self.barber, service=self.service)
+
+    def test_counters_follow_booking_changes(self):
+        self.book("09:00", Booking.STATUS_COMPLETED)
+        self.book("11:00", Booking.STATUS_NO_SHOW)
+        self.book("13:00", Booking.STATUS_CANCELED)
+        moved = self.book("15:00", Booking.STATUS_CONFIRMED)
+
+        rollup = self.rollup()
+        self.assertEqual(
+            (rollup.bookings, rollup.completed, rollup.no_show, rollup.canceled, rollup.booked_minutes),
+            (4, 1, 1, 1, 180),
+        )
+        self.assertEqual(rollup.revenue, 25)
+        # 09:00–10:00, 11:00–12:00, 15:00–16:00 в слотах по 30 минут
+        self.assertEqual(rollup.booked_mask, 0b11 << 18 | 0b11 << 22 | 0b11 << 30)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transitions.apply(Booking.objects.filter(pk=moved.pk), Booking.STATUS_COMPLETED)
+        self.assertEqual(self.rollup().revenue, 50)
+
+        moved = Booking.objects.get(pk=moved.pk)
+        moved.booking_date = self.day - datetime.timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.save()
+        self.assertEqual((self.rollup().bookings, self.rollup().revenue), (3, 25))
+        self.assertEqual(self.rollup(moved.booking_date).completed, 1)
+
+    def test_refresh_waits_for_commit_and_follows_deletes(self):
+        kept = self.book("09:00", Booking.STATUS_COMPLETED)
+        with self.captureOnCommitCallbacks() as callbacks:
+            gone = Booking.objects.create(
+                client_name="Oleg", client_phone="+380501234568", barber=self.barber, service=self.service,
+                booking_date=self.day, booking_time=datetime.time(11, 0), status=Booking.STATUS_COMPLETED,
+            )
+            self.assertEqual(self.rollup().bookings, 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.rollup().bookings, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            gone.delete()
+        self.assertEqual((self.rollup().bookings, self.rollup().revenue), (1, 25))
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.delete()
+        self.assertFalse(DailyRollup.objects.exists())
+
+    def test_rebuild_rejects_empty_chunks(self):
+        self.book("09:00", Booking.STATUS_COMPLETED)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", "--chunk-days", "0", stdout=io.StringIO())
+        with self.assertRaises(ValueError):
+            list(rollups.rebuild(chunk_days=0))
+
+    def test_rebuild_includes_archive(self):
+        old = self.book("09:00", Booking.STATUS_COMPLETED, date=self.day - datetime.timedelta(days=200))
+        self.book("10:00", Booking.STATUS_COMPLETED)
+        call_command("archive_bookings", "--days", "90", stdout=io.StringIO())
+        DailyRollup.objects.all().delete()
+
+        call_command("rebuild_rollups", "--chunk-days", "30", stdout=io.StringIO())
+
+        self.assertEqual(DailyRollup.objects.count(), 2)
+        self.assertEqual(self.rollup(old.booking_date).completed, 1)
+
+    def test_admin_report_reads_rollups(self):
+        self.book("09:00", Booking.STATUS_COMPLETED)
+        staff = User.objects.create_user(username="admin", password="pass12345", is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse("admin:booking_dailyrollup_changelist"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Test Barber")
+        barber, totals, revenue = response.context["report"]["barbers"][0]
+        self.assertEqual((totals["completed"], totals["revenue"]), (1, 25))
+        self.assertEqual(revenue[-2], (25, 1.0))
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        self.data = {
+            "form_token": FORM_TOKEN,
+            "client_name": "Anna",
+            "client_phone": "+380501112233",
+            "barber": self.barber.id,
+            "service": self.service.id,
+            "booking_date": (datetime.date.today() + datetime.timedelta(days=2)).isoformat(),
+            "booking_time": "10:00",
+        }
+
+    def tearDown(self):
+        cache.clear()
+
+    def post(self, data, key="retry-1"):
+        return self.client.post(reverse("booking_api"), data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        first = self.post(self.data)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post(self.data)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((second.status_code, second.content), (200, first.content))
+        self.assertEqual(second[idempotency.REPLAYED_HEADER], "true")
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertFalse([q for q in queries.captured_queries if "booking_booking" in q["sql"]])
+
+    def test_retry_with_new_multipart_boundary_is_replayed(self):
+        # Браузер выбирает новый boundary для каждой отправки FormData
+        responses = []
+        for boundary in ("----FormBoundaryAAAA", "----FormBoundaryBBBB"):
+            responses.append(self.client.post(
+                reverse("booking_api"),
+                encode_multipart(boundary, {**self.data, "csrfmiddlewaretoken": boundary}),
+                content_type=f"multipart/form-data; boundary={boundary}",
+                HTTP_IDEMPOTENCY_KEY="retry-1",
+            ))
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[1][idempotency.REPLAYED_HEADER], "true")
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_same_key_with_other_data_is_rejected(self):
+        self.post(self.data)
+        response = self.post({**self.data, "booking_time": "11:00"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_duplicate_in_flight_gets_conflict(self):
+        IdempotencyKey.objects.create(
+            key=idempotency._digest("booking_api", "ip:127.0.0.1", "retry-1"),
+            fingerprint="",
+            created_at=timezone.now(),
+        )
+        response = self.post(self.data)
+        self.assertEqual((response.status_code, response["Retry-After"]), (409, "1"))
+        self.assertFalse(Booking.objects.exists())
+
+    def test_abandoned_key_is_taken_over(self):
+        IdempotencyKey.objects.create(
+            key=idempotency._digest("booking_api", "ip:127.0.0.1", "retry-1"),
+            fingerprint="",
+            created_at=timezone.now() - datetime.timedelta(minutes=5),
+        )
+        self.assertEqual(self.post(self.data).status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+
+
+class ApiV1Tests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="api", password="pass12345")
+        self.client.force_login(self.user)
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+        self.day = datetime.date.today() + datetime.timedelta(days=3)
+
+    def tearDown(self):
+        cache.clear()
+
+    def book(self, date, hour, **extra):
+        return Booking.objects.create(
+            client_name="Anna",
+            client_phone="+380501112233",
+            barber=self.barber,
+            service=self.service,
+            booking_date=date,
+            booking_time=datetime.time(hour, 0),
+            **{"user": self.user, **extra},
+        )
+
+    def post(self, name, payload, *args):
+        return self.client.post(reverse(name, args=args), json.dumps(payload), content_type="application/json")
+
+    def test_list_pages_with_cursor_across_archive(self):
+        old = self.book(datetime.date.today() - datetime.timedelta(days=200), 10, status=Booking.STATUS_COMPLETED)
+        call_command("archive_bookings", "--days", "90", stdout=io.StringIO())
+        upcoming = [self.book(self.day, hour) for hour in (12, 10, 11)]
+
+        seen = []
+        url = reverse("api_v1_bookings") + "?limit=2"
+        while url:
+            body = self.client.get(url).json()
+            seen.extend((row["id"], row["archived"]) for row in body["results"])
+            cursor = body["next_cursor"]
+            url = f"{reverse('api_v1_bookings')}?limit=2&cursor={cursor}" if cursor else None
+
+        expected = [(old.id, True)] + [(b.id, False) for b in sorted(upcoming, key=lambda b: b.booking_time)]
+        self.assertEqual(seen, expected)
+        row = self.client.get(reverse("api_v1_bookings")).json()["results"][1]
+        self.assertEqual((row["booking_time"], row["barber_name"], row["price"]), ("10:00", "Test Barber", "25.00"))
+
+    def test_list_rejects_bad_cursor_and_anonymous(self):
+        self.assertEqual(self.client.get(reverse("api_v1_bookings") + "?cursor=!!").status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("api_v1_bookings")).status_code, 401)
+
+    def test_create_and_validation_errors(self):
+        # Вошедшему клиенту API form_token не нужен
+        payload = {
+            "client_name": "Anna",
+            "client_phone": "+380501112233",
+            "barber": self.barber.id,
+            "service": self.service.id,
+            "booking_date": self.day.isoformat(),
+            "booking_time": "10:00",
+        }
+        response = self.post("api_v1_bookings", payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["booking"]["booking_time"], "10:00")
+        self.assertEqual(Booking.objects.get().user, self.user)
+
+        taken = self.post("api_v1_bookings", payload)
+        self.assertEqual(taken.status_code, 400)
+        self.assertEqual(list(taken.json()["errors"]), ["__all__"])
+
+        response = self.post("api_v1_batch", {"operations": [{"op": "create", "data": {**payload, "booking_time": "11:00"}}]})
+        self.assertEqual(response.json()["results"][0]["status"], 201)
+
+    def test_cancel_and_reschedule(self):
+        booking = self.book(self.day, 10)
+        moved = self.post("api_v1_reschedule_booking", {"booking_date": self.day.isoformat(), "booking_time": "11:00"}, booking.id)
+        self.assertEqual(moved.json()["booking"]["booking_time"], "11:00")
+
+        self.assertEqual(self.post("api_v1_cancel_booking", {}, booking.id).json()["booking"]["status"], Booking.STATUS_CANCELED)
+        again = self.post("api_v1_reschedule_booking", {"booking_date": self.day.isoformat(), "booking_time": "12:00"}, booking.id)
+        self.assertEqual((again.status_code, again.json()["errors"]["code"]), (409, ["status"]))
+
+        other = User.objects.create_user(username="other", password="pass12345")
+        foreign = self.book(self.day, 14, user=other)
+        self.assertEqual(self.post("api_v1_cancel_booking", {}, foreign.id).status_code, 404)
+
+    def test_batch_runs_operations_independently(self):
+        first = self.book(self.day, 10)
+        past = self.book(datetime.date.today() - datetime.timedelta(days=1), 10, status=Booking.STATUS_CONFIRMED)
+        response = self.post("api_v1_batch", {"operations": [
+            {"op": "cancel", "id": first.id},
+            {"op": "cancel", "id": past.id},
+            {"op": "explode"},
+            {"op": "list", "data": {"limit": 1}},
+        ]})
+
+        results = response.json()["results"]
+        self.assertEqual([item["status"] for item in results], [200, 409, 400, 200])
+        first.refresh_from_db()
+        self.assertEqual(first.status, Booking.STATUS_CANCELED)
+        self.assertEqual(len(results[3]["body"]["results"]), 1)
+        self.assertEqual(self.post("api_v1_batch", {"operations": []}).status_code, 400)
+
+    def test_batch_rejects_malformed_operation_data(self):
+        response = self.post("api_v1_batch", {"operations": [
+            {"op": "list", "data": [1, 2]},
+            {"op": "create", "data": "x"},
+            {"op": "list", "data": {"cursor": 5}},
+            {"op": "list", "data": {"cursor": ["a"]}},
+        ]})
+
+        results = response.json()["results"]
+        self.assertEqual([item["status"] for item in results], [400, 400, 400, 400])
+        self.assertIn("data", results[0]["body"]["errors"])
+        self.assertIn("cursor", results[2]["body"]["errors"])
+
+
+class ProfileBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="anna", password="pass12345")
+        UserProfile.objects.create(user=self.user, phone="+380501112233")
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_user_and_profile_load_in_one_query_then_from_cache(self):
+        with self.assertNumQueries(1):
+            user = ProfileBackend().get_user(self.user.pk)
+            self.assertEqual(user.profile.phone, "+380501112233")
+        with self.assertNumQueries(0):
+            self.assertEqual(ProfileBackend().get_user(self.user.pk).profile.phone, "+380501112233")
+
+    def test_cache_holds_no_password_hash(self):
+        ProfileBackend().get_user(self.user.pk)
+        self.assertNotIn(self.user.password, repr(cache.get(f"auth:user:{self.user.pk}")))
+
+        user = ProfileBackend().get_user(self.user.pk)
+        self.assertTrue(user.check_password("pass12345"))
+
+    def test_sessions_survive_cache_and_old_backend_path(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("dashboard")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("dashboard")).status_code, 200)
+
+        self.client.force_login(self.user, backend="django.contrib.auth.backends.ModelBackend")
+        self.assertEqual(self.client.get(reverse("dashboard")).status_code, 200)
+
+    def test_failed_login_stops_backend_chain(self):
+        with self.assertRaises(PermissionDenied):
+            ProfileBackend().authenticate(None, username="anna", password="wrong")
+
+    def test_profile_form_save_invalidates_cache(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("edit_profile"))
+        response = self.client.post(reverse("edit_profile"), {"phone": "+380671234567", "first_name": "Anna"})
+        self.assertEqual(response.status_code, 302)
+
+        user = ProfileBackend().get_user(self.user.pk)
+        self.assertEqual((user.first_name, user.profile.phone), ("Anna", "+380671234567"))
+
+    def test_missing_profile_is_created_on_save(self):
+        UserProfile.objects.all().delete()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("edit_profile")).status_code, 200)
+        self.assertFalse(UserProfile.objects.exists())
+        self.client.post(reverse("edit_profile"), {"phone": "+380671234567"})
+        self.assertEqual(UserProfile.objects.get().phone, "+380671234567")
+
+
+class ClientTests(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+
+    def book(self, phone, **extra):
+        return Booking.objects.create(
+            client_name="Anna",
+            client_phone=phone,
+            barber=self.barber,
+            service=self.service,
+            booking_time=datetime.time(10, 0),
+            **{"booking_date": datetime.date.today() + datetime.timedelta(days=1), **extra},
+        )
+
+    def test_bookings_link_to_client_by_normalized_phone(self):
+        first = self.book("+380501112233")
+        second = self.book("050 111 22 33")
+        self.assertEqual(first.client_id, second.client_id)
+        self.assertEqual(Client.objects.get().phone, "+380501112233")
+
+        second.client_phone = "+380671234567"
+        second.save()
+        self.assertNotEqual(second.client_id, first.client_id)
+        self.assertIsNone(self.book("12").client_id)
+
+    def test_backfill_links_old_rows_including_archive(self):
+        old = self.book("+380501112233", booking_date=datetime.date.today() - datetime.timedelta(days=200))
+        call_command("archive_bookings", "--days", "90", stdout=io.StringIO())
+        recent = [self.book("0501112233"), self.book("+380671234567")]
+        Booking.objects.update(client=None)
+        ArchivedBooking.objects.update(client=None)
+        Client.objects.all().delete()
+
+        call_command("backfill_clients", "--chunk-size", "1", stdout=io.StringIO())
+
+        self.assertEqual(Client.objects.count(), 2)
+        client = Client.objects.get(phone="+380501112233")
+        self.assertEqual(ArchivedBooking.objects.get(pk=old.pk).client, client)
+        self.assertEqual(Booking.objects.get(pk=recent[0].pk).client, client)
+
+    def test_admin_search_by_phone_prefix(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pass12345")
+        self.client.force_login(admin_user)
+        match = self.book("+380501112233")
+        self.book("+380671234567")
+
+        response = self.client.get(reverse("admin:booking_booking_changelist"), {"q": "050 111"})
+        self.assertEqual([b.pk for b in response.context["cl"].result_list], [match.pk])
+        self.assertEqual(clients.search_prefix("Anna"), None)
+        self.assertEqual(clients.search_prefix("+380 (50)"), "+38050")
+
+
+class FulltextSearchTests(TestCase):
+    """Те же проверки проходят на SQLite (FTS5) и PostgreSQL (pg_trgm)."""
+
+    def setUp(self):
+        self.barber = Barber.objects.create(name="Test Barber", is_active=True)
+        self.service = Service.objects.create(name="Haircut", price=25.00, duration_minutes=30)
+
+    def book(self, name, email=""):
+        return Booking.objects.create(
+            client_name=name,
+            client_phone="+380501112233",
+            client_email=email,
+            barber=self.barber,
+            service=self.service,
+            booking_date=datetime.date.today() + datetime.timedelta(days=1),
+            booking_time=datetime.time(10, 0),
+        )
+
+    def test_substring_of_name_or_email(self):
+        anna = self.book("Anna Karenina", "anna@example.com")
+        self.book("Oleg Petrov", "oleg@mail.test")
+
+        self.assertEqual(fulltext.search("aren"), [anna.pk])
+        self.assertEqual(fulltext.search("EXAMPLE"), [anna.pk])
+        self.assertEqual(fulltext.search("anna example"), [anna.pk])
+        self.assertEqual(fulltext.search("anna oleg"), [])
+        self.assertIsNone(fulltext.search("an"))
+
+    def test_index_follows_updates_and_deletes(self):
+        booking = self.book("Anna Karenina")
+        booking.client_name = "Maria Ivanova"
+        booking.save()
+        self.assertEqual(fulltext.search("karen"), [])
+        self.assertEqual(fulltext.search("ivanov"), [booking.pk])
+
+        Booking.objects.filter(pk=booking.pk).delete()
+        self.assertEqual(fulltext.search("ivanov"), [])
+
+    def test_admin_search_is_ranked(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pass12345")
+        self.client.force_login(admin_user)
+        weak = self.book("Annabelle Smith", "smith@example.com")
+        strong = self.book("Anna", "anna@anna.test")
+        self.book("Oleg Petrov")
+
+        response = self.client.get(reverse("admin:booking_booking_changelist"), {"q": "anna"})
+        self.assertEqual([b.pk for b in response.context["cl"].result_list], [strong.pk, weak.pk])
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite FTS5")
+    def test_sqlite_shadow_table(self):
+        self.assertIn(fulltext.FTS_TABLE, connection.introspection.table_names())
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL pg_trgm")
+    def test_postgres_trigram_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", [fulltext.TRGM_INDEX])
+            self.assertIn("gin_trgm_ops", cursor.fetchone()[0])
+
+
+class SpamGuardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reference.get_default_shop()  # филиалы берутся из кэша справочников
+        self.client.defaults["REMOTE_ADDR"] = "10.0.0.77"
+
+    def tearDown(self):
+        cache.clear()
+
+    def post(self, data):
+        return self.client.post(reverse("booking_api"), {"client_name": "Bot", **data})
+
+    def test_rejects_without_touching_database(self):
+        cases = [
+            {"form_token": FORM_TOKEN, "hp_field": "http://spam.example"},
+            {"form_token": spam.form_token()},
+            {"form_token": "1700000000:forged"},
+            {"form_token": spam.form_token(time.time() - 2 * 86400)},
+            {},
+        ]
+        for data in cases:
+            with self.subTest(data=data), self.assertNumQueries(0):
+                response = self.post(data)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()["ok"])
+
+    @override_settings(SPAM_GUARD_RATE_LIMIT=2)
+    def test_flood_from_one_ip_is_limited(self):
+        self.post({})
+        self.post({})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post({}).status_code, 429)
+
+    @override_settings(SPAM_GUARD_RATE_LIMIT=1)
+    def test_logged_in_users_have_own_limit_and_skip_form_token(self):
+        self.post({})
+        self.assertEqual(self.post({}).status_code, 429)
+
+        self.client.force_login(User.objects.create_user(username="anna", password="pass12345"))
+        response = self.client.post(reverse("waitlist_api"), {"client_name": "Anna"})
+        self.assertEqual(response.status_code, 400)
+        self.assertNotEqual(response.json()["errors"].get("__all__"), [str(spam.REJECTED_MESSAGE)])
+        self.assertIn("client_phone", response.json()["errors"])
+        self.assertEqual(self.client.post(reverse("waitlist_api"), {}).status_code, 429)
+
+    def test_form_token_is_rendered_or_served_with_csrf(self):
+        response = self.client.get(reverse("csrf_token_api"))
+        self.assertEqual(spam.check_form({"form_token": response.json()["form_token"]}), "too_fast")
+        self.assertEqual(spam.check_form({"form_token": FORM_TOKEN}), None)
+        self.assertContains(self.client.get(reverse("home")), 'name="form_token"')
+
+    def test_api_and_waitlist_creation_are_guarded(self):
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse("api_v1_bookings"), json.dumps({"client_name": "Bot", "form_token": 5}),
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.post(reverse("waitlist_api"), {"hp_field": "x"}).status_code, 400)
+
+        response = self.client.post(reverse("api_v1_batch"), json.dumps({"operations": [
+            {"op": "create", "data": {"client_name": "Bot"}},
+        ]}), content_type="application/json")
+        self.assertEqual(response.json()["results"][0]["status"], 400)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_home_post_gets_plain_text_rejection(self):
+        response = self.client.post(reverse("home"), {"hp_field": "x"})
+        self.assertEqual((response.status_code, response["Content-Type"]), (400, "text/plain; charset=utf-8"))
+
+
+@override_settings(LOGIN_USERNAME_LIMIT=2, LOGIN_IP_LIMIT=4)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username="anna", password="pass12345")
+
+    def tearDown(self):
+        cache.clear()
+
+    def login(self, username="anna", password="wrong", ip="10.0.0.5", **extra):
+        return self.client.post(reverse("login"), {"username": username, "password": password}, REMOTE_ADDR=ip, **extra)
+
+    def test_username_is_throttled_after_failures(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login().status_code, 200)
+
+        response = self.login(password="pass12345")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "900")
+
+    def test_failures_from_other_ip_do_not_lock_out_owner(self):
+        self.login(ip="10.0.0.6")
+        self.login(ip="10.0.0.6")
+        self.assertEqual(self.login(ip="10.0.0.6").status_code, 429)
+
+        self.assertEqual(self.login(password="pass12345", ip="10.0.0.7").status_code, 302)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_clients_behind_proxy_are_counted_separately(self):
+        for _ in range(4):
+            self.login(username="other", HTTP_X_FORWARDED_FOR="198.51.100.1, 203.0.113.1")
+        self.assertEqual(self.login(username="other", HTTP_X_FORWARDED_FOR="203.0.113.1").status_code, 429)
+
+        response = self.login(password="pass12345", HTTP_X_FORWARDED_FOR="203.0.113.2")
+        self.assertEqual(response.status_code, 302)
+
+    def test_ip_is_throttled_across_usernames(self):
+        for name in ("a1", "a2", "a3", "a4"):
+            self.login(username=name)
+        self.assertEqual(self.login(username="a5").status_code, 429)
+
+    def test_success_resets_username_failures(self):
+        self.login()
+        self.assertEqual(self.login(password="pass12345").status_code, 302)
+        self.client.logout()
+        self.login()
+        self.assertEqual(self.login(password="pass12345").status_code, 302)
+
+    @override_settings(AUTH_HASH_WAIT_SECONDS=0)
+    def test_saturated_hashing_rejects_login_but_not_booking_pages(self):
+        slots = auth.hash_slots()
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        try:
+            self.assertEqual(self.login(password="pass12345").status_code, 429)
+            self.assertEqual(self.client.get(reverse("home")).status_code, 200)
+        finally:
+            for _ in range(taken):
+                slots.release()
+        self.assertEqual(self.login(password="pass12345").status_code, 302)
+
+    @override_settings(REGISTER_IP_LIMIT=1)
+    def test_register_is_rate_limited(self):
+        data = {"username": "newbie", "password1": "Long-pass-123", "password2": "Long-pass-123"}
+        self.assertEqual(self.client.post(reverse("register"), data).status_code, 302)
+        self.client.logout()
+        self.assertEqual(self.client.post(reverse("register"), {**data, "username": "other"}).status_code, 429)
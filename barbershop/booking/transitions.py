@@ -0,0 +1,70 @@
+"""
+Массовая смена статуса записей (действия в админке и /api/staff/bookings/status/).
+
+Выбранные записи блокируются и читаются одним запросом, статус меняется одним
+UPDATE ... WHERE status IN (допустимые исходные), уведомления ставятся в outbox одной
+вставкой. update() не вызывает save() и сигналы, поэтому updated_at (по нему работают
+напоминания и ETag календаря), дневные сводки и очистка кэша прокси обновляются здесь явно.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import edge_cache, outbox, rollups, waitlist
+from .models import Booking, OutboxEvent
+
+# Целевой статус -> из каких статусов в него можно перейти
+TRANSITIONS = {
+  Booking.STATUS_CONFIRMED: {Booking.STATUS_PENDING},
+  Booking.STATUS_COMPLETED: {Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED, Booking.STATUS_NO_SHOW},
+  Booking.STATUS_NO_SHOW: {Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED},
+  Booking.STATUS_CANCELED: {Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED},
+}
+
+# О выполненном визите и неявке клиенту не пишем
+NOTIFY_STATUSES = {Booking.STATUS_CONFIRMED, Booking.STATUS_CANCELED}
+
+OUTCOME_UPDATED = 'updated'
+OUTCOME_SKIPPED = 'skipped'
+
+
+def apply(queryset, status):
+  """
+  Переводит записи queryset в status там, где переход допустим.
+  Возвращает {booking_id: (outcome, статус после операции)}.
+  """
+  allowed = TRANSITIONS[status]
+  with transaction.atomic():
+    # Через pk__in: queryset из админки может быть с DISTINCT, с которым FOR UPDATE нельзя
+    rows = list(
+      Booking.objects.select_for_update(of=('self',))
+      .filter(pk__in=queryset.values('pk'))
+      .select_related('barber', 'service')
+      .order_by('pk')
+    )
+    changed = [booking for booking in rows if booking.status in allowed]
+    outcomes = {
+      booking.id: (OUTCOME_SKIPPED, booking.status) for booking in rows if booking.status not in allowed
+    }
+    if not changed:
+      return outcomes
+
+    Booking.objects.filter(pk__in=[booking.id for booking in changed], status__in=allowed).update(
+      status=status,
+      updated_at=timezone.now(),
+    )
+
+    if status in NOTIFY_STATUSES:
+      OutboxEvent.objects.bulk_create([
+        event for booking in changed
+        for event in outbox.build(OutboxEvent.EVENT_STATUS_CHANGED, booking, status=status)
+      ])
+    if status == Booking.STATUS_CANCELED:
+      for booking in changed:
+        waitlist.slot_freed(booking)
+    rollups.refresh_on_commit(rollups.key_of(booking) for booking in changed)
+
+    today = timezone.localdate()
+    edge_cache.purge([edge_cache.barber_key(b.barber_id) for b in changed if b.booking_date >= today])
+
+  outcomes.update({booking.id: (OUTCOME_UPDATED, status) for booking in changed})
+  return outcomes
@@ -1,10 +1,21 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
   path('', views.home, name='home'),
   path('api/book/', views.booking_api, name='booking_api'),
   path('api/available-slots/', views.available_slots_api, name='available_slots_api'),
+  path('api/earliest-slots/', views.earliest_slots_api, name='earliest_slots_api'),
+  path('api/next-slots/', views.next_slots_api, name='next_slots_api'),
+  path('api/available-days/', views.available_days_api, name='available_days_api'),
+  path('api/csrf/', views.csrf_token_api, name='csrf_token_api'),
+  path('api/waitlist/', views.waitlist_api, name='waitlist_api'),
+  path('api/v1/bookings/', api.bookings, name='api_v1_bookings'),
+  path('api/v1/bookings/<int:booking_id>/cancel/', api.cancel_booking, name='api_v1_cancel_booking'),
+  path('api/v1/bookings/<int:booking_id>/reschedule/', api.reschedule_booking, name='api_v1_reschedule_booking'),
+  path('api/v1/batch/', api.batch, name='api_v1_batch'),
+  path('api/staff/bookings/status/', views.staff_booking_status_api, name='staff_booking_status_api'),
+  path('calendar/<int:barber_id>.ics', views.calendar_feed, name='calendar_feed'),
   path('login/', views.login_view, name='login'),
   path('register/', views.register_view, name='register'),
   path('dashboard/', views.dashboard_view, name='dashboard'),
@@ -1,9 +1,18 @@
 import datetime
-from .models import Booking
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import schedule
+from .models import Barber, Booking
 
 BASE_SLOT_MINUTES = 30
 WORK_DAY_START = datetime.time(hour=9, minute=0)
 WORK_DAY_END = datetime.time(hour=18, minute=0)
+# Общий график для барберов без своего (см. booking/schedule.py)
+DEFAULT_DAY_MASK = schedule.interval_mask(WORK_DAY_START, WORK_DAY_END, BASE_SLOT_MINUTES)
 
 def generate_slot(date, start=WORK_DAY_START, end=WORK_DAY_END, step=BASE_SLOT_MINUTES):
     slots = []
@@ -18,25 +27,143 @@ def generate_slot(date, start=WORK_DAY_START, end=WORK_DAY_END, step=BASE_SLOT_M
     return slots
 
 
-def get_available_slots(barber, date):
-    all_slots = generate_slot(date)
+def mask_to_slots(mask, step=BASE_SLOT_MINUTES):
+    slots = []
+    while mask:
+        low = mask & -mask
+        minutes = (low.bit_length() - 1) * step
+        slots.append(datetime.time(minutes // 60, minutes % 60))
+        mask ^= low
+    return slots
+
+
+def get_available_slots(barber, date, service=None, exclude_id=None):
+    return get_available_slots_bulk([(barber.pk, date)], service, exclude_id)[(barber.pk, date)]
+
+
+def slot_index(time, step=BASE_SLOT_MINUTES):
+    """Номер бита слота, начинающегося в time, или None, если время не на сетке."""
+    minutes = time.hour * 60 + time.minute
+    return minutes // step if minutes % step == 0 else None
+
+
+def booked_masks(rows):
+    """
+    Занятые слоты {(barber_id, date): mask} из строк (barber_id, date, time, duration_minutes):
+    запись занимает все слоты своей услуги, а не только первый.
+    """
+    booked = {}
+    for barber_id, date, time, duration in rows:
+        index = slot_index(time)
+        if index is not None:
+            span = ((1 << minutes_to_slots(duration)) - 1) << index
+            booked[(barber_id, date)] = booked.get((barber_id, date), 0) | span
+    return booked
+
+
+def past_mask(now=None):
+    """Слоты сегодняшнего дня, которые уже начались."""
+    now = now or datetime.datetime.now()
+    return (1 << (now.hour * 60 + now.minute) // BASE_SLOT_MINUTES + 1) - 1
 
-    # Убираем прошедшие слоты, если дата — сегодня
-    today = datetime.date.today()
-    if date == today:
-        now_time = datetime.datetime.now().time()
-        all_slots = [t for t in all_slots if t > now_time]
 
-    booked_times_qs = Booking.objects.filter(
-        barber=barber,
-        booking_date=date,
-        status__in=[Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED],
-    ).values_list('booking_time', flat=True)
+def fit_mask(free, length):
+    """Начала, от которых свободны length слотов подряд."""
+    fit = free
+    for shift in range(1, length):
+        fit &= free >> shift
+    return fit
 
-    booked_times = set(booked_times_qs)
-    return [t for t in all_slots if t not in booked_times]
+
+def minutes_to_slots(minutes):
+    return max(1, -(-(minutes or 0) // BASE_SLOT_MINUTES))
+
+
+def slots_needed(service):
+    return minutes_to_slots(service.duration_minutes)
+
+
+def active_bookings():
+    return Booking.objects.filter(status__in=[Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED])
+
+
+def get_available_slots_bulk(pairs, service=None, exclude_id=None):
+    """
+    Свободные слоты сразу для нескольких пар (barber_id, date) одним запросом к БД.
+    С service остаются только начала, от которых услуга помещается целиком (как в search.py);
+    exclude_id — запись, которая не считается занятой (перенос самой себя).
+    Возвращает {(barber_id, date): [time, ...]}.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+
+    booked_qs = active_bookings().filter(
+        barber_id__in={barber_id for barber_id, _ in pairs},
+        booking_date__in={date for _, date in pairs},
+    )
+    if exclude_id is not None:
+        booked_qs = booked_qs.exclude(pk=exclude_id)
+    booked_qs = booked_qs.values_list('barber_id', 'booking_date', 'booking_time', 'service__duration_minutes')
+
+    # Занятые слоты — тоже битовая маска, свободные = рабочие & ~занятые
+    booked = booked_masks(booked_qs)
+    masks = schedule.day_masks(pairs, DEFAULT_DAY_MASK, BASE_SLOT_MINUTES)
+    today = datetime.date.today()
+    # Убираем прошедшие слоты, если дата — сегодня
+    today_past = past_mask()
+    length = slots_needed(service) if service is not None else 1
+    result = {}
+    for barber_id, date in pairs:
+        free = masks[(barber_id, date)] & ~booked.get((barber_id, date), 0)
+        if date == today:
+            free &= ~today_past
+        result[(barber_id, date)] = mask_to_slots(fit_mask(free, length))
+    return result
+
+@contextmanager
+def booking_write(barber_id=None, shop_id=None):
+    """
+    Транзакция для записи брони: проверка свободного слота и сохранение выполняются атомарно.
+    В SQLite транзакция открывается как BEGIN IMMEDIATE (см. transaction_mode в settings),
+    в PostgreSQL записи к одному барберу сериализуются через SELECT ... FOR UPDATE.
+    Без барбера ("любой барбер") блокируются все активные барберы shop_id, по порядку pk.
+    """
+    with transaction.atomic():
+        if barber_id and str(barber_id).isdigit():
+            locked = Barber.objects.filter(pk=barber_id)
+        elif shop_id:
+            locked = Barber.objects.filter(shop_id=shop_id, is_active=True).order_by('pk')
+        else:
+            locked = None
+        if locked is not None:
+            list(locked.select_for_update().values_list('pk', flat=True))
+        yield
 
 def get_client_ip(request):
+    """
+    IP клиента для лимитов. За reverse proxy (nginx, Varnish, балансировщик Render) REMOTE_ADDR —
+    адрес прокси, поэтому при TRUSTED_PROXY_COUNT = N берём N-й адрес справа в X-Forwarded-For:
+    его дописал ближайший к клиенту доверенный прокси, всё левее клиент может подделать.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if proxies > 0:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
     return request.META.get('REMOTE_ADDR', 'unknown')
 
-
+def rate_limited(request, scope: str, limit: int = 3, window: int = 600) -> bool:
+    """
+    Простая защита: не больше `limit` запросов за `window` секунд на пользователя или IP.
+    """
+    # До AuthenticationMiddleware request.user ещё нет — считаем по IP
+    user = getattr(request, 'user', None)
+    ident = f"user:{user.id}" if user is not None and user.is_authenticated else f"ip:{get_client_ip(request)}"
+    key = f"rl:{scope}:{ident}"
+    added = cache.add(key, 0, timeout=window)
+    try:
+        current = cache.incr(key)
+    except ValueError:
+        current = cache.get(key, 0)
+    return current > limit
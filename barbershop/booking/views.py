@@ -3,66 +3,115 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages as dj_messages
 from django.urls import reverse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
-from django.views.decorators.http import require_GET, require_POST
+from django.http import HttpResponse, JsonResponse, Http404
+from django.views.decorators.http import require_GET, require_POST, require_safe, condition
+from django.views.decorators.cache import never_cache
+from django.utils.cache import patch_cache_control
+from django.middleware.csrf import get_token
+from django.db import connection, DatabaseError
 from django.db.models import Q
 import datetime
-from .models import Barber, Service, Booking, UserProfile, SiteContent
-from .forms import BookingForm, LoginForm, RegisterForm, ProfileForm
-from .utils import get_available_slots
+import json
+from .models import Barber, Service, Booking, ArchivedBooking, UserProfile, SiteContent, OutboxEvent
+from .forms import BookingForm, WaitlistForm, LoginForm, RegisterForm, ProfileForm
+from .utils import get_available_slots, booking_write, rate_limited
+from .search import any_barber_slots, available_days, earliest_slots, next_slots
+from .db_pool import pool_stats
+from . import auth, outbox, ics, operations, rollups, spam, transitions
+from .reference import get_active_barbers, get_services, get_site_content
+from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import gettext as _
-from django.core.cache import cache
+from .edge_cache import edge_cache, barber_key, home_key, slots_key
+from .db_router import read_replica
+from .idempotency import idempotent
+
+# Больше вариантов за раз в подборе ближайшего времени не отдаём
+NEXT_SLOTS_MAX = 20
+# Сколько записей по id можно сменить одним запросом персонала
+BULK_STATUS_MAX = 500
+
+def _barber_param(request):
+  # В Surrogate-Key попадает только число: пробел добавил бы чужой ключ, CRLF сломал бы заголовок
+  value = request.GET.get('barber', '')
+  return value if value.isascii() and value.isdigit() else None
+
+def _home_surrogate_keys(request):
+  keys = [home_key(request.shop.pk)]
+  barber_id = _barber_param(request)
+  if barber_id:
+    keys.append(barber_key(barber_id))
+  return keys
+
+def _slots_surrogate_keys(request):
+  keys = [slots_key(request.shop.pk)]
+  barber_id = _barber_param(request)
+  if barber_id:
+    keys.append(barber_key(barber_id))
+  elif not request.GET.get('barber'):
+    # "Любой барбер": ответ устаревает при записи к любому из них
+    keys.extend(barber_key(barber.pk) for barber in get_active_barbers(request.shop))
+  return keys
+
+def _parse_date(value):
+  try:
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+  except (ValueError, TypeError):
+    return None
 
-CANCEL_LIMIT_HOURS = 3
+def _requested(items, value):
+  # Поиск по закэшированному справочнику (get_active_barbers, get_services) без запроса к БД
+  return next((item for item in items if str(item.pk) == value), None)
 
-def _rate_limit(request, scope: str, limit: int = 3, window: int = 600) -> bool:
-  """
-  Простая защита: не больше `limit` запросов за `window` секунд на пользователя или IP.
-  """
-  ident = f"user:{request.user.id}" if request.user.is_authenticated else f"ip:{request.META.get('REMOTE_ADDR', 'unknown')}"
-  key = f"rl:{scope}:{ident}"
-  added = cache.add(key, 0, timeout=window)
+def _bounded_int(value, default, upper):
   try:
-    current = cache.incr(key)
-  except ValueError:
-    current = cache.get(key, 0)
-  return current > limit
+    return min(max(int(value), 1), upper)
+  except (TypeError, ValueError):
+    return default
 
+@edge_cache(_home_surrogate_keys)
 def home(request):
-  barbers = Barber.objects.filter(is_active=True)
-  services = Service.objects.all()
-  site_content = SiteContent.objects.first()
+  barbers = get_active_barbers(request.shop)
+  services = get_services(request.shop)
+  site_content = get_site_content(request.shop)
   available_slots = None
   selected_barber = None
   selected_date = None
 
-  # Определяем выбранные барбера и дату из GET/POST
-  selected_barber_id = request.POST.get('barber') if request.method == 'POST' else request.GET.get('barber')
-  selected_date_str = request.POST.get('booking_date') if request.method == 'POST' else request.GET.get('booking_date')
+  # Определяем выбранные барбера, дату и услугу из GET/POST
+  params = request.POST if request.method == 'POST' else request.GET
+  selected_barber_id = params.get('barber')
+  selected_date_str = params.get('booking_date')
+  selected_service = _requested(services, params.get('service'))
 
   if selected_barber_id and selected_date_str:
-    selected_barber = Barber.objects.filter(id=selected_barber_id, is_active=True).first()
+    selected_barber = _requested(barbers, selected_barber_id)
     try:
       selected_date = datetime.datetime.strptime(selected_date_str, '%Y-%m-%d').date()
     except (ValueError, TypeError):
       selected_date = None
 
     if selected_barber and selected_date:
-      available_slots = get_available_slots(selected_barber, selected_date)
+      available_slots = get_available_slots(selected_barber, selected_date, selected_service)
+  elif selected_date_str:
+    selected_date = _parse_date(selected_date_str)
+    if selected_date:
+      available_slots = any_barber_slots(request.shop, selected_date, selected_service)
 
   if request.method == 'POST':
-    if _rate_limit(request, 'home_booking', limit=3, window=600):
+    if rate_limited(request, 'home_booking', limit=3, window=600):
       dj_messages.error(request, _("Слишком много попыток. Попробуйте через 10 минут."))
       return redirect('home')
-    form = BookingForm(request.POST, available_slots=available_slots, user=request.user)
-    if form.is_valid():
-      booking = form.save(commit=False)
-      if request.user.is_authenticated:
-        booking.user = request.user
-      booking.save()
-      dj_messages.success(request, _("Запись создана, мы свяжемся с вами для подтверждения."))
-      return redirect('home')
+    form = BookingForm(request.POST, available_slots=available_slots, user=request.user, shop=request.shop)
+    with booking_write(selected_barber_id, shop_id=request.shop.pk):
+      if form.is_valid():
+        booking = form.save(commit=False)
+        if request.user.is_authenticated:
+          booking.user = request.user
+        booking.save()
+        outbox.record(OutboxEvent.EVENT_CREATED, booking)
+        dj_messages.success(request, _("Запись создана, мы свяжемся с вами для подтверждения."))
+        return redirect('home')
   else:
     initial = {}
     if selected_barber:
@@ -70,7 +119,7 @@ def home(request):
     if selected_date:
       initial['booking_date'] = selected_date
 
-    form = BookingForm(initial=initial, available_slots=available_slots, user=request.user)
+    form = BookingForm(initial=initial, available_slots=available_slots, user=request.user, shop=request.shop)
 
   context = {
     'barbers': barbers,
@@ -78,13 +127,14 @@ def home(request):
     'form': form,
     'available_slots': available_slots,
     'site_content': site_content,
+    'form_token': spam.form_token(),
   }
 
   return render(request, 'booking/home.html', context)
 
 def booking_create(request):
-  barbers = Barber.objects.filter(is_active=True)
-  services = Service.objects.all()
+  barbers = Barber.objects.filter(shop=request.shop, is_active=True)
+  services = Service.objects.filter(shop=request.shop)
 
   selected_barber = None
   selected_date = None
@@ -102,10 +152,10 @@ def booking_create(request):
 
     if barber_id and date_str and time_str and client_name and client_phone and service_id:
 
-      selected_barber = Barber.objects.get(id=barber_id)
+      selected_barber = Barber.objects.get(id=barber_id, shop=request.shop)
       selected_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
       selected_time = datetime.datetime.strptime(time_str, '%H:%M').time()
-      selected_service = Service.objects.get(id=service_id)
+      selected_service = Service.objects.get(id=service_id, shop=request.shop)
 
       if request.user.is_authenticated:
         conflict = Booking.objects.filter(
@@ -143,7 +193,7 @@ def booking_create(request):
     date_str = request.GET.get('booking_date')
 
     if barber_id and date_str:
-      selected_barber = Barber.objects.get(id=barber_id)
+      selected_barber = Barber.objects.get(id=barber_id, shop=request.shop)
       selected_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
       available_slots = get_available_slots(selected_barber, selected_date)
 
@@ -157,14 +207,23 @@ def booking_create(request):
   return render(request, 'booking/booking_form.html', context)
 
 @require_GET
+@read_replica()
+@edge_cache(_slots_surrogate_keys, anonymous_only=False)
 def available_slots_api(request):
   barber_id = request.GET.get('barber')
   date_str = request.GET.get('booking_date')
 
-  if not barber_id or not date_str:
+  if not date_str:
     return JsonResponse({"slots": []})
 
-  barber = Barber.objects.filter(id=barber_id, is_active=True).first()
+  # С услугой — только время, в которое она помещается целиком (как в earliest/next_slots_api)
+  service = _requested(get_services(request.shop), request.GET.get('service'))
+  if not barber_id:
+    selected_date = _parse_date(date_str)
+    slots = any_barber_slots(request.shop, selected_date, service) if selected_date else []
+    return JsonResponse({"slots": [t.strftime('%H:%M') for t in slots]})
+
+  barber = _requested(get_active_barbers(request.shop), barber_id)
   if not barber:
     return JsonResponse({"slots": []})
 
@@ -173,16 +232,132 @@ def available_slots_api(request):
   except (ValueError, TypeError):
     return JsonResponse({"slots": []})
 
-  slots = get_available_slots(barber, selected_date)
+  slots = get_available_slots(barber, selected_date, service)
   return JsonResponse({"slots": [t.strftime('%H:%M') for t in slots]})
 
 
+@require_GET
+@read_replica()
+@edge_cache(_slots_surrogate_keys, anonymous_only=False)
+def earliest_slots_api(request):
+  """
+  Ближайшее время для услуги у любого барбера: ?service=<id>&count=<N>[&from=YYYY-MM-DD].
+  """
+  service = _requested(get_services(request.shop), request.GET.get('service'))
+  if service is None:
+    return JsonResponse({"slots": []})
+  count = _bounded_int(request.GET.get('count'), 5, NEXT_SLOTS_MAX)
+
+  found = earliest_slots(request.shop, service, count, start=_parse_date(request.GET.get('from')))
+  return JsonResponse({"slots": [
+    {
+      "barber": barber.pk,
+      "barber_name": barber.name,
+      "date": date.isoformat(),
+      "time": time.strftime('%H:%M'),
+    }
+    for date, time, barber in found
+  ]})
+
+
+@require_GET
+@read_replica()
+@edge_cache(_slots_surrogate_keys, anonymous_only=False)
+def next_slots_api(request):
+  """
+  Ближайшие свободные слоты барбера начиная с даты: ?barber=&service=&count=<N>[&from=YYYY-MM-DD].
+  """
+  barber = _requested(get_active_barbers(request.shop), request.GET.get('barber'))
+  service = _requested(get_services(request.shop), request.GET.get('service'))
+  if barber is None or service is None:
+    return JsonResponse({"slots": []})
+  count = _bounded_int(request.GET.get('count'), 5, NEXT_SLOTS_MAX)
+
+  found = next_slots(barber, service, count, start=_parse_date(request.GET.get('from')))
+  return JsonResponse({"slots": [{"date": date.isoformat(), "time": time.strftime('%H:%M')} for date, time in found]})
+
+
+@require_GET
+@read_replica()
+@edge_cache(_slots_surrogate_keys, anonymous_only=False)
+def available_days_api(request):
+  """
+  Сводка для календаря: ?service=[&barber=][&from=YYYY-MM-DD][&days=<N>].
+  Ответ {"from": дата, "days": "0110..."} — i-й символ "1", если в from + i дней есть время.
+  Без barber — хотя бы у одного барбера филиала.
+  """
+  service = _requested(get_services(request.shop), request.GET.get('service'))
+  barbers = get_active_barbers(request.shop)
+  if request.GET.get('barber'):
+    barber = _requested(barbers, request.GET['barber'])
+    barbers = [barber] if barber else []
+  if service is None:
+    barbers = []
+  days = _bounded_int(request.GET.get('days'), settings.SLOT_SEARCH_DAYS, settings.SLOT_SEARCH_DAYS)
+
+  start, flags = available_days(barbers, service, start=_parse_date(request.GET.get('from')), days=days)
+  return JsonResponse({"from": start.isoformat(), "days": ''.join('1' if flag else '0' for flag in flags)})
+
+
+@never_cache
+@require_GET
+def csrf_token_api(request):
+  """
+  CSRF-токен и токен формы записи (booking/spam.py) для страниц, отданных из кэша прокси
+  без {% csrf_token %}.
+  """
+  return JsonResponse({"token": get_token(request), "form_token": spam.form_token()})
+
+
+@never_cache
+@require_GET
+def db_health(request):
+  """
+  Проверка БД для балансировщика и метрики пула соединений этого воркера.
+  """
+  try:
+    with connection.cursor() as cursor:
+      cursor.execute('SELECT 1')
+  except DatabaseError:
+    return JsonResponse({"ok": False, "pools": pool_stats()}, status=503)
+  return JsonResponse({"ok": True, "pools": pool_stats()})
+
+
+def _calendar_barber(request, barber_id):
+  if not hasattr(request, 'calendar_barber'):
+    valid = ics.check_key(barber_id, request.GET.get('key', ''))
+    request.calendar_barber = Barber.objects.filter(pk=barber_id).first() if valid else None
+  return request.calendar_barber
+
+def _calendar_etag(request, barber_id):
+  barber = _calendar_barber(request, barber_id)
+  request.calendar_etag = ics.feed_etag(barber) if barber else None
+  return request.calendar_etag
+
+@require_safe
+@read_replica()
+@condition(etag_func=_calendar_etag)
+def calendar_feed(request, barber_id):
+  """
+  ICS-фид записей барбера. На If-None-Match с текущим ETag отвечает 304 (см. booking/ics.py).
+  """
+  barber = _calendar_barber(request, barber_id)
+  if barber is None:
+    raise Http404
+  response = HttpResponse(ics.render_feed(barber, request.calendar_etag), content_type='text/calendar; charset=utf-8')
+  # Фид с данными клиентов: прокси не кэширует, клиент каждый раз сверяет ETag
+  patch_cache_control(response, private=True, no_cache=True)
+  return response
+
+
 @require_POST
+@idempotent('booking_api')
 def booking_api(request):
   """
-  AJAX бронирование без перезагрузки страницы.
+  AJAX бронирование без перезагрузки страницы. Повтор с тем же Idempotency-Key
+  получает сохранённый ответ (booking/idempotency.py).
   """
-  if _rate_limit(request, 'booking_api', limit=3, window=600):
+  if rate_limited(request, 'booking_api', limit=3, window=600):
     return JsonResponse({"ok": False, "errors": {"__all__": [_("Слишком много попыток. Попробуйте через 10 минут.")]}}, status=429)
   # Подготовим available_slots для валидации формы
   available_slots = None
@@ -190,55 +365,109 @@ def booking_api(request):
   date_str = request.POST.get('booking_date')
 
   if barber_id and date_str:
-    barber_obj = Barber.objects.filter(id=barber_id, is_active=True).first()
+    barber_obj = Barber.objects.filter(id=barber_id, shop=request.shop, is_active=True).first()
     try:
       selected_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
     except (ValueError, TypeError):
       selected_date = None
 
     if barber_obj and selected_date:
-      available_slots = get_available_slots(barber_obj, selected_date)
+      service = _requested(get_services(request.shop), request.POST.get('service'))
+      available_slots = get_available_slots(barber_obj, selected_date, service)
 
-  form = BookingForm(request.POST, available_slots=available_slots, user=request.user)
+  form = BookingForm(request.POST, available_slots=available_slots, user=request.user, shop=request.shop)
 
-  if form.is_valid():
-    booking = form.save(commit=False)
-    if request.user.is_authenticated:
-      booking.user = request.user
-    booking.save()
-    return JsonResponse({
-      "ok": True,
-      "message": _("Запись создана, мы свяжемся с вами для подтверждения."),
-      "id": booking.id,
-    })
+  with booking_write(barber_id, shop_id=request.shop.pk):
+    if form.is_valid():
+      booking = form.save(commit=False)
+      if request.user.is_authenticated:
+        booking.user = request.user
+      booking.save()
+      outbox.record(OutboxEvent.EVENT_CREATED, booking)
+      return JsonResponse({
+        "ok": True,
+        "message": _("Запись создана, мы свяжемся с вами для подтверждения."),
+        "id": booking.id,
+      })
 
   # Ошибки по полям и общие
   errors = {field: [str(err) for err in errs] for field, errs in form.errors.items()}
   return JsonResponse({"ok": False, "errors": errors}, status=400)
 
-def cancel_booking(request, booking_id):
-  booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+@require_POST
+def waitlist_api(request):
+  """
+  Запись в лист ожидания: сообщим, когда в выбранном окне освободится слот.
+  """
+  if rate_limited(request, 'waitlist_api', limit=3, window=600):
+    return JsonResponse({"ok": False, "errors": {"__all__": [_("Слишком много попыток. Попробуйте через 10 минут.")]}}, status=429)
+  form = WaitlistForm(request.POST, shop=request.shop)
+  if not form.is_valid():
+    errors = {field: [str(err) for err in errs] for field, errs in form.errors.items()}
+    return JsonResponse({"ok": False, "errors": errors}, status=400)
+  entry = form.save(commit=False)
+  entry.shop = request.shop
+  if request.user.is_authenticated:
+    entry.user = request.user
+  entry.save()
+  return JsonResponse({
+    "ok": True,
+    "message": _("Мы сообщим, когда освободится подходящее время."),
+    "id": entry.id,
+  })
 
-  # Нельзя отменять выполненную
-  if booking.status == Booking.STATUS_COMPLETED:
-    dj_messages.error(request, _('Вы не можете отменить выполненную запись.'))
-    return redirect('dashboard')
-  
-  appointment_dt = datetime.datetime.combine(booking.booking_date, booking.booking_time)
-  appointment_dt = timezone.make_aware(appointment_dt)
-  
-  if appointment_dt <= timezone.now():
-    dj_messages.error(request, _('Вы не можете отменить прошедшую запись.'))
-    return redirect('dashboard')
+@require_POST
+def staff_booking_status_api(request):
+  """
+  Массовая смена статуса для персонала. Тело JSON: {"status": "completed", "ids": [1, 2]}
+  или фильтр {"status": "completed", "date": "YYYY-MM-DD"[, "barber": id]}.
+  В ответе — итог по каждой записи.
+  """
+  if not request.user.is_authenticated or not request.user.is_staff:
+    return JsonResponse({"ok": False, "errors": {"__all__": [_("Недостаточно прав.")]}}, status=403)
+  try:
+    data = json.loads(request.body)
+  except ValueError:
+    data = None
+  if not isinstance(data, dict) or data.get('status') not in transitions.TRANSITIONS:
+    return JsonResponse({"ok": False, "errors": {"status": [_("Недопустимый статус.")]}}, status=400)
+
+  queryset = Booking.objects.filter(shop=request.shop)
+  ids = data.get('ids')
+  if ids is not None:
+    if not isinstance(ids, list) or len(ids) > BULK_STATUS_MAX or not all(type(pk) is int for pk in ids):
+      return JsonResponse({"ok": False, "errors": {"ids": [_("Передайте список id записей (не больше %(max)s).") % {'max': BULK_STATUS_MAX}]}}, status=400)
+    queryset = queryset.filter(pk__in=ids)
+  else:
+    booking_date = _parse_date(data.get('date'))
+    barber_id = data.get('barber')
+    if booking_date is None or (barber_id is not None and type(barber_id) is not int):
+      return JsonResponse({"ok": False, "errors": {"date": [_("Укажите дату или список записей.")]}}, status=400)
+    queryset = queryset.filter(booking_date=booking_date)
+    if barber_id is not None:
+      queryset = queryset.filter(barber_id=barber_id)
+
+  outcomes = transitions.apply(queryset, data['status'])
+  results = [
+    {"id": pk, "ok": outcome == transitions.OUTCOME_UPDATED, "status": status}
+    for pk, (outcome, status) in sorted(outcomes.items())
+  ]
+  if ids is not None:
+    results += [{"id": pk, "ok": False, "error": "not_found"} for pk in dict.fromkeys(ids) if pk not in outcomes]
+  return JsonResponse({
+    "ok": True,
+    "updated": sum(1 for result in results if result["ok"]),
+    "results": results,
+  })
 
-  diff = appointment_dt - timezone.now()
-  if diff< datetime.timedelta(hours=CANCEL_LIMIT_HOURS):
-    dj_messages.error(request, _('Отмена возможна минимум за %(hours)s часа до визита.') % {'hours': CANCEL_LIMIT_HOURS})
+def cancel_booking(request, booking_id):
+  booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+  try:
+    operations.cancel(booking)
+  except operations.OperationError as exc:
+    dj_messages.error(request, str(exc))
     return redirect('dashboard')
 
-  booking.status = Booking.STATUS_CANCELED
-  booking.save(update_fields=['status'])
-
   dj_messages.success(request, _('Запись успешно отменена. Мы будем рады видеть вас снова!'))
   return redirect('dashboard')
 
@@ -248,19 +477,10 @@ def reschedule_booking(request, booking_id):
   booking = get_object_or_404(Booking, id=booking_id, user=request.user)
 
   # Запреты
-  if booking.status in [Booking.STATUS_CANCELED, Booking.STATUS_COMPLETED, Booking.STATUS_NO_SHOW]:
-    dj_messages.error(request, _("Эту запись нельзя перенести."))
-    return redirect('dashboard')
-
-  appointment_dt = datetime.datetime.combine(booking.booking_date, booking.booking_time)
-  appointment_dt = timezone.make_aware(appointment_dt)
-
-  if appointment_dt <= timezone.now():
-    dj_messages.error(request, _("Прошедшую запись нельзя перенести."))
-    return redirect('dashboard')
-
-  if appointment_dt - timezone.now() < datetime.timedelta(hours=CANCEL_LIMIT_HOURS):
-    dj_messages.error(request, _("Перенос возможен минимум за %(hours)s часа до визита.") % {'hours': CANCEL_LIMIT_HOURS})
+  try:
+    operations.check_reschedule(booking)
+  except operations.OperationError as exc:
+    dj_messages.error(request, str(exc))
     return redirect('dashboard')
 
   # Выбор даты/барбера (барбер фиксирован — переносим к тому же)
@@ -271,7 +491,7 @@ def reschedule_booking(request, booking_id):
   if selected_date_str:
     try:
       selected_date = datetime.datetime.strptime(selected_date_str, '%Y-%m-%d').date()
-      available_slots = get_available_slots(booking.barber, selected_date)
+      available_slots = get_available_slots(booking.barber, selected_date, booking.service, exclude_id=booking.pk)
     except ValueError:
       selected_date = None
 
@@ -279,30 +499,16 @@ def reschedule_booking(request, booking_id):
     time_str = request.POST.get('booking_time')
     if selected_date and time_str:
       selected_time = datetime.datetime.strptime(time_str, '%H:%M').time()
-
-      # Проверим что слот реально свободен
-      if available_slots and selected_time in available_slots:
-        # Проверим, что нет другой активной записи пользователя в это же время
-        conflict = Booking.objects.filter(
-          user=request.user,
-          booking_date=selected_date,
-          booking_time=selected_time,
-          status__in=[Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED],
-        ).exclude(id=booking.id).exists()
-        if conflict:
-          dj_messages.error(request, _("У вас уже есть запись на это время."))
+      try:
+        operations.reschedule(booking, request.user, selected_date, selected_time)
+      except operations.OperationError as exc:
+        dj_messages.error(request, str(exc))
+        if exc.code != 'slot_taken':
           return redirect('dashboard')
-
-        booking.booking_date = selected_date
-        booking.booking_time = selected_time
-        booking.status = Booking.STATUS_PENDING  # после переноса снова "ожидает"
-        booking.save(update_fields=['booking_date', 'booking_time', 'status'])
-
+      else:
         dj_messages.success(request, _("Запись перенесена! Мы свяжемся для подтверждения."))
         return redirect('dashboard')
 
-      dj_messages.error(request, _("Этот слот уже занят. Выберите другое время."))
-
   context = {
     'booking': booking,
     'selected_date': selected_date,
@@ -314,7 +520,11 @@ def reschedule_booking(request, booking_id):
 
 @login_required
 def edit_profile(request):
-  profile, _ = UserProfile.objects.get_or_create(user=request.user)
+  # Профиль уже загружен вместе с пользователем (booking/auth.py); создаётся при первом сохранении
+  try:
+    profile = request.user.profile
+  except UserProfile.DoesNotExist:
+    profile = UserProfile(user=request.user)
 
   if request.method == 'POST':
     form = ProfileForm(request.POST, instance=profile, user=request.user)
@@ -331,10 +541,14 @@ def edit_profile(request):
 
 def register_view(request):
   if request.method == 'POST':
+    if rate_limited(request, 'register', limit=settings.REGISTER_IP_LIMIT, window=3600):
+      raise auth.Throttled(retry_after=3600)
     form = RegisterForm(request.POST)
     if form.is_valid():
-      user = form.save()
-      auth_login(request, user)
+      # Хэширование пароля — под общим ограничением с входом (booking/auth.py)
+      with auth.hashing_slot():
+        user = form.save()
+      auth_login(request, user, backend='booking.auth.ProfileBackend')
       return redirect('dashboard')
   else:
     form = RegisterForm()
@@ -357,6 +571,7 @@ def logout_view(request):
 
 
 @login_required
+@read_replica()
 def dashboard_view(request):
   now = timezone.localtime()
   today = now.date()
@@ -373,8 +588,11 @@ def dashboard_view(request):
     Q(booking_date__lt=today) |
     Q(booking_date=today, booking_time__lt=current_time)
   )
-  if missed_qs.exists():
-    missed_qs.update(status=Booking.STATUS_NO_SHOW)
+  missed_keys = set(missed_qs.values_list('booking_date', 'barber_id', 'service_id'))
+  if missed_keys:
+    # После записи остаток запроса читается с primary (см. db_router)
+    missed_qs.update(status=Booking.STATUS_NO_SHOW, updated_at=timezone.now())
+    rollups.refresh(missed_keys)
 
   upcoming_bookings = base_qs.filter(
     Q(booking_date__gt=today) |
@@ -382,11 +600,17 @@ def dashboard_view(request):
   ).exclude(status__in=[Booking.STATUS_CANCELED, Booking.STATUS_COMPLETED, Booking.STATUS_NO_SHOW]) \
    .order_by('booking_date', 'booking_time')
 
-  past_bookings = base_qs.exclude(
-    id__in=upcoming_bookings.values('id')
-  ).order_by('-booking_date', '-booking_time')
+  # Старые визиты лежат в архиве (manage.py archive_bookings) — показываем их вместе с остальными
+  archived_bookings = list(
+    ArchivedBooking.objects.filter(user=request.user).select_related('barber', 'service')
+  )
+  past_bookings = sorted(
+    [*base_qs.exclude(id__in=upcoming_bookings.values('id')), *archived_bookings],
+    key=lambda b: (b.booking_date, b.booking_time),
+    reverse=True,
+  )
 
-  bookings = base_qs.order_by('-booking_date', '-booking_time')
+  bookings = sorted([*base_qs, *archived_bookings], key=lambda b: (b.booking_date, b.booking_time), reverse=True)
 
   context = {
     'bookings': bookings,
@@ -0,0 +1,111 @@
+"""
+Лист ожидания: при освобождении слота (отмена, перенос) подбираем заявки и ставим
+уведомления в outbox — в транзакции отмены запрос свободных слотов барбера,
+один индексный запрос заявок и вставка.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEvent, WaitlistEntry
+from .utils import BASE_SLOT_MINUTES, get_available_slots
+
+
+def _staff_telegram():
+  return bool(settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_STAFF_CHAT_ID)
+
+
+def _channels(entry):
+  channels = [OutboxEvent.CHANNEL_EMAIL] if entry.client_email else []
+  # Без email клиенту звонит администратор — ему сообщение уходит в Telegram
+  if _staff_telegram():
+    channels.append(OutboxEvent.CHANNEL_TELEGRAM)
+  return channels
+
+
+def _free_minutes(barber, date, time):
+  """Сколько минут подряд свободно у барбера начиная с time (с учётом графика и других записей)."""
+  free = set(get_available_slots(barber, date))
+  step = datetime.timedelta(minutes=BASE_SLOT_MINUTES)
+  current = datetime.datetime.combine(date, time)
+  while current.date() == date and current.time() in free:
+    current += step
+  return int((current - datetime.datetime.combine(date, time)).total_seconds() // 60)
+
+
+def match(shop_id, barber_id, date, time, limit, max_minutes):
+  """
+  Активные заявки, которым подходит слот, в порядке очереди: время начала в окне заявки
+  и услуга не длиннее max_minutes свободного времени. Строки блокируются,
+  чтобы параллельная отмена не уведомила тех же людей второй раз.
+  """
+  queryset = WaitlistEntry.objects.select_for_update(skip_locked=True, of=('self',))
+  if not _staff_telegram():
+    # Уведомить можно только по email — заявки без него не занимают места в лимите
+    queryset = queryset.exclude(client_email='')
+  return list(
+    queryset
+    .filter(
+      shop_id=shop_id,
+      status=WaitlistEntry.STATUS_ACTIVE,
+      date_to__gte=date,
+      date_from__lte=date,
+      time_from__lte=time,
+      time_to__gte=time,
+      service__duration_minutes__lte=max_minutes,
+    )
+    .filter(Q(barber_id=barber_id) | Q(barber__isnull=True))
+    .select_related('service')
+    .order_by('created_at', 'id')[:limit]
+  )
+
+
+def slot_freed(booking, date=None, time=None):
+  """
+  Слот барбера booking освободился (по умолчанию — время самой брони, при переносе —
+  прежнее). Вызывать внутри транзакции, которая освобождает слот. Возвращает число уведомлений.
+  """
+  date = date or booking.booking_date
+  time = time or booking.booking_time
+  if timezone.make_aware(datetime.datetime.combine(date, time)) <= timezone.now():
+    return 0
+
+  # Заявке на длинную услугу освободившийся короткий промежуток не подходит:
+  # BookingForm.clean такую запись не примет, а заявка ушла бы из очереди
+  max_minutes = _free_minutes(booking.barber, date, time)
+  if not max_minutes:
+    return 0
+  entries = match(booking.shop_id, booking.barber_id, date, time, settings.WAITLIST_NOTIFY_LIMIT, max_minutes)
+  if not entries:
+    return 0
+
+  events = []
+  notified = []
+  for entry in entries:
+    channels = _channels(entry)
+    if not channels:
+      continue
+    notified.append(entry.id)
+    payload = {
+      'waitlist_id': entry.id,
+      'client_name': entry.client_name,
+      'client_phone': entry.client_phone,
+      'client_email': entry.client_email,
+      'barber': booking.barber.name,
+      'service': entry.service.name,
+      'booking_date': date.isoformat(),
+      'booking_time': time.strftime('%H:%M'),
+    }
+    events.extend(
+      OutboxEvent(event_type=OutboxEvent.EVENT_SLOT_FREED, channel=channel, payload=payload)
+      for channel in channels
+    )
+  # В очереди остаются только заявки, которым ничего не ушло
+  OutboxEvent.objects.bulk_create(events)
+  WaitlistEntry.objects.filter(id__in=notified).update(
+    status=WaitlistEntry.STATUS_NOTIFIED,
+    notified_at=timezone.now(),
+  )
+  return len(notified)
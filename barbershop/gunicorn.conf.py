@@ -0,0 +1,37 @@
+# Конфигурация Gunicorn подхватывается автоматически при запуске из этой папки.
+import os
+import time
+
+_started = time.perf_counter()
+
+wsgi_app = 'barbershop.wsgi:application'
+
+# Django импортируется и прогревается один раз в мастере, воркеры получают его через fork
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+os.environ.setdefault('DJANGO_STARTUP_WARM_UP', 'True')
+
+# Один процесс с потоками: счётчики неудачных входов (LocMemCache) общие для всех запросов,
+# а лимит одновременных хэширований AUTH_HASH_CONCURRENCY меньше числа потоков — пока
+# часть потоков считает PBKDF2, остальные обслуживают страницы записи (см. booking/auth.py)
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+
+def when_ready(server):
+    from django.conf import settings
+    if settings.AUTH_HASH_CONCURRENCY >= threads:
+        server.log.warning(
+            "AUTH_HASH_CONCURRENCY=%s leaves no threads for other requests (threads=%s)",
+            settings.AUTH_HASH_CONCURRENCY, threads,
+        )
+    if workers > 1:
+        server.log.warning("Login throttle counters are per worker: effective limits are %s times higher", workers)
+    server.log.info("Master ready in %.0f ms", (time.perf_counter() - _started) * 1000)
+
+
+def post_worker_init(worker):
+    # Соединения с БД и справочники открываем после fork, до первого запроса
+    from booking.startup import warm_up_worker
+    elapsed_ms = warm_up_worker()
+    worker.log.info("Worker %s warmed up in %.0f ms", worker.pid, elapsed_ms)